@@ -0,0 +1,151 @@
+import io
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc
+import pyarrow.parquet as pq
+import plotly.graph_objects as go
+
+from forecast_cache import ModelUnavailable
+from src.series_store import FORECAST_SERIES_FILE, SeriesStore, group_series
+
+# Response formats of the batch endpoint and their media types
+FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+
+class UnknownSeries(Exception):
+    def __init__(self, keys):
+        super().__init__(', '.join(f"{zas} / {polluant}" for zas, polluant in keys))
+        self.keys = keys
+
+
+# Per-series forecasts written by the DAG's forecast_all_series task (src/forecasting.py): the
+# forecasts.bin series store next to forecasts.parquet, memory-mapped so that every worker reads
+# the same pages, or forecasts.parquet itself (zas, polluant, date, forecast) loaded into an
+# in-memory store when there is no forecasts.bin. The file is reopened when it is replaced
+# (checked with a stat per call).
+class ForecastTable:
+    def __init__(self, path):
+        self.path = path
+        self.store_path = os.path.join(os.path.dirname(path), FORECAST_SERIES_FILE)
+        self._lock = threading.Lock()
+        self._version = None
+        self._series = None
+
+    # SeriesStore keyed by (zas, polluant)
+    def series(self):
+        for path in (self.store_path, self.path):
+            try:
+                stat = os.stat(path)
+                break
+            except OSError:
+                continue
+        else:
+            raise ModelUnavailable(f"No forecasts published yet ({self.path})")
+        version = (path, stat.st_mtime_ns, stat.st_size)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._series = SeriesStore.open(path) if path == self.store_path else _load_series(path)
+                    self._version = version
+        return self._series
+
+    # Resolves the queries (dicts with zas, polluant and optional horizon, start, end) to a list
+    # of (query, dates, values). Raises UnknownSeries listing every series that has no forecast.
+    def select(self, queries):
+        series = self.series()
+        missing = [(query['zas'], query['polluant']) for query in queries if (query['zas'], query['polluant']) not in series]
+        if missing:
+            raise UnknownSeries(sorted(set(missing)))
+
+        results = []
+        for query in queries:
+            dates, values = series.get((query['zas'], query['polluant']), start=query.get('start'), end=query.get('end'))
+            dates = dates.astype('datetime64[ns]')
+            if query.get('horizon') is not None:
+                dates, values = dates[:query['horizon']], values[:query['horizon']]
+            results.append((query, dates, values))
+        return results
+
+
+def _load_series(path):
+    df = pq.read_table(path, columns=['zas', 'polluant', 'date', 'forecast']).to_pandas()
+    return SeriesStore.from_series(group_series(df, ['zas', 'polluant'], 'date', 'forecast'), ['zas', 'polluant'])
+
+
+# Serializes the selected forecasts. chart=True adds a Plotly figure per query (JSON only):
+# programmatic consumers do not pay for the figure serialization.
+def encode(results, fmt='json', chart=False):
+    if fmt == 'json':
+        return _to_json(results, chart)
+    if chart:
+        raise ValueError("Charts are only available with format=json")
+    if fmt == 'ndjson':
+        return _to_ndjson(results)
+    if fmt == 'arrow':
+        return _to_arrow(results)
+    raise ValueError(f"Unknown format: {fmt}")
+
+
+def _to_json(results, chart):
+    items = []
+    for query, dates, values in results:
+        item = (f'{{"zas":{json.dumps(query["zas"])},"polluant":{json.dumps(query["polluant"])},'
+                f'"dates":{json.dumps(_iso_dates(dates), separators=(",", ":"))},"values":[{",".join(_json_numbers(values))}]')
+        if chart:
+            item += f',"chart":{forecast_chart(query, dates, values)}'
+        items.append(item + '}')
+    return f'{{"forecasts":[{",".join(items)}]}}'.encode('utf-8')
+
+
+def _to_ndjson(results):
+    lines = []
+    for index, (query, dates, values) in enumerate(results):
+        prefix = f'{{"query":{index},"zas":{json.dumps(query["zas"])},"polluant":{json.dumps(query["polluant"])},"date":"'
+        lines.extend(f'{prefix}{date}","forecast":{value}}}\n' for date, value in zip(_iso_dates(dates), _json_numbers(values)))
+    return ''.join(lines).encode('utf-8')
+
+
+# One Arrow IPC stream: query index, dictionary-encoded keys, timestamps and float32 values
+def _to_arrow(results):
+    lengths = [len(dates) for _, dates, _ in results]
+    table = pa.table({
+        'query': pa.array(np.repeat(np.arange(len(results), dtype=np.int32), lengths)),
+        'zas': pa.array(np.repeat([query['zas'] for query, _, _ in results], lengths).astype(object), pa.string())
+        .dictionary_encode(),
+        'polluant': pa.array(np.repeat([query['polluant'] for query, _, _ in results], lengths).astype(object),
+                             pa.string()).dictionary_encode(),
+        'date': pa.array(np.concatenate([dates for _, dates, _ in results]), pa.timestamp('ns')),
+        'forecast': pa.array(np.concatenate([values for _, _, values in results]), pa.float32()),
+    })
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def forecast_chart(query, dates, values):
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=pd.DatetimeIndex(dates), y=values, mode='lines+markers', name='Forecast'))
+    fig.update_layout(title=f"{query['zas']} - {query['polluant']} forecast", xaxis_title='Date',
+                      yaxis_title='Concentration')
+    return fig.to_json()
+
+
+def _iso_dates(dates):
+    return np.datetime_as_string(dates, unit='D').tolist()
+
+
+# Shortest float32 representation of each value; non-finite values become null
+def _json_numbers(values):
+    text = values.astype(str)
+    text[~np.isfinite(values)] = 'null'
+    return text.tolist()
@@ -0,0 +1,258 @@
+import json
+import os
+import threading
+import time
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from src.compact_model import load_forecaster
+from src.model_output import OUTPUT_KEYS, loads, output_series
+from src.registry import ModelRegistry
+from src.series_store import MODEL_SERIES_FILE, SeriesStore
+
+# option -> number of forecast days: 1 day, 2 days, 4 days and 7 days
+OPTIONS = {1: 1, 2: 2, 3: 4, 4: 7}
+
+COMPACT_MODEL_FILE = 'forecaster.npz'
+
+
+class ModelUnavailable(Exception):
+    pass
+
+
+# Model and metrics as two plain files (the image's model/model.pkl and the shared metrics.json);
+# the model is a pickled statsmodels results or a compact .npz export (src/compact_model.py).
+# version() is a cheap stat that changes whenever load() would return something else.
+# load() returns the model, the parsed metrics and the output series (src.series_store), here
+# built in memory from the metrics.
+class FileSource:
+    def __init__(self, model_path, metrics_path):
+        self.model_path = model_path
+        self.metrics_path = metrics_path
+
+    def version(self):
+        model_version = _file_version(self.model_path)
+        if model_version is None:
+            return None
+        return ('file', model_version, _file_version(self.metrics_path))
+
+    def load(self, version):
+        metrics = load_metrics(self.metrics_path)
+        return load_forecaster(self.model_path), metrics, metrics_series(metrics)
+
+    def describe(self, version):
+        return {'source': 'file', 'model_path': self.model_path}
+
+
+# Current version of the model registry published by the DAG (src/registry.py); versions are
+# immutable, so CURRENT is the only file read to detect a new one. Checksums are verified
+# before loading, and the compact forecaster.npz is served when the version has one (it loads
+# in milliseconds, without statsmodels) rather than the pickled model.pkl, and the output series
+# are memory-mapped from series.bin when the version has one: the workers share its pages.
+# Falls back to another source while the registry has no version.
+class RegistrySource:
+    def __init__(self, registry, fallback=None):
+        self.registry = registry
+        self.fallback = fallback
+
+    def version(self):
+        current = self.registry.current_version()
+        if current is None:
+            return self.fallback.version() if self.fallback is not None else None
+        return ('registry', current)
+
+    def load(self, version):
+        if version[0] != 'registry':
+            return self.fallback.load(version)
+        files = self.registry.verify(version[1])['files']
+        name = COMPACT_MODEL_FILE if COMPACT_MODEL_FILE in files else 'model.pkl'
+        model = load_forecaster(self.registry.path(version[1], name))
+        metrics = load_metrics(self.registry.path(version[1], 'metrics.json'))
+        if MODEL_SERIES_FILE in files:
+            series = SeriesStore.open(self.registry.path(version[1], MODEL_SERIES_FILE))
+        else:
+            series = metrics_series(metrics)
+        return model, metrics, series
+
+    def describe(self, version):
+        if version[0] != 'registry':
+            return self.fallback.describe(version)
+        return {'source': 'registry', 'version': version[1], **self.registry.manifest(version[1])['metadata']}
+
+
+# Everything served for one model version; replaced as a whole, never modified in place.
+# The parsed metrics are only needed to render the responses and are not kept: the history is
+# served from the series.
+class ServedModel:
+    def __init__(self, key, model, series, responses, info):
+        self.key = key
+        self.model = model
+        self.series = series
+        self.responses = responses
+        self.info = info
+        self.loaded_at = time.time()
+
+
+# Ready-to-send /forecast/ responses for every option, built once per model version.
+#
+# A background thread (start()) polls the source every check_interval seconds. A new version
+# (or a new day, since forecasts start tomorrow) is loaded, validated and fully rendered off the
+# request path, then swapped in with a single reference assignment: requests keep being served
+# by the previous version until then and never wait for a load. A version that fails to load or
+# validate is rejected once and the previous one stays in service.
+# Without the background thread, get() checks and rebuilds inline at most every check_interval.
+class ForecastCache:
+    def __init__(self, source, check_interval=1.0):
+        self.source = source
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._served = None
+        self._rejected = {}
+        self._checked_at = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def served(self):
+        return self._served
+
+    @property
+    def model(self):
+        return self._served.model if self._served is not None else None
+
+    @property
+    def series(self):
+        return self._served.series if self._served is not None else None
+
+    def get(self, option):
+        body = self.cached(option)
+        if body is None:
+            self._refresh_for_request()
+            body = self._served.responses[option]
+        return body
+
+    # Response for option when it can be sent without any load or check, None otherwise
+    def cached(self, option):
+        served = self._served
+        if served is None or (self._thread is None and time.monotonic() - self._checked_at >= self.check_interval):
+            return None
+        return served.responses[option]
+
+    def _refresh_for_request(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            if self._served is None:
+                raise
+            print(f"Forecast cache refresh failed, serving the previous version: {type(e).__name__}: {e}")
+
+    # Loads and swaps in the source's current version if it changed; returns True if it did
+    def refresh(self):
+        with self._lock:
+            self._checked_at = time.monotonic()
+            version = self.source.version()
+            if version is None:
+                if self._served is None:
+                    raise ModelUnavailable("No model published yet")
+                return False
+            key = (version, date.today())
+            if self._served is not None and self._served.key == key:
+                return False
+            if key in self._rejected:
+                return False
+
+            start = time.perf_counter()
+            try:
+                model, metrics, series = self.source.load(version)
+                responses = {option: build_response(model, metrics, option) for option in OPTIONS}
+                info = self.source.describe(version)
+            except Exception as e:
+                self._rejected[key] = f"{type(e).__name__}: {e}"
+                print(f"Model version {version} rejected: {self._rejected[key]}")
+                if self._served is None:
+                    raise
+                return False
+            self._served = ServedModel(key, model, series, responses, info)
+            print(f"Serving model version {version} (loaded and validated in {time.perf_counter() - start:.2f}s)")
+            return True
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name='forecast-cache-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _watch(self):
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Forecast cache watcher: {type(e).__name__}: {e}")
+
+
+def default_source(registry_path, model_path, metrics_path):
+    return RegistrySource(ModelRegistry(registry_path), fallback=FileSource(model_path, metrics_path))
+
+
+def _file_version(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+# Parsed with orjson when it is installed (src.model_output)
+def load_metrics(metrics_path):
+    with open(metrics_path, 'rb') as file:
+        return loads(file.read())
+
+
+# Published metrics without the output series ('series', or 'data' in the former layout), in the
+# same (output, metrics) shape: [{"metrics": {...}}, {...}]
+def without_series(metrics):
+    if isinstance(metrics, list):
+        return [without_series(item) for item in metrics]
+    if isinstance(metrics, dict):
+        return {name: value for name, value in metrics.items() if name not in ('series', 'data')}
+    return metrics
+
+
+# Series of a parsed output (versions published without series.bin), as a SeriesStore in memory
+def metrics_series(metrics):
+    return SeriesStore.from_series(output_series(metrics), OUTPUT_KEYS)
+
+
+# Same payload as the former handler, serialized once: the Plotly JSON is embedded as is
+# instead of being parsed back into Python objects and re-encoded on every request. The metrics
+# are embedded without their series: the history is served by /history/, filtered and downsampled.
+# Raises ValueError when the model does not produce finite forecasts (validation of a new version).
+def build_response(model, metrics, option):
+    forecast_days = OPTIONS[option]
+
+    # Use the loaded model to forecast
+    forecast_index = pd.date_range(start=datetime.now(), periods=forecast_days + 1, freq='D')[1:]  # Start forecasting from tomorrow
+    forecast_values = model.get_forecast(steps=forecast_days).predicted_mean
+    if len(forecast_values) != forecast_days or not np.all(np.isfinite(np.asarray(forecast_values, dtype=float))):
+        raise ValueError(f"model does not produce {forecast_days} finite forecast values")
+
+    # Plotly chart
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=forecast_index, y=forecast_values, mode='lines+markers', name='Forecast'))
+    fig.update_layout(title='Air Quality Forecast', xaxis_title='Date', yaxis_title='Air Quality Index')
+
+    # Same encoding as FastAPI's JSONResponse
+    metrics_json = json.dumps(without_series(metrics), ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+    body = f'{{"option":{option},"metrics":{metrics_json},"forecast_chart":{fig.to_json()}}}'
+    return body.encode('utf-8')
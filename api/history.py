@@ -0,0 +1,146 @@
+import io
+import json
+import threading
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc
+
+from forecast_cache import metrics_series
+from src.model_output import SERIES_TYPES
+
+# Series written by run_model_and_forecast
+TYPES = SERIES_TYPES
+METHODS = ('lttb', 'minmax', 'none')
+
+
+# History published with a model version, over its series store (src.series_store): the
+# memory-mapped series.bin of the version, or the series of metrics.json held in memory. A date
+# range is an offset into the series' daily float32 values, only the requested slice is read.
+class HistoryIndex:
+    def __init__(self, store):
+        self.store = store
+
+    @classmethod
+    def from_metrics(cls, metrics):
+        return cls(metrics_series(metrics))
+
+    # {type: (dates, values)} between start and end (inclusive), without missing days, each series
+    # reduced to at most `points` points with method (lttb, minmax or none)
+    def query(self, start=None, end=None, types=TYPES, points=None, method='lttb'):
+        result = {}
+        for row_type in types:
+            if (row_type,) not in self.store:
+                result[row_type] = (np.array([], dtype='datetime64[D]'), np.array([], dtype=float))
+                continue
+            dates, values = self.store.get((row_type,), start=start, end=end)
+            finite = np.isfinite(values)
+            dates, values = dates[finite], values[finite]
+            if points and method != 'none' and len(dates) > points:
+                keep = lttb(values.astype(float), points) if method == 'lttb' else minmax(values, points)
+                dates, values = dates[keep], values[keep]
+            result[row_type] = (dates, _widen(values))
+        return result
+
+
+# HistoryIndex of the version being served, replaced when the forecast cache swaps versions.
+# Encoded responses are kept per version (up to max_responses, then started over): the dashboard
+# asks for the same few ranges again and again.
+class HistoryCache:
+    def __init__(self, forecast_cache, max_responses=256):
+        self.forecast_cache = forecast_cache
+        self.max_responses = max_responses
+        self._lock = threading.Lock()
+        self._served = None
+        self._index = None
+        self._responses = {}
+
+    def index(self):
+        served = self.forecast_cache.served
+        if served is None:
+            return None
+        with self._lock:
+            if self._served is not served:
+                self._index = HistoryIndex(served.series)
+                self._responses = {}
+                self._served = served
+            return self._index
+
+    # Encoded response (json or arrow) for a query, or None when no model is loaded
+    def response(self, start=None, end=None, types=TYPES, points=None, method='lttb', fmt='json'):
+        index = self.index()
+        if index is None:
+            return None
+        key = (start, end, types, points, method, fmt)
+        responses = self._responses
+        body = responses.get(key)
+        if body is None:
+            result = index.query(start=start, end=end, types=types, points=points, method=method)
+            body = encode_arrow(result) if fmt == 'arrow' else encode_json(result)
+            if len(responses) >= self.max_responses:
+                responses.clear()
+            responses[key] = body
+        return body
+
+
+# Largest-Triangle-Three-Buckets: positions of `points` values that keep the visual shape of the
+# series (first and last kept, one point per bucket maximising the triangle with its neighbours)
+def lttb(values, points):
+    n = len(values)
+    if points >= n:
+        return np.arange(n)
+    if points < 3:
+        return np.linspace(0, n - 1, max(points, 1)).astype(int)
+    x = np.arange(n, dtype=float)
+    edges = np.linspace(1, n - 1, points - 1).astype(int)
+    keep = np.empty(points, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    selected = 0
+    for bucket in range(points - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        # Average of the next bucket (the last point for the last bucket)
+        next_lo, next_hi = hi, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x, next_y = x[next_lo:next_hi].mean(), values[next_lo:next_hi].mean()
+        area = np.abs((x[selected] - next_x) * (values[lo:hi] - values[selected])
+                      - (x[selected] - x[lo:hi]) * (next_y - values[selected]))
+        selected = lo + int(np.argmax(area))
+        keep[bucket + 1] = selected
+    return keep
+
+
+# Min and max of each bucket (points // 2 buckets), in date order: keeps the peaks
+def minmax(values, points):
+    n = len(values)
+    if n <= points:
+        return np.arange(n)
+    buckets = max(points // 2, 1)
+    edges = np.linspace(0, n, buckets + 1).astype(int)
+    starts, counts = edges[:-1], np.diff(edges)
+    # Positions sorted by bucket, then by value: the first and last of each bucket are its min and max
+    order = np.lexsort((values, np.repeat(np.arange(buckets), counts)))
+    return np.unique(np.concatenate([order[starts], order[starts + counts - 1]]))
+
+
+# float32 values as float64 through their shortest decimal form (12.3, not 12.300000190734863)
+def _widen(values):
+    return values.astype(str).astype(float)
+
+
+def encode_json(result):
+    series = {row_type: {'dates': np.datetime_as_string(dates, unit='D').tolist(), 'values': values.tolist()}
+              for row_type, (dates, values) in result.items()}
+    return json.dumps({'series': series}, separators=(',', ':')).encode('utf-8')
+
+
+# One Arrow IPC stream: type (dictionary-encoded), date, value
+def encode_arrow(result):
+    lengths = [len(dates) for dates, _ in result.values()]
+    table = pa.table({
+        'type': pa.array(np.repeat(list(result), lengths).astype(object), pa.string()).dictionary_encode(),
+        'date': pa.array(np.concatenate([dates for dates, _ in result.values()]) if result else [], pa.date32()),
+        'value': pa.array(np.concatenate([values for _, values in result.values()]) if result else [], pa.float64()),
+    })
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
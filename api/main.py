@@ -1,49 +1,193 @@
-from fastapi import FastAPI, HTTPException
-import joblib
-from datetime import datetime
-import pandas as pd
-import plotly.graph_objects as go
-import json
+from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+from datetime import date
+from typing import List, Optional
+import os
+
+from forecast_cache import OPTIONS, ForecastCache, ModelUnavailable, default_source
+from forecast_batch import FORMATS, ForecastTable, UnknownSeries, encode
+from serving import ComputePool, Overloaded
+from history import METHODS, TYPES, HistoryCache
+from observations import FREQUENCIES, GROUPS, ObservationCache
+from src import instrumentation
+from src.instrumentation import span
 
 app = FastAPI()
 
-# Load the ARIMA model
-model = joblib.load('model/model.pkl')
+# Versioned model registry published by the Airflow DAG; until it has a version, the model
+# baked in the image and the shared metrics file are served
+REGISTRY_PATH = os.environ.get('REGISTRY_PATH', '/app/model/registry')
+MODEL_PATH = os.environ.get('MODEL_PATH', 'model/model.pkl')
+METRICS_PATH = os.environ.get('METRICS_PATH', '/app/model/metrics.json')
+# Per-series forecasts of every zone, written by the DAG's forecast_all_series task
+FORECASTS_PATH = os.environ.get('FORECASTS_PATH', '/app/model/forecasts/forecasts.parquet')
+# All-zones Parquet store of the DAG (ZAS_dataset), mounted read-only
+OBSERVATIONS_PATH = os.environ.get('OBSERVATIONS_PATH', '/app/data/ZAS_dataset')
+# Seconds between two checks for a new model version
+RELOAD_INTERVAL = float(os.environ.get('MODEL_RELOAD_INTERVAL', '5'))
+# Threads for blocking work, and distinct computations allowed in flight before answering 503
+COMPUTE_WORKERS = int(os.environ.get('API_COMPUTE_WORKERS', '4'))
+MAX_PENDING = int(os.environ.get('API_MAX_PENDING', '64'))
+# Request latency of /forecast/, served at /metrics; GAZ_METRICS_DIR also logs every request to spans.jsonl
+if os.environ.get('API_METRICS', '0') == '1' and not instrumentation.enabled():
+    instrumentation.configure()
+
+# Responses for the four options, rebuilt in the background when a new version is published
+forecast_cache = ForecastCache(default_source(REGISTRY_PATH, MODEL_PATH, METRICS_PATH), check_interval=RELOAD_INTERVAL)
+
+forecast_table = ForecastTable(FORECASTS_PATH)
+
+# History published with the served model version, as columnar arrays
+history_cache = HistoryCache(forecast_cache)
 
-# Load metrics from a JSON file
-def load_metrics():
-    with open('/app/model/metrics.json', 'r') as file:
-        metrics = json.load(file)
-    return metrics
+# Aggregates of the observed concentrations, read from the store's daily rollups
+observation_cache = ObservationCache(OBSERVATIONS_PATH)
+
+# Handlers stay on the event loop only for what is already in memory; everything else goes through the pool
+compute_pool = ComputePool(workers=COMPUTE_WORKERS, max_pending=MAX_PENDING)
+
+@app.on_event("startup")
+def start_forecast_cache():
+    try:
+        forecast_cache.refresh()
+    except Exception as e:
+        print(f"Forecast cache not built at startup: {e}")
+    forecast_cache.start()
+
+@app.on_event("shutdown")
+def stop_forecast_cache():
+    forecast_cache.stop()
+    compute_pool.shutdown()
 
 @app.get("/forecast/")
 async def forecast(option: int):
-    if option not in [1, 2, 3, 4]:
+    if option not in OPTIONS:
         raise HTTPException(status_code=400, detail="Invalid option provided")
 
-    # Map option to days: 1 day, 2 days, 4 days, and 7 days
-    forecast_days = [1, 2, 4, 7][option - 1]
+    # Concurrent requests share the process: only the latency and the path taken are recorded
+    with span('forecast_request', resources=False, option=option) as s:
+        # Fast path: the prebuilt response; a load or check (no model yet, inline mode) runs in the
+        # pool, once for all the requests waiting on it
+        body = forecast_cache.cached(option)
+        if body is None:
+            s.add(computed=1)
+            try:
+                body = await compute_pool.run(('forecast', option), forecast_cache.get, option)
+            except (ModelUnavailable, FileNotFoundError, Overloaded) as e:
+                raise HTTPException(status_code=503, detail=str(e))
+        s.add(bytes_written=len(body))
+
+    return Response(content=body, media_type="application/json")
+
+# Stage and request metrics of this process in the Prometheus text format (API_METRICS=1)
+@app.get("/metrics")
+async def metrics():
+    if not instrumentation.enabled():
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(instrumentation.live_stats.render(), media_type="text/plain; version=0.0.4")
+
+# Model version currently served
+@app.get("/model/")
+async def model_version():
+    served = forecast_cache.served
+    if served is None:
+        raise HTTPException(status_code=503, detail="No model loaded")
+    return {"loaded_at": served.loaded_at, **served.info}
+
+# One query per series; without horizon nor dates, every forecast day is returned
+class SeriesQuery(BaseModel):
+    zas: str
+    polluant: str
+    horizon: Optional[int] = Field(None, ge=1)
+    start: Optional[date] = None
+    end: Optional[date] = None
+
+class BatchRequest(BaseModel):
+    queries: List[SeriesQuery] = Field(..., min_length=1, max_length=1000)
+
+# Many (zone, pollutant, horizon) queries in one request, as JSON, NDJSON (one line per forecast
+# day) or an Arrow IPC stream. Plotly charts are only rendered with chart=true (JSON only).
+@app.post("/forecast/batch")
+async def forecast_batch(request: BatchRequest, format: str = 'json', chart: bool = False):
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format, expected one of {', '.join(FORMATS)}")
+    if chart and format != 'json':
+        raise HTTPException(status_code=400, detail="Charts are only available with format=json")
+
+    queries = [query.model_dump() for query in request.queries]
+    # Identical batches in flight (dashboards refreshing together) are computed once
+    key = ('batch', format, chart, tuple(tuple(query.values()) for query in queries))
+    try:
+        body = await compute_pool.run(key, _select_and_encode, queries, format, chart)
+    except (ModelUnavailable, Overloaded) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except UnknownSeries as e:
+        raise HTTPException(status_code=404, detail=f"No forecast for: {e}")
+
+    return Response(content=body, media_type=FORMATS[format])
+
+def _select_and_encode(queries, fmt, chart):
+    return encode(forecast_table.select(queries), fmt, chart)
 
-    # Use the loaded model to forecast
-    forecast_index = pd.date_range(start=datetime.now(), periods=forecast_days + 1, freq='D')[1:]  # Start forecasting from tomorrow
-    forecast_values = model.get_forecast(steps=forecast_days).predicted_mean
+# Series that have a forecast
+@app.get("/forecast/series")
+async def forecast_series():
+    try:
+        series = await compute_pool.run(('series',), forecast_table.series)
+    except (ModelUnavailable, Overloaded) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return [{"zas": zas, "polluant": polluant} for zas, polluant in sorted(series)]
 
-    # Load metrics
-    metrics = load_metrics()
+# Observed history, in-sample and out-of-sample forecasts of the served model between start and
+# end, as columns (dates, values) per type. Long ranges are reduced to `points` points per type
+# with LTTB (shape) or min-max (peaks). format=arrow returns an Arrow IPC stream.
+@app.get("/history/")
+async def history(start: Optional[date] = None, end: Optional[date] = None, types: str = ','.join(TYPES),
+                  points: Optional[int] = Query(None, ge=3, le=100000), method: str = 'lttb', format: str = 'json'):
+    types = tuple(row_type for row_type in types.split(',') if row_type)
+    if not types or any(row_type not in TYPES for row_type in types):
+        raise HTTPException(status_code=400, detail=f"Invalid types, expected some of {', '.join(TYPES)}")
+    if method not in METHODS:
+        raise HTTPException(status_code=400, detail=f"Invalid method, expected one of {', '.join(METHODS)}")
+    if format not in ('json', 'arrow'):
+        raise HTTPException(status_code=400, detail="Invalid format, expected json or arrow")
 
-    # Plotly chart
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=forecast_index, y=forecast_values, mode='lines+markers', name='Forecast'))
-    fig.update_layout(title='Air Quality Forecast', xaxis_title='Date', yaxis_title='Air Quality Index')
+    key = ('history', start, end, types, points, method, format)
+    try:
+        body = await compute_pool.run(key, history_cache.response, start, end, types, points, method, format)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if body is None:
+        raise HTTPException(status_code=503, detail="No model loaded")
+    return Response(content=body, media_type=FORMATS[format])
 
-    # Convert Plotly figure to JSON
-    graph_json = json.loads(fig.to_json())
+# Observed concentrations per day, week or month (freq D, W or M) between start and end, for the
+# zones and pollutants given (repeat the parameter for several; all by default), grouped by zone
+# and/or pollutant (by=zas,polluant, by= for one series). Columns date, groups, count, mean, min
+# and max; format=arrow returns an Arrow IPC stream.
+@app.get("/observations/")
+async def observations(start: Optional[date] = None, end: Optional[date] = None, zas: Optional[List[str]] = Query(None),
+                       polluant: Optional[List[str]] = Query(None), freq: str = 'D', by: str = ','.join(GROUPS),
+                       format: str = 'json'):
+    by = tuple(column for column in by.split(',') if column)
+    if any(column not in GROUPS for column in by):
+        raise HTTPException(status_code=400, detail=f"Invalid by, expected some of {', '.join(GROUPS)}")
+    if freq not in FREQUENCIES:
+        raise HTTPException(status_code=400, detail=f"Invalid freq, expected one of {', '.join(FREQUENCIES)}")
+    if format not in ('json', 'arrow'):
+        raise HTTPException(status_code=400, detail="Invalid format, expected json or arrow")
 
-    return {
-        "option": option,
-        "metrics": metrics,
-        "forecast_chart": graph_json
-    }
+    zas = tuple(sorted(zas)) if zas else None
+    polluant = tuple(sorted(polluant)) if polluant else None
+    key = ('observations', start, end, zas, polluant, freq, by, format)
+    try:
+        body = await compute_pool.run(key, observation_cache.response, start, end, zas, polluant, freq, by, format)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if body is None:
+        raise HTTPException(status_code=503, detail="No observation store")
+    return Response(content=body, media_type=FORMATS[format])
 
 # Run the server
 if __name__ == "__main__":
@@ -0,0 +1,85 @@
+import io
+import json
+import os
+import threading
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc
+
+from src.query import FREQUENCIES, ObservationQuery
+
+# Grouping columns of /observations/
+GROUPS = ('zas', 'polluant')
+VALUE_COLUMNS = ['count', 'mean', 'min', 'max']
+
+
+# Observed concentrations of the Parquet store written by the DAG (all zones), aggregated per day,
+# week or month through src.query: only the rollups of the months requested are read. Encoded
+# responses are kept until the store commits again (checked with a stat of its commit log per
+# call): the dashboard asks for the same few slices again and again.
+class ObservationCache:
+    def __init__(self, path, max_responses=256):
+        self.path = path
+        self.max_responses = max_responses
+        self._lock = threading.Lock()
+        self._version = None
+        self._responses = {}
+
+    # Changes with every commit of the store (or replacement of a single file), None without data
+    def version(self):
+        path = os.path.join(self.path, '_commits.jsonl') if os.path.isdir(self.path) else self.path
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    # Encoded response (json or arrow) for a query, or None when there is no store
+    def response(self, start=None, end=None, zas=None, polluant=None, freq='D', by=GROUPS, fmt='json'):
+        version = self.version()
+        if version is None:
+            return None
+        with self._lock:
+            if version != self._version:
+                self._responses = {}
+                self._version = version
+        key = (start, end, zas, polluant, freq, by, fmt)
+        responses = self._responses
+        body = responses.get(key)
+        if body is None:
+            df = ObservationQuery(self.path).aggregate(freq, start=start, end=end, zas=zas, polluant=polluant, by=by)
+            df = df[['date'] + list(by) + VALUE_COLUMNS]
+            body = encode_arrow(df) if fmt == 'arrow' else encode_json(df)
+            if len(responses) >= self.max_responses:
+                responses.clear()
+            responses[key] = body
+        return body
+
+
+# Columns of the aggregates: {"observations": {"date": [...], "zas": [...], "mean": [...], ...}},
+# means of periods without any valid value as null
+def encode_json(df):
+    columns = {'date': np.datetime_as_string(df['date'].to_numpy(), unit='D').tolist()}
+    for column in df.columns[1:]:
+        values = df[column].to_numpy()
+        if values.dtype.kind == 'f':
+            columns[column] = [None if value != value else value for value in values.tolist()]
+        else:
+            columns[column] = values.tolist()
+    return json.dumps({'observations': columns}, separators=(',', ':')).encode('utf-8')
+
+
+# One Arrow IPC stream: date, dictionary-encoded groups, count and float64 statistics
+def encode_arrow(df):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.set_column(0, 'date', table.column('date').cast(pa.date32()))
+    for column in GROUPS:
+        if column in table.column_names:
+            index = table.column_names.index(column)
+            table = table.set_column(index, column, table.column(column).dictionary_encode())
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
@@ -0,0 +1,46 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Overloaded(Exception):
+    pass
+
+
+# Runs blocking work (model loading, Plotly rendering, Parquet reads, serialization) off the
+# event loop, in a fixed number of threads, so that one slow request does not stall the others.
+#
+# Identical concurrent calls (same key) are coalesced: the first one computes, the others await
+# its result (single-flight). At most max_pending distinct computations may be running or
+# queued; beyond that Overloaded is raised instead of letting the queue and latency grow.
+# The work is still bound by the GIL: threads keep the loop responsive, they do not add CPU.
+class ComputePool:
+    def __init__(self, workers=4, max_pending=64):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api-compute')
+        self._flights = {}
+        self.coalesced = 0
+
+    async def run(self, key, fn, *args):
+        future = self._flights.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            if len(self._flights) >= self.max_pending:
+                raise Overloaded(f"{len(self._flights)} computations pending")
+            future = asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+            self._flights[key] = future
+            future.add_done_callback(lambda done: self._land(key, done))
+        # A cancelled waiter (client gone) must not cancel the computation shared with the others
+        return await asyncio.shield(future)
+
+    def _land(self, key, future):
+        if self._flights.get(key) is future:
+            del self._flights[key]
+
+    @property
+    def pending(self):
+        return len(self._flights)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
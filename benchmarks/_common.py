@@ -0,0 +1,42 @@
+import os
+import sys
+
+# Les benchmarks importent le package du pipeline comme le fait Airflow (dossier dags/ dans le PYTHONPATH).
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DAGS_FOLDER = os.path.join(ROOT, 'dags')
+if DAGS_FOLDER not in sys.path:
+    sys.path.insert(0, DAGS_FOLDER)
+
+
+# Pic de mémoire résidente du processus en Mo. VmHWM est remis à zéro à l'exec,
+# contrairement à ru_maxrss qui hérite du pic du processus parent sous Linux.
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Octets lus et écrits par le processus (rchar/wchar de /proc/self/io, cache disque compris)
+def io_bytes():
+    counters = {}
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                key, value = line.split(':')
+                counters[key] = int(value)
+    except OSError:
+        pass
+    return counters.get('rchar', 0), counters.get('wchar', 0)
+
+
+# Rend importables les modules de l'API FastAPI (api/), comme dans son image Docker
+def use_api():
+    api_folder = os.path.join(ROOT, 'api')
+    if api_folder not in sys.path:
+        sys.path.insert(0, api_folder)
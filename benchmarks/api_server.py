@@ -0,0 +1,72 @@
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+import uvicorn
+
+
+# Serveur uvicorn local dans un thread, pour les tests de charge de l'API
+class UvicornServer:
+    def __init__(self, app):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            self.port = sock.getsockname()[1]
+        config = uvicorn.Config(app, host='127.0.0.1', port=self.port, log_level='warning', access_log=False)
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.port}'
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+# Envoie n_requests requêtes (paths tirés en boucle) avec `concurrency` clients et renvoie les
+# latences en millisecondes, le débit et le nombre de réponses en erreur, au total et par path.
+# Un path est une URL relative (GET) ou un tuple (URL relative, corps JSON) envoyé en POST.
+def load_test(url, paths, n_requests=500, concurrency=8):
+    local = threading.local()
+
+    def call(i):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        path = paths[i % len(paths)]
+        start = time.perf_counter()
+        if isinstance(path, tuple):
+            response = session.post(url + path[0], json=path[1])
+        else:
+            response = session.get(url + path)
+        return (time.perf_counter() - start) * 1000, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(call, range(n_requests)))
+    seconds = time.perf_counter() - start
+    latencies = np.array([latency for latency, _ in results])
+    by_path = {}
+    for index, path in enumerate(paths):
+        path_latencies = latencies[index::len(paths)]
+        if path_latencies.size:
+            by_path[path[0] if isinstance(path, tuple) else path] = {
+                'p50': float(np.percentile(path_latencies, 50)), 'p99': float(np.percentile(path_latencies, 99))}
+    return {
+        'p50': float(np.percentile(latencies, 50)),
+        'p99': float(np.percentile(latencies, 99)),
+        'max': float(latencies.max()),
+        'rps': n_requests / seconds,
+        'errors': sum(1 for _, status in results if status >= 400),
+        'by_path': by_path,
+    }
@@ -0,0 +1,74 @@
+import argparse
+import filecmp
+import os
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+import _common  # noqa: F401
+from synthetic_lcsqa import write_days
+from src.gaz_data_processor import GazDataProcessor
+
+KEYS = ['Date de fin', 'Polluant', 'Zas']
+
+
+# Prépare les données comme process_csv_files juste avant le groupby.
+def load_prepared(file_path):
+    data = pd.read_csv(file_path, sep=';')
+    data['Polluant'] = data['Polluant'].replace({'NO': 'NO2', 'NOX': 'NO2', 'NOX as NO2': 'NO2', 'PM2.5': 'PM25'})
+    data = data[~data['Polluant'].isin(['C6H6', 'SO2', 'CO'])]
+    data = data.dropna(subset=['Date de début', 'Date de fin', 'Polluant', 'valeur', 'code qualité', 'unité de mesure'])
+    data['Date de fin'] = pd.to_datetime(data['Date de fin']).dt.date
+    return data
+
+
+def time_aggregate(processor, frames):
+    start = time.perf_counter()
+    results = [processor.aggregate(frame, KEYS) for frame in frames]
+    return time.perf_counter() - start, results
+
+
+def time_end_to_end(input_folder, output_folder, engine):
+    os.makedirs(output_folder)
+    start = time.perf_counter()
+    GazDataProcessor(input_folder, output_folder, agg_engine=engine).process_csv_files()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agrégation custom_agg (Python) contre le moteur vectorisé.")
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--zones', type=int, default=6)
+    parser.add_argument('--stations', type=int, default=10)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_aggregation_')
+    try:
+        raw = os.path.join(workdir, 'raw')
+        names = write_days(raw, n_days=args.days, zones=args.zones, stations_per_zone=args.stations)
+        frames = [load_prepared(os.path.join(raw, name)) for name in names]
+        rows = sum(len(frame) for frame in frames)
+        print(f"{len(frames)} fichiers, {rows} lignes horaires après filtrage")
+
+        python_seconds, python_results = time_aggregate(GazDataProcessor(raw, workdir, agg_engine='python'), frames)
+        vector_seconds, vector_results = time_aggregate(GazDataProcessor(raw, workdir), frames)
+        for expected, actual in zip(python_results, vector_results):
+            pd.testing.assert_frame_equal(expected, actual)
+        print(f"groupby seul     python {python_seconds:7.2f}s  vectorisé {vector_seconds:7.2f}s  "
+              f"(x{python_seconds / vector_seconds:.1f})")
+
+        python_total = time_end_to_end(raw, os.path.join(workdir, 'python'), 'python')
+        vector_total = time_end_to_end(raw, os.path.join(workdir, 'vectorized'), 'vectorized')
+        match, mismatch, errors = filecmp.cmpfiles(os.path.join(workdir, 'python'), os.path.join(workdir, 'vectorized'),
+                                                   sorted(os.listdir(os.path.join(workdir, 'python'))), shallow=False)
+        assert not mismatch and not errors, (mismatch, errors)
+        print(f"process_csv_files python {python_total:7.2f}s  vectorisé {vector_total:7.2f}s  "
+              f"(x{python_total / vector_total:.1f}), {len(match)} sorties identiques octet par octet")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow.ipc
+import pyarrow.parquet as pq
+import requests
+
+import _common
+from api_server import UvicornServer
+from src.forecasting import forecasts_table
+
+POLLUANTS = ['NO2', 'O3', 'PM10', 'PM2.5', 'SO2']
+
+
+# forecasts.parquet synthétique, au format écrit par ForecastEngine (n_zones x 5 polluants, 7 jours)
+def publish_forecasts(folder, n_zones, steps=7):
+    rng = np.random.default_rng(0)
+    last_date = pd.Timestamp('2024-06-30')
+    results = [{'zas': f'ZAS {zone:03d}', 'polluant': polluant, 'last_date': last_date,
+                'forecast': rng.gamma(4, 5, steps)}
+               for zone in range(n_zones) for polluant in POLLUANTS]
+    path = os.path.join(folder, 'forecasts.parquet')
+    pq.write_table(forecasts_table(results, steps), path)
+    return path, [{'zas': result['zas'], 'polluant': result['polluant']} for result in results]
+
+
+def timed(call, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = call()
+        latencies.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+    return float(np.median(latencies)), response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prévisions multi-séries : une requête par série contre /forecast/batch.")
+    parser.add_argument('--zones', type=int, default=60)
+    parser.add_argument('--horizon', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_api_batch_')
+    try:
+        path, keys = publish_forecasts(workdir, args.zones)
+        os.environ['FORECASTS_PATH'] = path
+        os.environ['REGISTRY_PATH'] = os.path.join(workdir, 'registry')
+        _common.use_api()
+        import main as api
+
+        queries = [dict(key, horizon=args.horizon) for key in keys]
+        print(f"{len(queries)} séries, horizon {args.horizon} jours")
+        with UvicornServer(api.app) as server, requests.Session() as session:
+            batch_url = server.url + '/forecast/batch'
+            session.post(batch_url, json={'queries': queries})  # chauffe
+
+            start = time.perf_counter()
+            for query in queries:
+                session.post(batch_url, json={'queries': [query]}).raise_for_status()
+            single = (time.perf_counter() - start) * 1000
+            print(f"une requête par série   {single:8.1f} ms")
+
+            bodies = {}
+            for fmt, chart in (('json', False), ('ndjson', False), ('arrow', False), ('json', True)):
+                latency, response = timed(lambda: session.post(batch_url, params={'format': fmt, 'chart': chart},
+                                                               json={'queries': queries}), args.repeat)
+                bodies[fmt, chart] = response
+                label = f"batch {fmt}" + (" + graphiques" if chart else "")
+                print(f"{label:<23} {latency:8.1f} ms  {len(response.content) / 1024:8.1f} Ko")
+
+        # Les trois formats décrivent les mêmes prévisions
+        forecasts = bodies['json', False].json()['forecasts']
+        values = np.concatenate([item['values'] for item in forecasts]).astype(np.float32)
+        ndjson = pd.read_json(io.StringIO(bodies['ndjson', False].text), lines=True)
+        arrow = pyarrow.ipc.open_stream(bodies['arrow', False].content).read_all().to_pandas()
+        assert np.array_equal(values, ndjson['forecast'].to_numpy(dtype=np.float32))
+        assert np.array_equal(values, arrow['forecast'].to_numpy())
+        assert len(values) == len(queries) * args.horizon
+        print("mêmes valeurs en JSON, NDJSON et Arrow")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
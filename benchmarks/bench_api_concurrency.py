@@ -0,0 +1,73 @@
+import argparse
+import os
+import shutil
+import tempfile
+
+from fastapi import FastAPI, HTTPException, Response
+
+import _common
+from api_server import UvicornServer, load_test
+from bench_api_batch import publish_forecasts
+from bench_api_forecast import PATHS, legacy_app, publish_model
+
+
+# Ancienne conception : handlers async qui calculent directement dans la boucle d'événements
+# (prévision statsmodels, Plotly, lecture de metrics.json, puis encodage du batch)
+def blocking_app(model_path, metrics_path, forecast_table, encode):
+    app = legacy_app(model_path, metrics_path)
+
+    @app.post("/forecast/batch")
+    async def forecast_batch(request: dict, format: str = 'json', chart: bool = False):
+        try:
+            results = forecast_table.select(request['queries'])
+        except Exception as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        return Response(content=encode(results, format, chart), media_type='application/json')
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Charge mixte sur l'API : calcul dans la boucle d'événements "
+                                                 "contre pool borné et requêtes fusionnées.")
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--series', type=int, default=10, help="séries par batch avec graphiques")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_api_concurrency_')
+    try:
+        model_path, metrics_path = publish_model(workdir)
+        forecasts_path, keys = publish_forecasts(workdir, n_zones=args.series // 5 + 1)
+        os.environ['MODEL_PATH'], os.environ['METRICS_PATH'] = model_path, metrics_path
+        os.environ['FORECASTS_PATH'] = forecasts_path
+        os.environ['REGISTRY_PATH'] = os.path.join(workdir, 'registry')
+        _common.use_api()
+        import main as api
+        from forecast_batch import encode
+
+        # 4 requêtes rapides /forecast/ pour 1 batch lent (graphiques Plotly), même batch pour tous les clients
+        batch = ('/forecast/batch?chart=true', {'queries': keys[:args.series]})
+        paths = PATHS + [batch]
+        apps = {'boucle bloquée': blocking_app(model_path, metrics_path, api.forecast_table, encode),
+                'pool + fusion': api.app}
+        print(f"{args.requests} requêtes, 4 /forecast/ pour 1 batch de {args.series} graphiques")
+        for name, app in apps.items():
+            with UvicornServer(app) as server:
+                load_test(server.url, paths, n_requests=20, concurrency=2)  # chauffe
+                for concurrency in args.concurrency:
+                    coalesced = api.compute_pool.coalesced
+                    result = load_test(server.url, paths, n_requests=args.requests, concurrency=concurrency)
+                    fast = [result['by_path'][path]['p99'] for path in PATHS]
+                    line = (f"{name:<15} {concurrency:3d} clients  {result['rps']:7.1f} req/s  "
+                            f"/forecast/ p99 {max(fast):7.1f} ms  batch p50 {result['by_path'][batch[0]]['p50']:7.1f} ms  "
+                            f"erreurs {result['errors']}")
+                    if app is api.app:
+                        line += f"  fusionnées {api.compute_pool.coalesced - coalesced}"
+                    print(line)
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
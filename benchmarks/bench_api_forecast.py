@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import warnings
+from datetime import datetime
+
+import joblib
+import pandas as pd
+import plotly.graph_objects as go
+import requests
+from fastapi import FastAPI, HTTPException
+from statsmodels.tsa.arima.model import ARIMA
+
+import _common
+from api_server import UvicornServer, load_test
+from bench_warm_start import load_series
+
+PATHS = [f'/forecast/?option={option}' for option in (1, 2, 3, 4)]
+
+
+# Ancien handler : prévision, figure Plotly, to_json puis json.loads et relecture de metrics.json à chaque requête
+def legacy_app(model_path, metrics_path):
+    app = FastAPI()
+    model = joblib.load(model_path)
+
+    def load_metrics():
+        with open(metrics_path, 'r') as file:
+            return json.load(file)
+
+    @app.get("/forecast/")
+    async def forecast(option: int):
+        if option not in [1, 2, 3, 4]:
+            raise HTTPException(status_code=400, detail="Invalid option provided")
+        forecast_days = [1, 2, 4, 7][option - 1]
+        forecast_index = pd.date_range(start=datetime.now(), periods=forecast_days + 1, freq='D')[1:]
+        forecast_values = model.get_forecast(steps=forecast_days).predicted_mean
+        metrics = load_metrics()
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(x=forecast_index, y=forecast_values, mode='lines+markers', name='Forecast'))
+        fig.update_layout(title='Air Quality Forecast', xaxis_title='Date', yaxis_title='Air Quality Index')
+        graph_json = json.loads(fig.to_json())
+        return {"option": option, "metrics": metrics, "forecast_chart": graph_json}
+
+    return app
+
+
+# Modèle et metrics.json tels que publiés par le DAG (historique complet dans "data")
+def publish_model(folder):
+    warnings.simplefilter('ignore')
+    ts = load_series()
+    model_fit = ARIMA(ts, order=(4, 2, 2)).fit()
+    model_path = os.path.join(folder, 'model.pkl')
+    metrics_path = os.path.join(folder, 'metrics.json')
+    joblib.dump(model_fit, model_path)
+    metrics = {"MAE": 3.1, "MSE": 14.2, "RMSE": 3.8, "ACF1": 0.1, "MAPE": 12.5}
+    data = [{"date": date.strftime("%Y-%m-%d"), "value": value, "type": "historical"} for date, value in ts.dropna().items()]
+    with open(metrics_path, 'w') as f:
+        json.dump([{"metrics": metrics, "data": data}, metrics], f, indent=4)
+    return model_path, metrics_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge de /forecast/ : handler d'origine contre cache de réponses.")
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_api_forecast_')
+    try:
+        model_path, metrics_path = publish_model(workdir)
+        print(f"metrics.json : {os.path.getsize(metrics_path) / 1024:.0f} Ko, "
+              f"{args.requests} requêtes, {args.concurrency} clients")
+
+        os.environ['MODEL_PATH'], os.environ['METRICS_PATH'] = model_path, metrics_path
+        os.environ['REGISTRY_PATH'] = os.path.join(workdir, 'registry')
+        _common.use_api()
+        import main as api
+
+        bodies = {}
+        for name, app in (('origine', legacy_app(model_path, metrics_path)), ('cache', api.app)):
+            with UvicornServer(app) as server:
+                bodies[name] = [requests.get(server.url + path).json() for path in PATHS]
+                load_test(server.url, PATHS, n_requests=50, concurrency=args.concurrency)  # chauffe
+                result = load_test(server.url, PATHS, n_requests=args.requests, concurrency=args.concurrency)
+            print(f"{name:<8} p50 {result['p50']:7.2f} ms  p99 {result['p99']:7.2f} ms  "
+                  f"{result['rps']:7.0f} req/s  erreurs {result['errors']}")
+
+        # Même contenu, hors abscisses du graphique (horodatées à la construction de la réponse) et
+        # historique, que /forecast/ ne renvoie plus (servi par /history/)
+        from forecast_cache import without_series
+        for legacy, cached in zip(bodies['origine'], bodies['cache']):
+            for body in (legacy, cached):
+                body['forecast_chart']['data'][0].pop('x')
+            legacy['metrics'] = without_series(legacy['metrics'])
+            assert legacy == cached
+        print("réponses identiques (hors horodatage des abscisses et historique)")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow.ipc
+import requests
+
+import _common
+from api_server import UvicornServer
+from bench_api_forecast import publish_model
+
+
+# Historique publié dans metrics.json (que /forecast/ renvoyait en entier avant /history/),
+# filtré côté client : référence des valeurs servies
+def published_history(metrics_path, start):
+    with open(metrics_path) as f:
+        df = pd.DataFrame(json.load(f)[0]['data'])
+    df['date'] = pd.to_datetime(df['date'])
+    return df[df['date'] >= pd.Timestamp(start)].dropna(subset=['value'])
+
+
+# Tableau de bord : /forecast/ ne porte plus que les métriques et le graphique de prévision
+def forecast_client(session, url):
+    response = session.get(url + '/forecast/', params={'option': 4})
+    response.raise_for_status()
+    return response.json()
+
+
+def history_client(session, url, start, points=None, fmt='json'):
+    params = {'types': 'historical,historical_forecast', 'format': fmt}
+    if start is not None:
+        params['start'] = start.isoformat()
+    if points:
+        params['points'] = points
+    response = session.get(url + '/history/', params=params)
+    response.raise_for_status()
+    if fmt == 'arrow':
+        table = pyarrow.ipc.open_stream(response.content).read_all().to_pandas()
+        return {row_type: group for row_type, group in table.groupby('type', observed=True)}
+    return {row_type: pd.DataFrame({'date': pd.to_datetime(columns['dates']), 'value': columns['values']})
+            for row_type, columns in response.json()['series'].items()}
+
+
+# Latence médiane (requête + décodage en DataFrames) et octets reçus par appel
+def timed(call, sizes, repeat):
+    latencies = []
+    sizes.clear()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = call()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return float(np.median(latencies)), sum(sizes) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Historique du tableau de bord : filtrage client contre /history/.")
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--points', type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_api_history_')
+    try:
+        model_path, metrics_path = publish_model(workdir)
+        os.environ['MODEL_PATH'], os.environ['METRICS_PATH'] = model_path, metrics_path
+        os.environ['REGISTRY_PATH'] = os.path.join(workdir, 'registry')
+        _common.use_api()
+        import main as api
+
+        with UvicornServer(api.app) as server, requests.Session() as session:
+            sizes = []
+            session.hooks['response'].append(lambda response, *args, **kwargs: sizes.append(len(response.content)))
+            last_date = pd.Timestamp(session.get(server.url + '/history/').json()['series']['historical']['dates'][-1])
+            month = (last_date - timedelta(days=30)).date()
+            latency, size, data = timed(lambda: forecast_client(session, server.url), sizes, args.repeat)
+            print(f"{'/forecast/ (sans historique)':<38} {latency:8.1f} ms  {size / 1024:8.1f} Ko")
+            assert 'data' not in data['metrics'][0] and 'series' not in data['metrics'][0]
+            cases = [
+                ('30 jours, /history/ JSON', lambda: history_client(session, server.url, month)),
+                ('tout, /history/ JSON', lambda: history_client(session, server.url, None)),
+                (f'tout, /history/ LTTB {args.points} pts', lambda: history_client(session, server.url, None, args.points)),
+                (f'tout, /history/ Arrow LTTB {args.points} pts',
+                 lambda: history_client(session, server.url, None, args.points, 'arrow')),
+            ]
+            results = {}
+            for label, call in cases:
+                latency, size, result = timed(call, sizes, args.repeat)
+                results[label] = result
+                print(f"{label:<38} {latency:8.1f} ms  {size / 1024:8.1f} Ko  "
+                      f"{len(result['historical']):5d} points historiques")
+
+        # Même mois d'historique que celui publié
+        published, served = published_history(metrics_path, month), results[cases[0][0]]['historical']
+        assert np.array_equal(published['date'].to_numpy(), served['date'].to_numpy())
+        assert np.allclose(published['value'].to_numpy(dtype=float), served['value'].to_numpy())
+        print("même historique sur 30 jours")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
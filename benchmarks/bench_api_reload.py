@@ -0,0 +1,71 @@
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import requests
+
+import _common
+from api_server import UvicornServer, load_test
+from bench_api_forecast import PATHS, publish_model
+from src.registry import ModelRegistry
+
+
+# Publie une nouvelle version toutes les `interval` secondes pendant le test de charge
+def publisher(registry, model_path, metrics_path, interval, stop):
+    published = 0
+    while not stop.wait(interval):
+        registry.publish({'model.pkl': model_path, 'metrics.json': metrics_path}, metadata={'run': published})
+        published += 1
+    return published
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publications de modèles pendant la charge : rechargement en ligne contre en arrière-plan.")
+    parser.add_argument('--requests', type=int, default=600)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--interval', type=float, default=0.5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_api_reload_')
+    try:
+        model_path, metrics_path = publish_model(workdir)
+        registry = ModelRegistry(os.path.join(workdir, 'registry'))
+        registry.publish({'model.pkl': model_path, 'metrics.json': metrics_path})
+        os.environ['REGISTRY_PATH'] = registry.root
+        os.environ['MODEL_RELOAD_INTERVAL'] = '0.1'
+        _common.use_api()
+        import main as api
+
+        # Le cache est piloté ici plutôt que par l'événement de démarrage de l'application
+        api.app.router.on_startup.clear()
+        api.forecast_cache.refresh()
+        for mode in ('en ligne', 'arrière-plan'):
+            if mode == 'arrière-plan':
+                api.forecast_cache.start()
+            # Sans thread de surveillance, la requête qui détecte une nouvelle version la charge elle-même
+            with UvicornServer(api.app) as server:
+                load_test(server.url, PATHS, n_requests=50, concurrency=args.concurrency)
+                stop = threading.Event()
+                versions_before = len(registry.versions())
+                thread = threading.Thread(target=publisher, args=(registry, model_path, metrics_path, args.interval, stop))
+                thread.start()
+                result = load_test(server.url, PATHS, n_requests=args.requests, concurrency=args.concurrency)
+                stop.set()
+                thread.join()
+                time.sleep(1.5)
+                requests.get(server.url + PATHS[0])
+                served = requests.get(server.url + '/model/').json()['version']
+            published = len(registry.versions()) - versions_before
+            print(f"{mode:<13} p50 {result['p50']:7.2f} ms  p99 {result['p99']:7.2f} ms  max {result['max']:7.1f} ms  {result['rps']:6.0f} req/s  "
+                  f"erreurs {result['errors']}  {published} versions publiées, servie : "
+                  f"{'dernière' if served == registry.current_version() else served}")
+            api.forecast_cache.stop()
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
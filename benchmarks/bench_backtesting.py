@@ -0,0 +1,67 @@
+import argparse
+import os
+import time
+
+import numpy as np
+from sklearn.metrics import mean_absolute_error, mean_squared_error
+
+import _common  # noqa: F401
+from bench_warm_start import load_series
+from src.backtesting import Backtest
+
+
+# Métriques calculées comme dans run_model_and_forecast : un appel sklearn par pli et par horizon
+def per_fold_metrics(result):
+    rows = []
+    for horizon in result.backtest.horizons:
+        for actual, forecast in zip(result.actuals[:, horizon - 1], result.forecasts[:, horizon - 1]):
+            if np.isfinite(actual):
+                rows.append((horizon, mean_absolute_error([actual], [forecast]), mean_squared_error([actual], [forecast])))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest à origines glissantes : coût et précision par choix de modèle.")
+    parser.add_argument('--origins', type=int, default=28)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--orders', nargs='+', default=['4,2,2', '2,1,2', '1,1,1'])
+    args = parser.parse_args()
+
+    ts = load_series()
+    print(f"{len(ts)} jours, {args.origins} origines, horizons 1/2/4/7 j, {args.workers} processus ({os.cpu_count()} CPU)")
+    header = f"{'ordre':<9} {'réajust.':>8} {'temps':>7} {'fits':>5} {'ajust.':>7} {'prév.':>6} {'pic RSS':>8}  " \
+             + ' '.join(f'MAE {h}j' for h in (1, 2, 4, 7))
+    print(header)
+
+    results = {}
+    cases = [((4, 2, 2), refit_every) for refit_every in (1, 7, None)]
+    cases += [(tuple(int(part) for part in order.split(',')), 7) for order in args.orders if order != '4,2,2']
+    for order, refit_every in cases:
+        start = time.perf_counter()
+        result = Backtest(order=order, n_origins=args.origins, refit_every=refit_every, workers=args.workers).run(ts)
+        seconds = time.perf_counter() - start
+        summary = result.summary()
+        results[order, refit_every] = result
+        print(f"{','.join(map(str, order)):<9} {str(refit_every or 'jamais'):>8} {seconds:6.1f}s {summary['fits']:5d} "
+              f"{summary['fit_seconds']:6.1f}s {summary['forecast_seconds']:5.2f}s {summary['peak_rss_mb']:6.0f} Mo  "
+              + ' '.join(f"{summary[f'mae_{h}d']:6.2f}" for h in (1, 2, 4, 7)))
+
+    # Métriques vectorisées contre un appel sklearn par pli
+    result = results[(4, 2, 2), 7]
+    start = time.perf_counter()
+    metrics = result.metrics().set_index('horizon')
+    vectorized = time.perf_counter() - start
+    start = time.perf_counter()
+    rows = per_fold_metrics(result)
+    loop = time.perf_counter() - start
+    for horizon in result.backtest.horizons:
+        maes = [mae for h, mae, _ in rows if h == horizon]
+        mses = [mse for h, _, mse in rows if h == horizon]
+        assert np.isclose(metrics.loc[horizon, 'mae'], np.mean(maes)) and np.isclose(metrics.loc[horizon, 'mse'], np.mean(mses))
+    print(f"métriques : {vectorized * 1000:.2f} ms vectorisées contre {loop * 1000:.1f} ms en boucle sklearn "
+          f"({len(rows)} appels), mêmes valeurs")
+    print(metrics.round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from os import listdir, path
+
+import _common  # noqa: F401
+from bs4 import BeautifulSoup
+from requests import get
+
+from local_http import LocalHTTPServer
+from src.gaz_data import GazsData
+from src.manifest import Manifest
+
+
+# Ancienne boucle séquentielle de GazsData.download_csv_files, conservée comme référence.
+def legacy_download(url, download_folder, target_year):
+    downloaded_files = listdir(download_folder)
+    soup = BeautifulSoup(get(url).text, 'html.parser')
+    for year_folder in soup.select('a[href$="/"]'):
+        if year_folder['href'].strip('/') == target_year:
+            year_url = url + year_folder['href']
+            soup_year = BeautifulSoup(get(year_url).text, 'html.parser')
+            for csv_file in soup_year.select('a[href$=".csv"]'):
+                if csv_file['href'] not in downloaded_files:
+                    with open(path.join(download_folder, csv_file['href']), 'wb') as f:
+                        f.write(get(year_url + csv_file['href']).content)
+                downloaded_files.append(csv_file['href'])
+
+
+def make_remote_tree(root, year, n_files, file_size):
+    year_folder = os.path.join(root, year)
+    os.makedirs(year_folder)
+    line = b"2024/01/01 00:00:00;2024/01/01 01:00:00;AIRPARIF;FR04ZAG01;ZAG PARIS;FR04002;site;NO2;12.5\n"
+    body = line * max(1, file_size // len(line))
+    for day in range(n_files):
+        with open(os.path.join(year_folder, f'FR_E2_{year}-01-01_{day:03d}.csv'), 'wb') as f:
+            f.write(body)
+    return year_folder
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"{label:<38} {time.perf_counter() - start:8.2f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du téléchargement LCSQA contre un serveur HTTP local.")
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--size-kb', type=int, default=256)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    year = '2024'
+    workdir = tempfile.mkdtemp(prefix='bench_download_')
+    try:
+        remote = os.path.join(workdir, 'remote')
+        year_folder = make_remote_tree(remote, year, args.files, args.size_kb * 1024)
+        with LocalHTTPServer(remote, latency=args.latency_ms / 1000) as server:
+            legacy_folder = os.path.join(workdir, 'legacy')
+            os.makedirs(legacy_folder)
+            timed('legacy serial, cold', lambda: legacy_download(server.url, legacy_folder, year))
+
+            folder = os.path.join(workdir, 'concurrent')
+            os.makedirs(folder)
+            gazs_data = GazsData(folder)
+            gazs_data.url = server.url
+            timed(f'concurrent ({args.workers} workers), cold',
+                  lambda: gazs_data.download_csv_files(year, max_workers=args.workers))
+            summary = timed('concurrent, warm (nothing changed)',
+                            lambda: gazs_data.download_csv_files(year, max_workers=args.workers))
+            assert len(summary['skipped']) == args.files
+
+            # Simule un run interrompu (fichiers partiels) et des fichiers modifiés côté serveur.
+            names = sorted(os.listdir(folder))
+            for name in names[:10]:
+                file_path = os.path.join(folder, name)
+                os.replace(file_path, file_path + '.part')
+                mtime = os.path.getmtime(file_path + '.part')
+                with open(file_path + '.part', 'r+b') as f:
+                    f.truncate(os.path.getsize(file_path + '.part') // 2)
+                os.utime(file_path + '.part', (mtime, mtime))
+            for name in names[10:20]:
+                with open(os.path.join(year_folder, name), 'ab') as f:
+                    f.write(b'\n')
+            summary = timed('concurrent, 10 partial + 10 changed',
+                            lambda: gazs_data.download_csv_files(year, max_workers=args.workers))
+            assert len(summary['resumed']) == 10 and len(summary['downloaded']) == 10
+            for name in names:
+                assert os.path.getsize(os.path.join(folder, name)) == os.path.getsize(os.path.join(year_folder, name))
+
+            # Avec le manifeste : plus de listdir ni de stat, les validateurs viennent de SQLite.
+            manifest_folder = os.path.join(workdir, 'manifest')
+            os.makedirs(manifest_folder)
+            with Manifest(os.path.join(workdir, 'manifest.sqlite')) as manifest:
+                gazs_data = GazsData(manifest_folder, manifest=manifest)
+                gazs_data.url = server.url
+                timed('manifest, cold', lambda: gazs_data.download_csv_files(year, max_workers=args.workers))
+                summary = timed('manifest, warm (nothing changed)',
+                                lambda: gazs_data.download_csv_files(year, max_workers=args.workers))
+                assert len(summary['skipped']) == args.files
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
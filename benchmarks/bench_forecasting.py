@@ -0,0 +1,63 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import _common  # noqa: F401
+from src.forecasting import ForecastEngine, build_series
+from src.parquet_store import PartitionedParquetStore
+
+POLLUTANTS = ['NO2', 'O3', 'PM10', 'PM25']
+
+
+# Store multi-zones synthétique : séries journalières de longueurs variées (min_days à max_days)
+def write_store(root, zones, min_days, max_days, seed=0):
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp('2024-06-30')
+    frames = []
+    for zone in range(zones):
+        for pollutant in POLLUTANTS:
+            days = int(rng.integers(min_days, max_days + 1))
+            dates = pd.date_range(end=end, periods=days, freq='D')
+            level = 20 + 5 * np.sin(np.arange(days) / 58) + np.cumsum(rng.normal(0, 0.5, days))
+            frames.append(pd.DataFrame({'date de fin': dates, 'polluant': pollutant, 'zas': f'ZAS {zone:03d}',
+                                        'valeur': level + rng.normal(0, 3, days), 'file_date': dates,
+                                        'processing_date': '20240630_000000'}))
+    store = PartitionedParquetStore(root)
+    store.append(pd.concat(frames, ignore_index=True))
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prévisions par (zas, polluant) : pool de processus, plus longues séries d'abord.")
+    parser.add_argument('--zones', type=int, default=10)
+    parser.add_argument('--min-days', type=int, default=60)
+    parser.add_argument('--max-days', type=int, default=900)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count()])
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_forecasting_')
+    try:
+        store = write_store(os.path.join(workdir, 'store'), args.zones, args.min_days, args.max_days)
+        start = time.perf_counter()
+        series = build_series(store)
+        print(f"{len(series)} séries construites en {time.perf_counter() - start:.2f}s "
+              f"({sum(len(ts) for ts in series.values())} jours), cpu_count={os.cpu_count()}")
+
+        for workers in sorted(set(args.workers)):
+            engine = ForecastEngine(workers=workers, timeout=120)
+            start = time.perf_counter()
+            results = engine.fit_all(series)
+            seconds = time.perf_counter() - start
+            statuses = pd.Series([result['status'] for result in results]).value_counts().to_dict()
+            print(f"workers={workers:<3} {seconds:7.2f}s  {len(results) / seconds:6.1f} séries/s  {statuses}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+import _common
+from synthetic_lcsqa import write_days
+from src.gaz_data_processor import GazDataProcessor
+from src.ingestion import PROCESSOR_COLUMNS, read_lcsqa_csv
+
+
+def read_legacy(file_path):
+    data = pd.read_csv(file_path, sep=';')
+    data['Date de fin'] = pd.to_datetime(data['Date de fin'])
+    return data
+
+
+def read_typed(file_path, engine):
+    return read_lcsqa_csv(file_path, columns=PROCESSOR_COLUMNS, parse_dates=True, engine=engine)
+
+
+READERS = {
+    'legacy': read_legacy,
+    'typed-c': lambda file_path: read_typed(file_path, 'c'),
+    'typed-pyarrow': lambda file_path: read_typed(file_path, 'pyarrow'),
+}
+
+
+# Exécuté dans un processus neuf pour que le pic RSS ne mesure que ce lecteur.
+def measure(variant, folder):
+    baseline_rss = _common.peak_rss_mb()
+    start = time.perf_counter()
+    frames = [READERS[variant](os.path.join(folder, name)) for name in sorted(os.listdir(folder))]
+    seconds = time.perf_counter() - start
+    print(json.dumps({
+        'seconds': seconds,
+        'frame_mb': sum(frame.memory_usage(deep=True).sum() for frame in frames) / 2**20,
+        'peak_rss_mb': _common.peak_rss_mb() - baseline_rss,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lecture CSV LCSQA : pd.read_csv brut contre schéma typé.")
+    parser.add_argument('--days', type=int, default=10)
+    parser.add_argument('--zones', type=int, default=40)
+    parser.add_argument('--measure', nargs=2, metavar=('VARIANT', 'FOLDER'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        return measure(*args.measure)
+
+    workdir = tempfile.mkdtemp(prefix='bench_ingestion_')
+    try:
+        raw = os.path.join(workdir, 'raw')
+        names = write_days(raw, n_days=args.days, zones=args.zones, stations_per_zone=10)
+        size_mb = sum(os.path.getsize(os.path.join(raw, name)) for name in names) / 2**20
+        print(f"{len(names)} fichiers, {size_mb:.0f} Mo de CSV")
+        for variant in READERS:
+            output = subprocess.run([sys.executable, __file__, '--measure', variant, raw],
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{variant:<14} {result['seconds']:6.2f}s  {size_mb / result['seconds']:6.1f} Mo/s  "
+                  f"DataFrames {result['frame_mb']:7.1f} Mo  pic RSS +{result['peak_rss_mb']:7.1f} Mo")
+
+        # Les sorties du processeur doivent rester identiques avec la lecture typée.
+        processor = GazDataProcessor(raw, workdir)
+        for name in names:
+            legacy = processor.clean_data(pd.read_csv(os.path.join(raw, name), sep=';')).to_csv(index=False)
+            typed = processor.clean_data(read_lcsqa_csv(os.path.join(raw, name), columns=PROCESSOR_COLUMNS,
+                                                        dtypes={'valeur': 'float64'})).to_csv(index=False)
+            assert legacy == typed, name
+        print("sorties de GazDataProcessor identiques octet par octet")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
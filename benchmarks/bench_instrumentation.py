@@ -0,0 +1,124 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+import requests
+
+import _common
+from synthetic_lcsqa import write_days
+from src import instrumentation
+from src.instrumentation import span
+
+
+# Coût d'un span par itération (ns), comparé à une boucle sans instrumentation
+def span_cost(n, **kwargs):
+    start = time.perf_counter()
+    for _ in range(n):
+        pass
+    bare = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(n):
+        with span('bench', **kwargs) as s:
+            s.add(rows_in=1)
+    return (time.perf_counter() - start - bare) / n * 1e9
+
+
+# Exécuté dans un processus neuf : pipeline fusionné (toutes zones), instrumenté ou non
+def measure(raw, workdir, metrics_dir):
+    if metrics_dir != '-':
+        instrumentation.configure(metrics_dir)
+    from src.pipeline import GazPipeline
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        start = time.perf_counter()
+        with instrumentation.task('gaz_pipeline'):
+            GazPipeline(raw, os.path.join(workdir, 'parquet'), all_zones=True).run(workers=1)
+        seconds = time.perf_counter() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    print(json.dumps({'seconds': seconds}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Instrumentation des étapes : surcoût désactivée/activée et ventilation.")
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--zones', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--measure', nargs=3, metavar=('RAW', 'WORKDIR', 'METRICS_DIR'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        return measure(*args.measure)
+
+    workdir = tempfile.mkdtemp(prefix='bench_instrumentation_')
+    try:
+        # Surcoût par span
+        n = 200_000
+        disabled = span_cost(n)
+        instrumentation.configure(os.path.join(workdir, 'micro'))
+        timed_only = span_cost(n // 20, resources=False)
+        full = span_cost(n // 20)
+        instrumentation.configure(None, enabled=False)
+        print(f"span désactivé {disabled:8.0f} ns, activé sans ressources {timed_only / 1000:6.1f} µs, "
+              f"avec CPU/E-S/RSS {full / 1000:6.1f} µs")
+
+        # Pipeline complet, instrumentation désactivée puis activée (médiane de repeat runs)
+        raw = os.path.join(workdir, 'raw')
+        names = write_days(raw, n_days=args.days, zones=args.zones)
+        metrics_dir = os.path.join(workdir, 'metrics')
+        timings = {}
+        for label, folder in (('désactivée', '-'), ('activée', metrics_dir)):
+            runs = []
+            for run in range(args.repeat):
+                run_dir = os.path.join(workdir, f'{label}_{run}')
+                output = subprocess.run([sys.executable, __file__, '--measure', raw, run_dir, folder],
+                                        check=True, capture_output=True, text=True).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1])['seconds'])
+            timings[label] = sorted(runs)[len(runs) // 2]
+        overhead = timings['activée'] / timings['désactivée'] - 1
+        print(f"pipeline {len(names)} fichiers : {timings['désactivée']:.2f}s sans, {timings['activée']:.2f}s avec "
+              f"instrumentation ({overhead:+.1%})")
+
+        # Ventilation par étape du dernier run instrumenté
+        records = instrumentation.read_spans(os.path.join(metrics_dir, instrumentation.SPANS_FILE))
+        last_task = records[-1]['task']
+        df = pd.DataFrame([record for record in records if record['task'] == last_task])
+        for column in instrumentation.COUNTERS + ('peak_rss_bytes',):
+            if column not in df.columns:
+                df[column] = 0
+        table = df.groupby('span', sort=False).agg(
+            n=('seconds', 'size'), secondes=('seconds', 'sum'), cpu=('cpu_seconds', 'sum'),
+            lignes_in=('rows_in', 'sum'), lignes_out=('rows_out', 'sum'), lu_mo=('bytes_read', 'sum'),
+            écrit_mo=('bytes_written', 'sum'), pic_rss_mo=('peak_rss_bytes', 'max'))
+        table[['lu_mo', 'écrit_mo', 'pic_rss_mo']] /= 2**20
+        print(table.fillna(0).round(2).to_string())
+        with open(os.path.join(metrics_dir, 'gaz_pipeline.prom')) as f:
+            lines = [line for line in f if line.startswith('gaz_stage_seconds{')]
+        print(f"gaz_pipeline.prom : {len(lines)} étapes, ex. {lines[0].strip()}")
+
+        # /forecast/ : latence par requête servie sur /metrics
+        from api_server import UvicornServer, load_test
+        from bench_api_forecast import PATHS, publish_model
+        model_path, metrics_path = publish_model(workdir)
+        os.environ.update(MODEL_PATH=model_path, METRICS_PATH=metrics_path, REGISTRY_PATH=os.path.join(workdir, 'registry'),
+                          API_METRICS='1')
+        _common.use_api()
+        import main as api
+        with UvicornServer(api.app) as server:
+            result = load_test(server.url, PATHS, n_requests=400, concurrency=8)
+            exposition = requests.get(server.url + '/metrics').text
+        count = [line for line in exposition.splitlines()
+                 if line.startswith('gaz_stage_duration_seconds_count') and 'forecast_request' in line]
+        print(f"/forecast/ p50 {result['p50']:.1f} ms ; /metrics : {count[0]}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import _common
+
+
+# Exécuté dans un interpréteur neuf : temps d'import + chargement comme au démarrage de l'API
+def measure(path):
+    start = time.perf_counter()
+    from src.compact_model import load_forecaster
+    model = load_forecaster(path)
+    loaded = time.perf_counter() - start
+    model.get_forecast(steps=7)
+    print(json.dumps({'load': loaded, 'first_forecast': time.perf_counter() - start - loaded,
+                      'rss_mb': _common.peak_rss_mb()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Modèle ARIMA picklé (model.pkl) contre export compact (forecaster.npz).")
+    parser.add_argument('--order', type=int, nargs=3, default=(4, 2, 2))
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--measure', metavar='PATH', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        return measure(args.measure)
+    warnings.simplefilter('ignore')
+
+    import joblib
+    import numpy as np
+    from statsmodels.tsa.arima.model import ARIMA
+    from src.compact_model import CompactForecaster, export_forecaster
+    from bench_warm_start import load_series
+
+    ts = load_series()
+    model_fit = ARIMA(ts, order=tuple(args.order)).fit()
+    print(f"{len(ts)} jours, ARIMA{tuple(args.order)}")
+    workdir = tempfile.mkdtemp(prefix='bench_model_artifact_')
+    try:
+        paths = {'pickle': os.path.join(workdir, 'model.pkl'), 'compact': os.path.join(workdir, 'forecaster.npz')}
+        joblib.dump(model_fit, paths['pickle'])
+        export_forecaster(model_fit, paths['compact'])
+
+        for name, path in paths.items():
+            # Chargement à chaud (modules déjà importés), puis à froid dans un nouveau processus
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                CompactForecaster.load(path) if name == 'compact' else joblib.load(path)
+            warm = (time.perf_counter() - start) / args.repeat
+            output = subprocess.run([sys.executable, __file__, '--measure', path], capture_output=True, text=True,
+                                    check=True).stdout
+            cold = json.loads(output.strip().splitlines()[-1])
+            print(f"{name:8s} {os.path.getsize(path) / 1024:9.1f} Ko  chargement {warm * 1000:7.2f} ms  "
+                  f"à froid (imports compris) {cold['load'] * 1000:7.0f} ms  RSS {cold['rss_mb']:6.0f} Mo")
+
+        compact = CompactForecaster.load(paths['compact'])
+        for steps in (7, 30):
+            reference, forecast = model_fit.get_forecast(steps=steps), compact.get_forecast(steps=steps)
+            mean_diff = np.max(np.abs(reference.predicted_mean.to_numpy() - forecast.predicted_mean.to_numpy()))
+            se_diff = np.max(np.abs(reference.se_mean.to_numpy() - forecast.se_mean.to_numpy()))
+            same_dates = reference.predicted_mean.index.equals(forecast.predicted_mean.index)
+            print(f"{steps:2d} jours : écart max prévision {mean_diff:.2e}, écart-type {se_diff:.2e}, "
+                  f"mêmes dates {same_dates}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
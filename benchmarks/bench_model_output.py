@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import _common
+from src import model_output
+from src.model_output import build_output, output_arrays, read_output, write_output
+
+METRICS = {"MAE": 3.1, "MSE": 14.2, "RMSE": 3.8, "ACF1": 0.1, "MAPE": 12.5}
+
+
+# Série journalière synthétique de `years` années avec quelques jours manquants
+def synthetic(years):
+    rng = np.random.default_rng(0)
+    index = pd.date_range('2000-01-01', periods=int(365.25 * years), freq='D')
+    values = 30 + 10 * np.sin(np.arange(len(index)) * 2 * np.pi / 365.25) + rng.normal(0, 5, len(index))
+    values[rng.random(len(index)) < 0.02] = np.nan
+    ts = pd.Series(values, index=index)
+    in_sample = ts[-7:] + rng.normal(0, 1, 7)
+    forecast = pd.Series(rng.normal(30, 5, 7), index=pd.date_range(index[-1] + pd.Timedelta(days=1), periods=7))
+    return ts, in_sample, forecast
+
+
+# Ancienne construction : un dict par jour (strftime par ligne) puis json.dumps(indent=4)
+def legacy_output(ts, in_sample, forecast):
+    forecast_data = [{"date": date.strftime("%Y-%m-%d"), "value": value, "type": "forecast"}
+                     for date, value in forecast.items()]
+    historical_data = [{"date": date.strftime("%Y-%m-%d"), "value": value, "type": "historical"}
+                       for date, value in ts.items()]
+    in_sample_data = [{"date": date.strftime("%Y-%m-%d"), "value": value, "type": "historical_forecast"}
+                      for date, value in in_sample.items()]
+    return {"metrics": METRICS, "data": historical_data + in_sample_data + forecast_data}
+
+
+def timed(call, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = call()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sortie de run_model_and_forecast : lignes JSON contre colonnes.")
+    parser.add_argument('--years', type=float, nargs='+', default=[4, 20])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_model_output_')
+    try:
+        for years in args.years:
+            ts, in_sample, forecast = synthetic(years)
+            series = {'historical': (ts.index, ts.to_numpy()), 'historical_forecast': (in_sample.index, in_sample.to_numpy()),
+                      'forecast': (forecast.index, forecast.to_numpy())}
+            print(f"{years:g} ans, {len(ts)} jours")
+            paths = {}
+
+            # Construction + écriture
+            def legacy_write():
+                with open(os.path.join(workdir, 'legacy.json'), 'w') as f:
+                    json.dump([legacy_output(ts, in_sample, forecast), METRICS], f, indent=4)
+            build, _ = timed(legacy_write, args.repeat)
+            paths['lignes indent=4'] = os.path.join(workdir, 'legacy.json')
+            print(f"  {'lignes indent=4':<22} écriture {build:8.1f} ms  "
+                  f"{os.path.getsize(paths['lignes indent=4']) / 1024:8.0f} Ko")
+
+            orjson = model_output.orjson
+            for label, path, fast in (('colonnes json', 'columns_json.json', False),
+                                      ('colonnes orjson', 'columns.json', True),
+                                      ('colonnes parquet', 'columns.parquet', True)):
+                model_output.orjson = orjson if fast else None
+                path = os.path.join(workdir, path)
+                build, _ = timed(lambda: write_output(build_output(METRICS, series), path), args.repeat)
+                paths[label] = path
+                print(f"  {label:<22} écriture {build:8.1f} ms  {os.path.getsize(path) / 1024:8.0f} Ko")
+            model_output.orjson = orjson
+
+            # Lecture côté API jusqu'aux tableaux de l'historique
+            def legacy_read():
+                with open(paths['lignes indent=4']) as f:
+                    return output_arrays(json.load(f))
+            for label, read in (('lignes indent=4', legacy_read),
+                                ('colonnes orjson', lambda: read_output(paths['colonnes orjson'])),
+                                ('colonnes parquet', lambda: read_output(paths['colonnes parquet']))):
+                seconds, arrays = timed(read, args.repeat)
+                print(f"  lecture {label:<22} {seconds:8.1f} ms")
+                dates, values = arrays['series']['historical']
+                assert np.array_equal(dates, ts.index.to_numpy(dtype='datetime64[D]'))
+                assert np.allclose(values, ts.to_numpy(), equal_nan=True)
+        print("mêmes séries dans tous les formats")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import warnings
+
+import _common  # noqa: F401
+from bench_warm_start import daily_view, load_series
+from src.order_selection import OrderSearch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recherche d'ordre ARIMA : grille, élagage, pas à pas et cache.")
+    parser.add_argument('--max-p', type=int, default=4)
+    parser.add_argument('--max-q', type=int, default=4)
+    parser.add_argument('--criterion', default='aic')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    ts = load_series()
+    print(f"{len(ts)} jours ZAG PARIS, workers={args.workers}")
+    workdir = tempfile.mkdtemp(prefix='bench_order_selection_')
+    try:
+        variants = [
+            ('grille sans élagage', {'method': 'grid', 'prune_margin': float('inf')}),
+            ('grille avec élagage', {'method': 'grid'}),
+            ('pas à pas', {'method': 'stepwise'}),
+        ]
+        for name, options in variants:
+            search = OrderSearch(max_p=args.max_p, max_q=args.max_q, criterion=args.criterion, workers=args.workers,
+                                 **options)
+            result = search.search(ts)
+            print(f"{name:<20} {result['seconds']:6.2f}s  {result['evaluated']:3d} ajustements  "
+                  f"{result['pruned']:2d} élagués  ordre {result['order']}  {args.criterion}={result['score']:.1f}")
+
+        # Run journalier suivant : un jour de plus et le dernier jour du run précédent réécrit,
+        # l'ordre doit venir du cache
+        search = OrderSearch(max_p=args.max_p, max_q=args.max_q, criterion=args.criterion, workers=args.workers,
+                             cache_path=os.path.join(workdir, 'order_cache.json'))
+        search.select(daily_view(ts, 2, 1), key='ZAG PARIS')
+        searched_at = search.load_cache()['ZAG PARIS']['searched_at']
+        start = time.perf_counter()
+        order = search.select(daily_view(ts, 1, 1), key='ZAG PARIS')
+        cached = search.load_cache()['ZAG PARIS']['searched_at'] == searched_at
+        print(f"run suivant (cache)  {time.perf_counter() - start:6.3f}s  ordre {order}  "
+              f"{'depuis le cache' if cached else 'NOUVELLE RECHERCHE'}")
+        if not cached:
+            raise SystemExit("le dernier jour réécrit ne doit pas invalider l'ordre en cache")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
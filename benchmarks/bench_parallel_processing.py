@@ -0,0 +1,46 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import _common  # noqa: F401
+from synthetic_lcsqa import write_days
+from src.gaz_data_processor import GazDataProcessor
+
+
+def run(raw, output_folder, workers):
+    os.makedirs(output_folder)
+    start = time.perf_counter()
+    summary = GazDataProcessor(raw, output_folder).process_csv_files(workers=workers, raise_on_error=False)
+    return time.perf_counter() - start, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GazDataProcessor séquentiel contre pool de processus.")
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--zones', type=int, default=20)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count()])
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_parallel_')
+    try:
+        raw = os.path.join(workdir, 'raw')
+        write_days(raw, n_days=args.days, zones=args.zones)
+        # Un fichier corrompu : il doit échouer seul sans interrompre les autres.
+        with open(os.path.join(raw, 'FR_E2_1999-01-01.csv'), 'w') as f:
+            f.write('Polluant;Zas;Date de fin\nNO2;ZAG PARIS;pas une date\n')
+        print(f"cpu_count={os.cpu_count()}, {args.days} fichiers + 1 corrompu")
+
+        baseline = None
+        for workers in sorted(set(args.workers)):
+            seconds, summary = run(raw, os.path.join(workdir, f'out_{workers}'), workers)
+            baseline = baseline or seconds
+            print(f"workers={workers:<3} {seconds:7.2f}s  x{baseline / seconds:4.1f}  "
+                  f"processed={len(summary['processed'])} failed={list(summary['failed'])}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+import _common
+from src.parquet_store import PartitionedParquetStore
+
+
+# Ancien comportement de concatenate_and_save : relecture, concaténation et réécriture du fichier entier.
+def append_legacy(file_path, new_rows):
+    combined_df = new_rows
+    if os.path.exists(file_path):
+        existing_df = pd.read_parquet(file_path)
+        combined_df = pd.concat([existing_df, new_rows]).drop_duplicates().reset_index(drop=True)
+    combined_df.to_parquet(file_path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parquet : réécriture complète contre store partitionné.")
+    parser.add_argument('--history', default=os.path.join(os.path.dirname(__file__), '..', 'dags', 'data',
+                                                          'gazs_output_parquet', 'ZAG_PARIS_combined_output.parquet'))
+    parser.add_argument('--days', type=int, default=10)
+    args = parser.parse_args()
+
+    history = pd.read_parquet(args.history)
+    last_day = pd.to_datetime(history['date de fin']).max()
+    template = history[pd.to_datetime(history['date de fin']) == last_day]
+    print(f"historique : {len(history)} lignes, {os.path.getsize(args.history) / 2**20:.1f} Mo")
+
+    workdir = tempfile.mkdtemp(prefix='bench_parquet_store_')
+    try:
+        legacy_file = os.path.join(workdir, 'combined.parquet')
+        history.to_parquet(legacy_file, index=False)
+        store = PartitionedParquetStore(os.path.join(workdir, 'store'))
+        store.import_file(legacy_file)
+
+        timings = {'legacy': 0.0, 'store': 0.0}
+        for day in range(1, args.days + 1):
+            new_rows = template.copy()
+            new_rows['date de fin'] = (last_day + pd.Timedelta(days=day)).strftime('%Y-%m-%d')
+            new_rows['file_date'] = pd.Series(last_day + pd.Timedelta(days=day), index=new_rows.index).astype(history['file_date'].dtype)
+            start = time.perf_counter()
+            append_legacy(legacy_file, new_rows)
+            timings['legacy'] += time.perf_counter() - start
+            start = time.perf_counter()
+            store.append(new_rows)
+            timings['store'] += time.perf_counter() - start
+
+        for name, seconds in timings.items():
+            print(f"{name:<7} {seconds / args.days * 1000:8.1f} ms par jour ajouté")
+        start = time.perf_counter()
+        recent = store.read(columns=['date de fin', 'valeur'], start=last_day)
+        print(f"lecture store (mois récents, 2 colonnes) : {len(recent)} lignes en "
+              f"{(time.perf_counter() - start) * 1000:.1f} ms, pic RSS {_common.peak_rss_mb():.0f} Mo")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+import _common
+from src.gaz_data_parquet import CSVtoParquetProcessor
+from src.manifest import output_name
+from synthetic_lcsqa import lcsqa_filename
+
+OUTPUT_COLUMNS = ['Date de fin', 'Polluant', 'Zas', "type d'implantation", "type d'influence", "type d'évaluation",
+                  'procédure de mesure', 'valeur', 'code qualité', 'unité de mesure']
+
+
+# Écrit des sorties de GazDataProcessor (*_output.csv) : paris_rows lignes ZAG PARIS par fichier
+# (une clé distincte par ligne) et autant de lignes d'autres zones, écartées par le filtre.
+def write_outputs(folder, n_files, paris_rows, seed=0):
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    for offset in range(n_files):
+        day = date(2024, 1, 1) + timedelta(days=offset)
+        n_rows = 2 * paris_rows
+        df = pd.DataFrame({
+            'Date de fin': day.isoformat(),
+            'Polluant': [f'P{i % paris_rows:05d}' for i in range(n_rows)],
+            'Zas': np.where(np.arange(n_rows) < paris_rows, 'ZAG PARIS', 'ZAG LYON'),
+            "type d'implantation": 'Urbaine',
+            "type d'influence": 'Fond',
+            "type d'évaluation": 'mesures fixes',
+            'procédure de mesure': 'Auto NO app AC32M',
+            'valeur': np.round(rng.lognormal(3, 0.3, n_rows), 6),
+            'code qualité': 'A',
+            'unité de mesure': 'µg-m3',
+        }, columns=OUTPUT_COLUMNS)
+        df.to_csv(os.path.join(folder, output_name(lcsqa_filename(day))), index=False)
+
+
+def convert(mode, input_folder, output_folder):
+    processor = CSVtoParquetProcessor(input_folder, output_folder)
+    if mode == 'stream':
+        return processor.stream_files()
+    processor.process_files()
+    processor.concatenate_and_save()
+
+
+# Exécuté dans un processus neuf pour que le pic RSS ne mesure que ce mode.
+def measure(mode, input_folder, output_folder):
+    baseline_rss = _common.peak_rss_mb()
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        start = time.perf_counter()
+        convert(mode, input_folder, output_folder)
+        seconds = time.perf_counter() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    print(json.dumps({'seconds': seconds, 'peak_rss_mb': _common.peak_rss_mb() - baseline_rss}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CSV -> Parquet : accumulation en mémoire contre écriture en flux.")
+    parser.add_argument('--files', type=int, nargs='+', default=[30, 120])
+    parser.add_argument('--paris-rows', type=int, default=5000)
+    parser.add_argument('--measure', nargs=3, metavar=('MODE', 'INPUT', 'OUTPUT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        return measure(*args.measure)
+
+    workdir = tempfile.mkdtemp(prefix='bench_parquet_streaming_')
+    try:
+        for n_files in args.files:
+            raw = os.path.join(workdir, f'outputs_{n_files}')
+            write_outputs(raw, n_files, args.paris_rows)
+            rows = n_files * args.paris_rows
+            stores = {}
+            for mode in ('batch', 'stream'):
+                output_folder = os.path.join(workdir, f'{mode}_{n_files}')
+                os.makedirs(output_folder)
+                output = subprocess.run([sys.executable, __file__, '--measure', mode, raw, output_folder],
+                                        check=True, capture_output=True, text=True).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                stores[mode] = CSVtoParquetProcessor(raw, output_folder).store
+                written = sum(os.path.getsize(stores[mode].partition_path(p)) for p in stores[mode].partitions())
+                print(f"{n_files:4d} fichiers  {mode:<6} {result['seconds']:6.2f}s  {rows / result['seconds']:9.0f} lignes/s  "
+                      f"{written / 2**20:6.1f} Mo écrits  pic RSS +{result['peak_rss_mb']:6.1f} Mo")
+
+            batch = stores['batch'].read().drop(columns='processing_date')
+            stream = stores['stream'].read().drop(columns='processing_date')
+            pd.testing.assert_frame_equal(batch, stream, check_dtype=False)
+        print("contenu des stores identique entre les deux modes")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+import _common
+from synthetic_lcsqa import write_days
+from src.gaz_data_parquet import CSVtoParquetProcessor
+from src.gaz_data_processor import GazDataProcessor
+from src.pipeline import GazPipeline
+
+
+# 'staged' : GazDataProcessor (*_output.csv) puis CSVtoParquetProcessor ; 'fused' : GazPipeline
+def run(mode, raw, workdir, workers):
+    parquet_folder = os.path.join(workdir, 'parquet')
+    os.makedirs(parquet_folder)
+    if mode == 'fused':
+        GazPipeline(raw, parquet_folder).run(workers=workers)
+        return
+    csv_folder = os.path.join(workdir, 'csv')
+    os.makedirs(csv_folder)
+    GazDataProcessor(raw, csv_folder).process_csv_files(workers=workers)
+    CSVtoParquetProcessor(csv_folder, parquet_folder).stream_files()
+
+
+# Exécuté dans un processus neuf : compteurs d'E/S propres au mode mesuré.
+def measure(mode, raw, workdir, workers):
+    read_before, written_before = _common.io_bytes()
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        start = time.perf_counter()
+        run(mode, raw, workdir, int(workers))
+        seconds = time.perf_counter() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    read_after, written_after = _common.io_bytes()
+    print(json.dumps({'seconds': seconds, 'read': read_after - read_before, 'written': written_after - written_before}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Étapes séparées (CSV intermédiaire) contre pipeline fusionné.")
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--zones', type=int, default=40)
+    parser.add_argument('--measure', nargs=4, metavar=('MODE', 'RAW', 'WORKDIR', 'WORKERS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        return measure(*args.measure)
+
+    workdir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    try:
+        raw = os.path.join(workdir, 'raw')
+        names = write_days(raw, n_days=args.days, zones=args.zones)
+        size_mb = sum(os.path.getsize(os.path.join(raw, name)) for name in names) / 2**20
+        print(f"{len(names)} fichiers bruts, {size_mb:.0f} Mo (E/S en une seule passe de processus, workers=1)")
+
+        stores = {}
+        for mode in ('staged', 'fused'):
+            mode_dir = os.path.join(workdir, mode)
+            os.makedirs(mode_dir)
+            output = subprocess.run([sys.executable, __file__, '--measure', mode, raw, mode_dir, '1'],
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{mode:<7} {result['seconds']:6.2f}s  lu {result['read'] / 2**20:7.1f} Mo  "
+                  f"écrit {result['written'] / 2**20:6.1f} Mo")
+            stores[mode] = CSVtoParquetProcessor(None, os.path.join(mode_dir, 'parquet')).store
+
+        # Le store doit être identique quel que soit le mode (hors horodatage du run).
+        staged = stores['staged'].read().drop(columns='processing_date')
+        fused = stores['fused'].read().drop(columns='processing_date')
+        pd.testing.assert_frame_equal(staged, fused)
+        print(f"stores identiques ({len(fused)} lignes ZAG PARIS)")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+
+import _common
+from src.parquet_store import PartitionedParquetStore
+from src.query import ObservationQuery
+
+DATA_FOLDER = os.path.join(_common.ROOT, 'dags', 'data', 'gazs_output_parquet')
+
+
+# Ancienne lecture de run_model_and_forecast : les deux sources complètes, puis moyenne par jour en pandas
+def legacy_daily_mean(historical, store):
+    df = pd.concat([pd.read_parquet(historical, columns=['date de fin', 'valeur']),
+                    PartitionedParquetStore(store).read(columns=['date de fin', 'valeur'])])
+    df['date de fin'] = pd.to_datetime(df['date de fin'])
+    ts = df.sort_values('date de fin').set_index('date de fin')['valeur']
+    return ts.groupby(ts.index).mean().asfreq('D')
+
+
+# Ancienne lecture côté client : tout le store, filtre et moyenne mensuelle en pandas
+def legacy_monthly(store, start, end, polluant):
+    df = pd.read_parquet(store)
+    df = df[(df['date de fin'] >= start) & (df['date de fin'] <= end) & (df['polluant'] == polluant)]
+    return df.groupby([df['date de fin'].dt.to_period('M'), 'zas'], observed=True)['valeur'].mean()
+
+
+def measured(func):
+    read_before = _common.io_bytes()[0]
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000, (_common.io_bytes()[0] - read_before) / 2**20
+
+
+# Store toutes zones synthétique : une valeur par (jour, zone, polluant), un commit par mois comme le DAG
+def synthetic_store(root, months, zones, seed=0):
+    rng = np.random.default_rng(seed)
+    store = PartitionedParquetStore(root)
+    for month in pd.period_range('2023-01', periods=months, freq='M'):
+        days = pd.date_range(month.start_time, month.end_time.normalize(), freq='D')
+        keys = pd.MultiIndex.from_product([days, [f'ZONE {i:03d}' for i in range(zones)], ['NO2', 'O3', 'PM10', 'PM25']],
+                                          names=['date de fin', 'zas', 'polluant']).to_frame(index=False)
+        keys['valeur'] = rng.lognormal(3, 0.4, len(keys))
+        keys["type d'implantation"] = 'Urbaine'
+        keys['procédure de mesure'] = 'Auto'
+        keys['code qualité'] = 'A'
+        keys['file_date'] = keys['date de fin']
+        keys['processing_date'] = '20240101_000000'
+        store.append(keys)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Couche de requête : projection, filtres poussés et agrégats journaliers.")
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--zones', type=int, default=60)
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_query_')
+    try:
+        # 1. Série du modèle sur les vraies données (main_data.parquet + store ZAG PARIS)
+        historical = os.path.join(workdir, 'main_data.parquet')
+        shutil.copy(os.path.join(DATA_FOLDER, 'main_data.parquet'), historical)
+        paris = os.path.join(workdir, 'ZAG_PARIS_dataset')
+        PartitionedParquetStore(paris).import_file(os.path.join(DATA_FOLDER, 'ZAG_PARIS_combined_output.parquet'))
+        expected, legacy_ms, legacy_mb = measured(lambda: legacy_daily_mean(historical, paris))
+        _, cold_ms, cold_mb = measured(lambda: ObservationQuery(historical, paris).daily_mean())
+        ts, warm_ms, warm_mb = measured(lambda: ObservationQuery(historical, paris).daily_mean())
+        pd.testing.assert_series_equal(expected, ts, check_names=False, rtol=1e-12)
+        print(f"série du modèle ({len(ts)} jours) : lignes complètes {legacy_ms:6.1f} ms {legacy_mb:5.2f} Mo lus, "
+              f"agrégats à construire {cold_ms:6.1f} ms, agrégats {warm_ms:6.1f} ms {warm_mb:5.2f} Mo lus ; séries identiques")
+
+        # 2. Coût d'une tranche selon la longueur de l'historique
+        store = synthetic_store(os.path.join(workdir, 'ZAS_dataset'), args.months, args.zones)
+        rows = len(store.read(columns=['valeur']))
+        print(f"store synthétique : {rows} lignes, {args.months} mois, {args.zones} zones")
+        query = ObservationQuery(store.root)
+        first = pd.Timestamp('2023-01-01')
+        for label, end in (('1 mois', first + pd.offsets.MonthEnd(0)),
+                           (f'{args.months} mois', first + pd.offsets.MonthEnd(args.months))):
+            _, legacy_ms, legacy_mb = measured(lambda: legacy_monthly(store.root, first, end, 'NO2'))
+            zones, zones_ms, zones_mb = measured(lambda: query.aggregate('M', start=first, end=end, polluant='NO2'))
+            pooled, pooled_ms, pooled_mb = measured(lambda: query.aggregate('M', start=first, end=end, polluant='NO2',
+                                                                            by=()))
+            print(f"  {label:<9} moyenne mensuelle NO2 : tout le store {legacy_ms:6.1f} ms {legacy_mb:5.2f} Mo, "
+                  f"par zone {zones_ms:6.1f} ms {zones_mb:5.2f} Mo ({len(zones)} lignes), "
+                  f"toutes zones {pooled_ms:5.1f} ms {pooled_mb:5.2f} Mo ({len(pooled)} lignes)")
+
+        # 3. /observations/ servi par l'API
+        from api_server import UvicornServer, load_test
+        os.environ.update(OBSERVATIONS_PATH=store.root, REGISTRY_PATH=os.path.join(workdir, 'registry'),
+                          FORECASTS_PATH=os.path.join(workdir, 'forecasts.parquet'))
+        _common.use_api()
+        import main as api
+        paths = ['/observations/?start=2024-01-01&freq=W&by=polluant&zas=ZONE%20000',
+                 '/observations/?start=2023-06-01&end=2023-06-30&polluant=O3',
+                 '/observations/?freq=M&by=']
+        with UvicornServer(api.app) as server:
+            cold = [measured(lambda: requests.get(server.url + path))[1] for path in paths]
+            response = requests.get(server.url + paths[2] + '&format=arrow')
+            result = load_test(server.url, paths, n_requests=args.requests, concurrency=8)
+        print(f"/observations/ : première requête {max(cold):.1f} ms, puis p50 {result['p50']:.1f} ms, "
+              f"p99 {result['p99']:.1f} ms, {result['rps']:.0f} req/s, {result['errors']} erreurs ; "
+              f"arrow {len(response.content)} octets")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import pandas as pd
+
+import _common
+from local_http import LocalHTTPServer
+from synthetic_lcsqa import write_years
+
+STAGES = ('download', 'processing', 'parquet', 'model')
+# Indicateurs comparés à la référence : débit (plus haut = mieux) et pic mémoire (plus bas = mieux)
+THROUGHPUT = {'download': 'mb_per_s', 'processing': 'rows_per_s', 'parquet': 'rows_per_s',
+              'model': 'series_per_s'}
+
+
+# Volume à l'échelle 1 : années x jours x zones x stations. L'échelle multiplie le nombre de zones,
+# c'est-à-dire la taille de chaque fichier journalier et le nombre de séries à ajuster, comme
+# l'ajout de zones et de stations au réseau.
+def volume(args, scale):
+    return {'years': args.years, 'days': args.days, 'zones': args.zones * scale, 'stations': args.stations}
+
+
+# Exécuté dans un processus neuf par étape : le pic de mémoire (VmHWM) et le CPU sont ceux de l'étape seule.
+# Les étapes enchaînent les dossiers de workdir comme les tâches du DAG 'staged', avec le même manifeste.
+def measure(stage, workdir, url, workers):
+    from src.forecasting import ForecastEngine
+    from src.gaz_data import GazsData
+    from src.gaz_data_parquet import ALL_ZONES_STORE_FOLDER
+    from src.gaz_data_processor import GazDataProcessor
+    from src.manifest import Manifest
+    from src.parquet_store import PartitionedParquetStore
+    raw, processed, parquet = (os.path.join(workdir, name) for name in ('raw', 'processed', 'parquet'))
+    with open(os.path.join(workdir, 'volume.json')) as f:
+        spec = json.load(f)
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    read_before, written_before = _common.io_bytes()
+    cpu_before = cpu_seconds()
+    start = time.perf_counter()
+    try:
+        with Manifest(os.path.join(workdir, 'manifest.sqlite')) as manifest:
+            if stage == 'download':
+                os.makedirs(raw, exist_ok=True)
+                gazs_data = GazsData(raw, manifest=manifest)
+                gazs_data.url = url
+                files = 0
+                for year in spec['years']:
+                    summary = gazs_data.download_csv_files(year, max_workers=8)
+                    assert not summary['failed'], summary['failed']
+                    files += len(summary['downloaded'])
+                counts = {'files': files, 'mb': sum(os.path.getsize(os.path.join(raw, name))
+                                                       for name in os.listdir(raw)) / 2**20}
+            elif stage == 'processing':
+                os.makedirs(processed, exist_ok=True)
+                summary = GazDataProcessor(raw, processed, manifest=manifest).process_csv_files(workers=workers)
+                counts = {'files': len(summary['processed']), 'skipped': len(summary['skipped']),
+                          'rows': spec['raw_rows'], 'mb': spec['raw_mb']}
+            elif stage == 'parquet':
+                counts = convert(processed, parquet, manifest)
+            else:
+                store = PartitionedParquetStore(os.path.join(parquet, ALL_ZONES_STORE_FOLDER))
+                summary = ForecastEngine(workers=workers, min_obs=min(30, spec['days'] - 7)).run(
+                    store, os.path.join(workdir, 'forecasts'))
+                counts = {'series': summary['series'], 'failed': summary['statuses'].get('failed', 0)}
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    seconds = time.perf_counter() - start
+    read_after, written_after = _common.io_bytes()
+    counts.update(seconds=seconds, cpu=cpu_seconds() - cpu_before,
+                  peak_rss_mb=_common.peak_rss_mb(), read_mb=(read_after - read_before) / 2**20,
+                  written_mb=(written_after - written_before) / 2**20)
+    print(json.dumps(counts))
+
+
+# Temps CPU du processus et de ses workers terminés
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return sum(u.ru_utime + u.ru_stime for u in usage)
+
+
+# Conversion des *_output.csv en Parquet (tâche gaz_data_parquet) : store ZAG PARIS, puis store
+# toutes zones lu par forecast_all_series, alimenté à partir des mêmes fichiers.
+def convert(processed, parquet, manifest):
+    from src.gaz_data_parquet import ALL_ZONES_STORE_FOLDER, CSVtoParquetProcessor, store_rows
+    from src.parquet_store import PartitionedParquetStore
+    processor = CSVtoParquetProcessor(processed, parquet, manifest=manifest)
+    pending = [filename for _, filename in processor.pending_files()]
+    summary = processor.stream_files()
+    rows = 0
+    with PartitionedParquetStore(os.path.join(parquet, ALL_ZONES_STORE_FOLDER)).writer() as writer:
+        for filename in pending:
+            df = pd.read_csv(os.path.join(processed, filename), dtype=defaultdict(lambda: str, {'valeur': 'float64'}))
+            rows += len(df)
+            df = store_rows(df, filename, processor.current_timestamp, zas=None)
+            if df is not None:
+                writer.write(df)
+        writer.commit()
+    return {'files': summary['files'], 'rows': rows, 'paris_rows': summary['rows'],
+            'mb': sum(os.path.getsize(os.path.join(processed, name)) for name in pending) / 2**20}
+
+
+def count_rows(folder):
+    rows = 0
+    for name in os.listdir(folder):
+        with open(os.path.join(folder, name), 'rb') as f:
+            rows += max(f.read().count(b'\n') - 1, 0)
+    return rows
+
+
+def run_scale(args, scale, workdir):
+    spec = volume(args, scale)
+    remote = os.path.join(workdir, 'remote')
+    write_years(remote, spec['years'], zones=spec['zones'], stations_per_zone=spec['stations'],
+                malformed_rate=args.malformed, days=spec['days'])
+    spec['raw_rows'] = sum(count_rows(os.path.join(remote, year)) for year in spec['years'])
+    spec['raw_mb'] = sum(os.path.getsize(os.path.join(remote, year, name))
+                         for year in spec['years'] for name in os.listdir(os.path.join(remote, year))) / 2**20
+    with open(os.path.join(workdir, 'volume.json'), 'w') as f:
+        json.dump(spec, f)
+
+    results = []
+    with LocalHTTPServer(remote, latency=args.latency_ms / 1000) as server:
+        for stage in STAGES:
+            output = subprocess.run([sys.executable, __file__, '--measure', stage, workdir, server.url, str(args.workers)],
+                                    check=True, capture_output=True, text=True).stdout
+            counts = json.loads(output.strip().splitlines()[-1])
+            counts.update(scale=scale, stage=stage)
+            results.append(counts)
+    return results
+
+
+def report(results):
+    df = pd.DataFrame(results)
+    df['mb_per_s'] = df['mb'] / df['seconds']
+    df['rows_per_s'] = df['rows'] / df['seconds']
+    df['series_per_s'] = df['series'] / df['seconds']
+    columns = ['scale', 'stage', 'files', 'skipped', 'rows', 'series', 'mb', 'seconds', 'cpu', 'mb_per_s',
+               'rows_per_s', 'series_per_s', 'peak_rss_mb', 'read_mb', 'written_mb']
+    print(df[columns].round(2).to_string(index=False, na_rep='-'))
+
+    # Passage à l'échelle : temps et mémoire rapportés à l'échelle 1 ; un facteur de temps proche
+    # de l'échelle est linéaire, la mémoire des étapes en flux ne doit pas suivre le volume.
+    base = df[df['scale'] == df['scale'].min()].set_index('stage')
+    for _, row in df[df['scale'] != df['scale'].min()].iterrows():
+        reference = base.loc[row['stage']]
+        print(f"x{row['scale']:<4} {row['stage']:<15} temps x{row['seconds'] / reference['seconds']:7.1f}  "
+              f"mémoire x{row['peak_rss_mb'] / reference['peak_rss_mb']:5.2f}")
+    return df
+
+
+# Compare aux résultats d'un run de référence (--output d'un run précédent sur la même machine) :
+# débit en baisse ou pic mémoire en hausse de plus de tolerance par (échelle, étape).
+def regressions(df, reference_path, tolerance):
+    reference = pd.DataFrame(json.load(open(reference_path))).set_index(['scale', 'stage'])
+    problems = []
+    for _, row in df.iterrows():
+        key = (row['scale'], row['stage'])
+        if key not in reference.index:
+            continue
+        expected = reference.loc[key]
+        metric = THROUGHPUT[row['stage']]
+        if row[metric] < expected[metric] * (1 - tolerance):
+            problems.append(f"x{key[0]} {key[1]} : {metric} {row[metric]:.1f} contre {expected[metric]:.1f}")
+        if row['peak_rss_mb'] > expected['peak_rss_mb'] * (1 + tolerance):
+            problems.append(f"x{key[0]} {key[1]} : peak_rss_mb {row['peak_rss_mb']:.0f} "
+                            f"contre {expected['peak_rss_mb']:.0f}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Passage à l'échelle de bout en bout : téléchargement, traitement, "
+                                                 "Parquet et modèle à 1x/10x/100x du volume de base.")
+    parser.add_argument('--scales', default='1,10,100')
+    parser.add_argument('--years', nargs='+', default=['2024'])
+    parser.add_argument('--days', type=int, default=45, help="jours par année")
+    parser.add_argument('--zones', type=int, default=1, help="zones à l'échelle 1")
+    parser.add_argument('--stations', type=int, default=4, help="stations par zone")
+    parser.add_argument('--malformed', type=float, default=0.03, help="part de fichiers défectueux")
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--output', help="écrit les résultats en JSON (future référence)")
+    parser.add_argument('--reference', help="résultats JSON d'un run précédent ; code de sortie 1 en cas de régression")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--measure', nargs=4, metavar=('STAGE', 'WORKDIR', 'URL', 'WORKERS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        stage, workdir, url, workers = args.measure
+        return measure(stage, workdir, url, int(workers))
+
+    results = []
+    for scale in map(int, args.scales.split(',')):
+        workdir = tempfile.mkdtemp(prefix=f'bench_scaling_{scale}x_')
+        try:
+            spec = volume(args, scale)
+            print(f"x{scale} : {len(spec['years'])} année(s) x {spec['days']} jours, {spec['zones']} zones x "
+                  f"{spec['stations']} stations ({args.workers} processus, {os.cpu_count()} CPU)", flush=True)
+            results += run_scale(args, scale, workdir)
+        finally:
+            shutil.rmtree(workdir)
+
+    df = report(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(df.to_dict(orient='records'), f, indent=1, default=float)
+    if args.reference:
+        problems = regressions(df, args.reference, args.tolerance)
+        for problem in problems:
+            print(f"RÉGRESSION {problem}")
+        if problems:
+            sys.exit(1)
+        print(f"aucune régression au-delà de {args.tolerance:.0%} par rapport à {args.reference}")
+
+
+if __name__ == "__main__":
+    main()
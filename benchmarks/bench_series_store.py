@@ -0,0 +1,259 @@
+import argparse
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import date
+
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import requests
+
+import _common
+from api_server import load_test
+from bench_api_forecast import publish_model
+from bench_warm_start import load_series
+from src.compact_model import export_forecaster
+from src.forecasting import FORECASTS_FILE, _write_atomic, write_forecast_series
+from src.model_output import OUTPUT_KEYS, build_output, dumps, output_series
+from src.registry import ModelRegistry
+from src.series_store import FORECAST_SERIES_FILE, MODEL_SERIES_FILE, write_series
+
+MODES = {'fichiers analysés': False, 'mmap': True}
+
+
+# Historique du modèle : la série réelle, ou une série synthétique de `days` jours finissant aujourd'hui
+def history(days):
+    if not days:
+        return load_series()
+    index = pd.date_range(end=pd.Timestamp.today().normalize(), periods=days, freq='D')
+    return pd.Series(np.random.default_rng(0).lognormal(3, 0.4, days), index=index)
+
+
+# Version du registre telle que publiée par run_model (forecaster.npz, metrics.json, et series.bin
+# avec mmap) et prévisions par série de forecast_all_series (forecasts.parquet, et forecasts.bin avec mmap)
+def publish(folder, ts, n_series, horizon, mmap):
+    model_path, _ = publish_model(folder)
+    forecaster_path = os.path.join(folder, 'forecaster.npz')
+    export_forecaster(joblib.load(model_path), forecaster_path)
+    forecast_index = pd.date_range(ts.index[-1] + pd.Timedelta(days=1), periods=7, freq='D')
+    output = build_output({'MAE': 3.1, 'MSE': 14.2, 'RMSE': 3.8, 'ACF1': 0.1, 'MAPE': 12.5}, {
+        'historical': (ts.index, ts.to_numpy()),
+        'historical_forecast': (ts.index[-7:], ts.to_numpy()[-7:] * 1.05),
+        'forecast': (forecast_index, np.full(7, ts.iloc[-30:].mean())),
+    })
+    files = {'forecaster.npz': forecaster_path, 'metrics.json': dumps(output)}
+    if mmap:
+        files[MODEL_SERIES_FILE] = os.path.join(folder, MODEL_SERIES_FILE)
+        write_series(files[MODEL_SERIES_FILE], output_series(output), OUTPUT_KEYS, metadata=output['metrics'])
+    ModelRegistry(os.path.join(folder, 'registry')).publish(files)
+
+    forecasts_folder = os.path.join(folder, 'forecasts')
+    os.makedirs(forecasts_folder)
+    zones = [f'ZONE {i:04d}' for i in range(n_series // 4)]
+    pollutants = ['NO2', 'O3', 'PM10', 'PM25']
+    dates = pd.date_range(pd.Timestamp(date.today()), periods=horizon, freq='D').to_numpy()
+    n = len(zones) * len(pollutants)
+    forecasts = pa.table({
+        'zas': pa.array(np.repeat(zones, len(pollutants) * horizon).astype(object), pa.string()).dictionary_encode(),
+        'polluant': pa.array(np.tile(np.repeat(pollutants, horizon), len(zones)).astype(object), pa.string())
+        .dictionary_encode(),
+        'date': pa.array(np.tile(dates, n), pa.timestamp('ns')),
+        'forecast': pa.array(np.random.default_rng(1).lognormal(3, 0.4, n * horizon).astype(np.float32), pa.float32()),
+    })
+    _write_atomic(forecasts, os.path.join(forecasts_folder, FORECASTS_FILE))
+    if mmap:
+        write_forecast_series(forecasts, os.path.join(forecasts_folder, FORECAST_SERIES_FILE))
+    return {'zones': zones, 'pollutants': pollutants, 'registry': os.path.join(folder, 'registry'),
+            'forecasts': os.path.join(forecasts_folder, FORECASTS_FILE)}
+
+
+def api_env(published, folder):
+    return dict(os.environ, PYTHONPATH=os.path.join(_common.ROOT, 'dags'), REGISTRY_PATH=published['registry'],
+                FORECASTS_PATH=published['forecasts'], MODEL_PATH=os.path.join(folder, 'absent.pkl'),
+                METRICS_PATH=os.path.join(folder, 'absent.json'), OBSERVATIONS_PATH=os.path.join(folder, 'absent'),
+                MODEL_RELOAD_INTERVAL='60')
+
+
+# Un processus neuf par mode : coût de l'ouverture de la version et des prévisions, puis des requêtes
+# non cachées (tranche de l'historique sans réduction, lot de prévisions) dans un seul worker
+def measure(folder, n_queries):
+    _common.use_api()
+    from forecast_batch import ForecastTable
+    from forecast_cache import ForecastCache, default_source
+    from history import HistoryIndex
+    env = api_env(publish_args(folder), folder)
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        cache = ForecastCache(default_source(env['REGISTRY_PATH'], env['MODEL_PATH'], env['METRICS_PATH']))
+        cache.refresh()
+        table = ForecastTable(env['FORECASTS_PATH'])
+        keys = sorted(table.series())
+        load_ms = (time.perf_counter() - start) * 1000
+        rss_loaded = current_rss_mb()
+
+        index = HistoryIndex(cache.series)
+        last = index.store.get(('historical',))[0][-1]
+        rng = random.Random(0)
+        start = time.perf_counter()
+        for _ in range(n_queries):
+            days = rng.choice([30, 365, 3650])
+            index.query(start=last - np.timedelta64(days, 'D'))
+        history_us = (time.perf_counter() - start) / n_queries * 1e6
+        queries = [{'zas': zas, 'polluant': polluant, 'horizon': 7} for zas, polluant in rng.sample(keys, 50)]
+        start = time.perf_counter()
+        for _ in range(n_queries):
+            table.select(queries)
+        batch_us = (time.perf_counter() - start) / n_queries * 1e6
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    print(f"{load_ms:.1f} {rss_loaded - rss_before:.1f} {history_us:.1f} {batch_us:.1f}")
+
+
+def publish_args(folder):
+    return {'registry': os.path.join(folder, 'registry'),
+            'forecasts': os.path.join(folder, 'forecasts', FORECASTS_FILE)}
+
+
+def current_rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+# Rss, Pss (pages partagées divisées entre les processus qui les mappent) et Uss (pages privées) en Mo
+def memory_mb(pid):
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {'rss': fields['Rss'], 'pss': fields['Pss'],
+            'uss': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)}
+
+
+# Workers de uvicorn --workers : processus enfants lancés par multiprocessing (hors resource_tracker)
+def worker_pids(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        children = f.read().split()
+    pids = []
+    for child in children:
+        with open(f'/proc/{child}/cmdline', 'rb') as f:
+            cmdline = f.read()
+        if b'resource_tracker' not in cmdline:
+            pids.append(int(child))
+    return pids
+
+
+# Serveur uvicorn à `workers` processus, chacun chauffé par les requêtes avant la mesure de sa mémoire.
+# Latence d'un client seul (temps de réponse), puis sous charge (8 clients, file d'attente comprise).
+def serve_and_measure(published, folder, workers, paths, n_requests):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    url = f'http://127.0.0.1:{port}'
+    server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--workers', str(workers),
+                               '--log-level', 'warning', '--no-access-log'],
+                              cwd=os.path.join(_common.ROOT, 'api'), env=api_env(published, folder),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 120
+        while time.time() < deadline:
+            try:
+                if requests.get(url + '/model/', timeout=1).status_code == 200 and len(worker_pids(server.pid)) == workers:
+                    break
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.2)
+        load_test(url, paths, n_requests=100 * workers, concurrency=2 * workers)
+        sequential = load_test(url, paths, n_requests=n_requests, concurrency=1)
+        loaded = load_test(url, paths, n_requests=n_requests, concurrency=8)
+        memory = [memory_mb(pid) for pid in worker_pids(server.pid)]
+    finally:
+        server.terminate()
+        server.wait()
+    return sequential, loaded, memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Séries mappées en mémoire dans l'API : RSS par worker et temps de "
+                                                 "réponse contre metrics.json et forecasts.parquet chargés par worker.")
+    parser.add_argument('--series', type=int, default=4000, help="séries (zone, polluant) prévues")
+    parser.add_argument('--horizon', type=int, default=30, help="jours de prévision par série")
+    parser.add_argument('--jours-historique', type=int, default=0, help="historique synthétique (0 : série réelle)")
+    parser.add_argument('--workers', type=int, default=4, help="workers uvicorn")
+    parser.add_argument('--requests', type=int, default=600)
+    parser.add_argument('--queries', type=int, default=300, help="requêtes non cachées par mesure en processus")
+    parser.add_argument('--measure', nargs=2, metavar=('FOLDER', 'QUERIES'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        folder, queries = args.measure
+        return measure(folder, int(queries))
+
+    warnings.simplefilter('ignore')
+    workdir = tempfile.mkdtemp(prefix='bench_series_store_')
+    try:
+        ts = history(args.jours_historique)
+        print(f"historique {len(ts)} jours, {args.series} séries x {args.horizon} jours de prévision, "
+              f"{args.workers} workers uvicorn ({os.cpu_count()} CPU)")
+        published = {}
+        stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            for label, mmap in MODES.items():
+                folder = os.path.join(workdir, 'mmap' if mmap else 'parsed')
+                os.makedirs(folder)
+                published[label] = dict(publish(folder, ts, args.series, args.horizon, mmap), folder=folder)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        version = ModelRegistry(published['mmap']['registry']).current_version()
+        sizes = {name: os.path.getsize(path) / 2**20 for name, path in (
+            ('metrics.json', ModelRegistry(published['mmap']['registry']).path(version, 'metrics.json')),
+            ('series.bin', ModelRegistry(published['mmap']['registry']).path(version, MODEL_SERIES_FILE)),
+            ('forecasts.parquet', published['mmap']['forecasts']),
+            ('forecasts.bin', os.path.join(os.path.dirname(published['mmap']['forecasts']), FORECAST_SERIES_FILE)))}
+        print('fichiers : ' + ', '.join(f"{name} {size:.2f} Mo" for name, size in sizes.items()))
+
+        # 1. Un worker : ouverture de la version et requêtes non cachées
+        for label in MODES:
+            output = subprocess.run([sys.executable, __file__, '--measure', published[label]['folder'], str(args.queries)],
+                                    check=True, capture_output=True, text=True).stdout
+            load_ms, rss_mb, history_us, batch_us = map(float, output.split())
+            print(f"{label:<18} chargement {load_ms:7.1f} ms (+{rss_mb:5.1f} Mo RSS), tranche d'historique "
+                  f"{history_us:7.1f} µs, lot de 50 séries {batch_us:7.1f} µs")
+
+        # 2. Plusieurs workers uvicorn : mémoire par worker après chauffe, latence sous charge
+        rng = random.Random(0)
+        zones, pollutants = published['mmap']['zones'], published['mmap']['pollutants']
+        batches = [{'queries': [{'zas': rng.choice(zones), 'polluant': rng.choice(pollutants), 'horizon': 7}
+                                for _ in range(50)]} for _ in range(20)]
+        paths = ['/history/?points=500', '/history/?types=historical&start=2023-01-01', '/forecast/?option=4',
+                 *[('/forecast/batch?format=arrow', batch) for batch in batches]]
+        for label in MODES:
+            sequential, loaded, memory = serve_and_measure(published[label], published[label]['folder'], args.workers,
+                                                           paths, args.requests)
+            mean = {key: np.mean([m[key] for m in memory]) for key in ('rss', 'pss', 'uss')}
+            print(f"{label:<18} par worker : RSS {mean['rss']:6.1f} Mo, PSS {mean['pss']:6.1f} Mo, "
+                  f"USS {mean['uss']:6.1f} Mo ; PSS total {sum(m['pss'] for m in memory):6.1f} Mo")
+            print(f"{'':<18} 1 client p50 {sequential['p50']:5.1f} ms p99 {sequential['p99']:5.1f} ms ; "
+                  f"8 clients p50 {loaded['p50']:5.1f} ms p99 {loaded['p99']:5.1f} ms {loaded['rps']:.0f} req/s ; "
+                  f"{sequential['errors'] + loaded['errors']} erreurs")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
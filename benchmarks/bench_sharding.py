@@ -0,0 +1,137 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import _common  # noqa: F401
+from synthetic_lcsqa import write_days
+from src import sharding
+from src.forecasting import FORECASTS_FILE, METRICS_FILE, ForecastEngine
+from src.gaz_data_parquet import ALL_ZONES_STORE_FOLDER, STORE_FOLDER
+from src.manifest import Manifest
+from src.parquet_store import PartitionedParquetStore
+from src.pipeline import GazPipeline
+
+
+def manifest_for(raw, path, names):
+    with Manifest(path) as manifest:
+        for name in names:
+            manifest.record_download(name, os.path.getsize(os.path.join(raw, name)), None)
+    return path
+
+
+# Exécution du mode 'mapped' de dags/dag.py hors Airflow : chaque tâche mappée devient un appel par
+# shard sur un pool de processus (les workers Celery), avec les mêmes arguments que les XComs.
+def expand(executor, fn, plan, **fixed):
+    return list(executor.map(_call, [fn] * len(plan), plan, [fixed] * len(plan)))
+
+
+def _call(fn, args, fixed):
+    return fn(*args, **fixed)
+
+
+def run_mapped(raw, parquet, manifest_path, forecasts, shards, workers, retried_shard=False):
+    timings = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        start = time.perf_counter()
+        plan = sharding.plan_processing(raw, parquet, manifest_path, shards)
+        results = expand(executor, sharding.process_shard, plan, input_folder=raw, output_folder_parquet=parquet)
+        if retried_shard:
+            # Shard perdu puis relancé par Airflow : il réécrit les mêmes fichiers de staging
+            results[0] = sharding.process_shard(*plan[0], input_folder=raw, output_folder_parquet=parquet)
+        partitions = sharding.plan_partitions(results)
+        merged = expand(executor, sharding.merge_partition, partitions, output_folder_parquet=parquet)
+        if retried_shard:
+            merged[0] = sharding.merge_partition(*partitions[0], output_folder_parquet=parquet)
+        sharding.commit_processing(manifest_path, results, merged)
+        timings['traitement'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        store_root = os.path.join(parquet, ALL_ZONES_STORE_FOLDER)
+        plan = sharding.plan_series(store_root, forecasts, shards)
+        fitted = expand(executor, sharding.fit_series_shard, plan, store_root=store_root)
+        sharding.commit_forecasts(forecasts, fitted)
+        timings['prévisions'] = time.perf_counter() - start
+    return timings, {'lots': len(results), 'partitions': len(merged), 'shards de séries': len(plan)}
+
+
+def run_single(raw, parquet, manifest_path, forecasts, workers):
+    timings = {}
+    with Manifest(manifest_path) as manifest:
+        start = time.perf_counter()
+        GazPipeline(raw, parquet, manifest=manifest, all_zones=True).run(workers=workers)
+        timings['traitement'] = time.perf_counter() - start
+    start = time.perf_counter()
+    ForecastEngine(workers=workers).run(PartitionedParquetStore(os.path.join(parquet, ALL_ZONES_STORE_FOLDER)),
+                                        forecasts)
+    timings['prévisions'] = time.perf_counter() - start
+    return timings
+
+
+def sorted_frame(path, keys):
+    df = pd.read_parquet(path)
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype(str)
+    return df.sort_values(keys).reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mode 'mapped' (plan, shards, reduce) contre les tâches uniques.")
+    parser.add_argument('--days', type=int, default=45)
+    parser.add_argument('--zones', type=int, default=6)
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_sharding_')
+    try:
+        raw = os.path.join(workdir, 'raw')
+        names = write_days(raw, start=pd.Timestamp('2024-01-20').date(), n_days=args.days, zones=args.zones)
+        print(f"{len(names)} fichiers bruts, {args.zones} zones, {args.shards} shards, "
+              f"{args.workers} processus ({os.cpu_count()} CPU)")
+
+        outputs = {}
+        for mode in ('tâches uniques', 'mapped', 'mapped + shard relancé'):
+            folder = os.path.join(workdir, mode.replace(' ', '_'))
+            parquet, forecasts = os.path.join(folder, 'parquet'), os.path.join(folder, 'forecasts')
+            os.makedirs(folder)
+            manifest_path = manifest_for(raw, os.path.join(folder, 'manifest.sqlite'), names)
+            if mode == 'tâches uniques':
+                timings, counts = run_single(raw, parquet, manifest_path, forecasts, args.workers), {}
+            else:
+                timings, counts = run_mapped(raw, parquet, manifest_path, forecasts, args.shards, args.workers,
+                                             retried_shard=mode != 'mapped')
+            with Manifest(manifest_path) as manifest:
+                states = manifest.counts()
+            leftovers = [name for root in (parquet, forecasts) if os.path.isdir(os.path.join(root, sharding.SHARDS_FOLDER))
+                         for name in os.listdir(os.path.join(root, sharding.SHARDS_FOLDER))]
+            print(f"  {mode:<24} traitement {timings['traitement']:6.2f}s  prévisions {timings['prévisions']:6.2f}s  "
+                  f"{' '.join(f'{k} {v}' for k, v in counts.items())}  manifeste {states}")
+            assert not leftovers, "staging non nettoyé"
+            outputs[mode] = (parquet, forecasts)
+
+        # Stores, prévisions et métriques identiques quel que soit le découpage (hors horodatage du run)
+        reference = outputs['tâches uniques']
+        for mode, (parquet, forecasts) in outputs.items():
+            for store_folder in (STORE_FOLDER, ALL_ZONES_STORE_FOLDER):
+                expected = PartitionedParquetStore(os.path.join(reference[0], store_folder)).read()
+                actual = PartitionedParquetStore(os.path.join(parquet, store_folder)).read()
+                pd.testing.assert_frame_equal(expected.drop(columns='processing_date'),
+                                              actual.drop(columns='processing_date'))
+            pd.testing.assert_frame_equal(sorted_frame(os.path.join(reference[1], FORECASTS_FILE), ['zas', 'polluant', 'date']),
+                                          sorted_frame(os.path.join(forecasts, FORECASTS_FILE), ['zas', 'polluant', 'date']))
+            expected = sorted_frame(os.path.join(reference[1], METRICS_FILE), ['zas', 'polluant'])
+            actual = sorted_frame(os.path.join(forecasts, METRICS_FILE), ['zas', 'polluant'])
+            pd.testing.assert_frame_equal(expected.drop(columns='seconds'), actual.drop(columns='seconds'))
+        print(f"stores, prévisions et métriques identiques ({len(expected)} séries)")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import warnings
+from collections import Counter
+
+import pandas as pd
+from statsmodels.tsa.arima.model import ARIMA
+
+import _common
+from src.warm_start import RefitPolicy, fit_or_update
+
+DATA_FOLDER = os.path.join(_common.DAGS_FOLDER, 'data', 'gazs_output_parquet')
+
+
+# Série journalière ZAG PARIS construite comme dans run_model_and_forecast
+def load_series():
+    frames = [pd.read_parquet(os.path.join(DATA_FOLDER, name), columns=['date de fin', 'valeur'])
+              for name in ('main_data.parquet', 'ZAG_PARIS_combined_output.parquet')]
+    df = pd.concat(frames)
+    df['date de fin'] = pd.to_datetime(df['date de fin'])
+    return df.groupby('date de fin')['valeur'].mean().asfreq('D')
+
+
+# Série vue par le run d'un jour : les derniers jours sont encore provisoires (dernière heure
+# réécrite par le fichier du lendemain, jour courant réécrit par le flux temps réel), leur
+# valeur définitive n'arrive qu'aux runs suivants
+def daily_view(ts, day, provisional):
+    view = ts[:-day].copy()
+    if provisional:
+        view.iloc[-provisional:] *= 0.9
+    return view
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs journaliers : réajustement complet contre mise à jour incrémentale.")
+    parser.add_argument('--days', type=int, default=14)
+    parser.add_argument('--refit-every', type=int, default=7)
+    parser.add_argument('--drift', type=float, default=0.5)
+    parser.add_argument('--provisional', type=int, default=1,
+                        help="derniers jours réécrits d'un run à l'autre (0 : historique figé)")
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    ts = load_series()
+    print(f"{len(ts)} jours, simulation des {args.days} derniers runs journaliers")
+    workdir = tempfile.mkdtemp(prefix='bench_warm_start_')
+    try:
+        start = time.perf_counter()
+        for day in range(args.days, 0, -1):
+            ARIMA(ts[:-day], order=(4, 2, 2)).fit()
+        full = time.perf_counter() - start
+
+        model_path = os.path.join(workdir, 'model.pkl')
+        policy = RefitPolicy(refit_every_days=args.refit_every, drift_threshold=args.drift)
+        now = time.time()
+        actions, reasons = [], Counter()
+        start = time.perf_counter()
+        for offset, day in enumerate(range(args.days, 0, -1)):
+            _, decision = fit_or_update(daily_view(ts, day, args.provisional), model_path, policy=policy,
+                                        now=now + offset * 86400)
+            actions.append(decision['action'])
+            reasons[decision['reason']] += 1
+        warm = time.perf_counter() - start
+
+        print(f"réajustement complet : {full:6.2f}s ({full / args.days * 1000:6.0f} ms/run)")
+        print(f"incrémental          : {warm:6.2f}s ({warm / args.days * 1000:6.0f} ms/run), "
+              f"{actions.count('refit')} réajustements, {actions.count('update')} mises à jour")
+        for reason, count in reasons.most_common():
+            print(f"  {count:3d} x {reason}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
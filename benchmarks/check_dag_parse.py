@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Modules lourds qui ne doivent pas être importés au parsing du DAG (hors ceux déjà chargés par Airflow)
+HEAVY_MODULES = {'pandas', 'numpy', 'pyarrow', 'statsmodels', 'sklearn', 'scipy', 'bs4', 'requests', 'joblib',
+                 'plotly', 'matplotlib', 'fastparquet'}
+
+# Exécuté dans un interpréteur neuf : Airflow est importé d'abord, seul l'import de dag.py est chronométré
+MEASURE = r'''
+import importlib.util, json, sys, time
+sys.path.insert(0, {folder!r})
+from airflow import DAG
+from airflow.operators.python_operator import PythonOperator
+before = set(sys.modules)
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location('gaz_dag', {path!r})
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+seconds = time.perf_counter() - start
+loaded = sorted({{name.split('.')[0] for name in set(sys.modules) - before}})
+print(json.dumps({{'seconds': seconds, 'loaded': loaded, 'tasks': len(module.dag.task_ids)}}))
+'''
+
+
+def default_dags_folder():
+    # Lancé depuis le dépôt (benchmarks/) ou envoyé sur l'entrée standard dans le conteneur Airflow
+    if os.path.isfile(globals().get('__file__', '')):
+        return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dags')
+    return '/opt/airflow/dags'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Temps d'import de dags/dag.py (parsing par le scheduler) "
+                                                 "et modules lourds chargés ; code de sortie 1 hors budget.")
+    parser.add_argument('--dags-folder', default=default_dags_folder())
+    parser.add_argument('--budget', type=float, default=0.5, help="secondes, médiane des imports")
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    try:
+        import airflow  # noqa: F401
+    except ImportError:
+        print("Airflow n'est pas installé : lancer la vérification dans le conteneur (make check_dag_parse)")
+        return 2
+
+    code = MEASURE.format(folder=args.dags_folder, path=os.path.join(args.dags_folder, 'dag.py'))
+    runs = []
+    for _ in range(args.runs):
+        process = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+        if process.returncode != 0:
+            lines = process.stderr.strip().splitlines()
+            print(f"ÉCHEC : l'import de dag.py a échoué ({lines[-1] if lines else process.returncode})")
+            return 1
+        runs.append(json.loads(process.stdout.strip().splitlines()[-1]))
+
+    median = statistics.median(run['seconds'] for run in runs)
+    heavy = sorted(HEAVY_MODULES.intersection(runs[-1]['loaded']))
+    print(f"import de dag.py : médiane {median * 1000:.0f} ms sur {args.runs} runs "
+          f"(budget {args.budget * 1000:.0f} ms), {runs[-1]['tasks']} tâches")
+    loaded = runs[-1]['loaded']
+    print(f"{len(loaded)} modules chargés en plus d'Airflow" + (f" : {', '.join(loaded)}" if len(loaded) <= 20 else ""))
+    failures = []
+    if median > args.budget:
+        failures.append(f"budget dépassé ({median * 1000:.0f} ms)")
+    if heavy:
+        failures.append(f"modules lourds importés au parsing : {', '.join(heavy)}")
+    for failure in failures:
+        print(f"ÉCHEC : {failure}")
+    if not failures:
+        print("OK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
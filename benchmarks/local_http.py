@@ -0,0 +1,76 @@
+import os
+import re
+import threading
+import time
+from functools import partial
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Serveur HTTP local qui imite files.data.gouv.fr : listing de répertoires,
+# Last-Modified / If-Modified-Since, requêtes Range et latence simulée.
+class LCSQARequestHandler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        if self.latency:
+            time.sleep(self.latency)
+        range_header = self.headers.get('Range')
+        file_path = self.translate_path(self.path)
+        if not range_header or not os.path.isfile(file_path):
+            return super().send_head()
+
+        match = re.match(r'bytes=(\d+)-$', range_header)
+        fs = os.stat(file_path)
+        if_range = self.headers.get('If-Range')
+        if match is None or (if_range and if_range != self.date_time_string(fs.st_mtime)):
+            return super().send_head()
+
+        start = int(match.group(1))
+        if start >= fs.st_size:
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header('Content-Range', f'bytes */{fs.st_size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+
+        f = open(file_path, 'rb')
+        f.seek(start)
+        self.send_response(HTTPStatus.PARTIAL_CONTENT)
+        self.send_header('Content-type', self.guess_type(file_path))
+        self.send_header('Content-Range', f'bytes {start}-{fs.st_size - 1}/{fs.st_size}')
+        self.send_header('Content-Length', str(fs.st_size - start))
+        self.send_header('Last-Modified', self.date_time_string(fs.st_mtime))
+        self.end_headers()
+        return f
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # File d'attente large : avec la valeur par défaut (5), des connexions concurrentes
+    # sont refusées puis retentées par le noyau après 1 s, ce qui fausse les mesures.
+    request_queue_size = 128
+
+
+class LocalHTTPServer:
+    def __init__(self, directory, latency=0.0):
+        handler = type('Handler', (LCSQARequestHandler,), {'latency': latency})
+        self.server = _Server(('127.0.0.1', 0), partial(handler, directory=directory))
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
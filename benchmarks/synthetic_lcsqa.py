@@ -0,0 +1,164 @@
+import argparse
+import os
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import _common  # noqa: F401
+
+# En-tête des fichiers temps réel LCSQA (FR_E2_AAAA-MM-JJ.csv).
+COLUMNS = [
+    'Date de début', 'Date de fin', 'Organisme', 'code zas', 'Zas', 'code site', 'nom site',
+    "type d'implantation", 'Polluant', "type d'influence", 'discriminant', 'Réglementaire',
+    "type d'évaluation", 'procédure de mesure', 'type de valeur', 'valeur', 'valeur brute',
+    'unité de mesure', 'taux de saisie', 'couverture temporelle', 'couverture de données',
+    'code qualité', 'validité',
+]
+
+POLLUTANTS = ['NO', 'NO2', 'NOX as NO2', 'O3', 'PM10', 'PM2.5', 'SO2', 'CO', 'C6H6']
+PROCEDURES = {
+    'NO': 'Auto NO app AC32M', 'NO2': 'Auto NO app AC32M', 'NOX as NO2': 'Auto NO app AC32M',
+    'O3': 'Auto O3 app O342M', 'PM10': 'Auto PM_Conf_app TEOM-FDMS 8500bc',
+    'PM2.5': 'Auto PM_Conf_app FIDAS 200', 'SO2': 'Auto SO2 app AF22M',
+    'CO': 'Auto CO app CO12M', 'C6H6': 'Auto BTX app GC866',
+}
+# Part des mesures valides en code qualité 'R' (proportion observée dans main_data.parquet)
+REVIEWED_RATE = 0.08
+BASE_LEVELS = {'NO': 8, 'NO2': 25, 'NOX as NO2': 40, 'O3': 45, 'PM10': 18, 'PM2.5': 10, 'SO2': 2, 'CO': 0.3, 'C6H6': 1}
+
+
+def zone_names(n_zones):
+    names = ['ZAG PARIS', 'ZAG LYON', 'ZAG MARSEILLE-AIX', 'ZAG LILLE', 'ZAG TOULOUSE', 'ZAG NICE']
+    return [names[i] if i < len(names) else f'ZAR ZONE {i:03d}' for i in range(n_zones)]
+
+
+# Construit les mesures horaires d'une journée : une ligne par (station, polluant, heure).
+def make_day(day, zones=1, stations_per_zone=8, rng=None, missing_rate=0.02):
+    rng = rng if rng is not None else np.random.default_rng(day.toordinal())
+    rows = []
+    for zone_id, zone in enumerate(zone_names(zones)):
+        for station in range(stations_per_zone):
+            pollutants = [p for p in POLLUTANTS if rng.random() < 0.7] or ['NO2']
+            site_code = f'FR{zone_id:02d}{station:03d}'
+            implantation = 'Urbaine' if station % 3 else 'Périurbaine'
+            influence = 'Trafic' if station % 4 == 0 else 'Fond'
+            for pollutant in pollutants:
+                rows.append((zone_id, zone, site_code, implantation, influence, pollutant))
+
+    n_series = len(rows)
+    hours = np.tile(np.arange(24), n_series)
+    series = np.repeat(np.arange(n_series), 24)
+    frame = pd.DataFrame(rows, columns=['zone_id', 'Zas', 'code site', "type d'implantation", "type d'influence", 'Polluant'])
+    frame = frame.iloc[series].reset_index(drop=True)
+
+    start = datetime(day.year, day.month, day.day) + pd.to_timedelta(hours, unit='h')
+    base = frame['Polluant'].map(BASE_LEVELS).to_numpy(dtype=float)
+    diurnal = 1 + 0.3 * np.sin((hours - 6) / 24 * 2 * np.pi)
+    values = np.round(base * diurnal * rng.lognormal(0, 0.25, len(frame)), 6)
+    valid = rng.random(len(frame)) > missing_rate
+
+    df = pd.DataFrame({
+        'Date de début': start.strftime('%Y/%m/%d %H:%M:%S'),
+        'Date de fin': (start + timedelta(hours=1)).strftime('%Y/%m/%d %H:%M:%S'),
+        'Organisme': 'AASQA',
+        'code zas': 'FR' + frame['zone_id'].map('{:02d}ZAG01'.format),
+        'Zas': frame['Zas'],
+        'code site': frame['code site'],
+        'nom site': 'Station ' + frame['code site'],
+        "type d'implantation": frame["type d'implantation"],
+        'Polluant': frame['Polluant'],
+        "type d'influence": frame["type d'influence"],
+        'discriminant': 'A',
+        'Réglementaire': 'Oui',
+        "type d'évaluation": 'mesures fixes',
+        'procédure de mesure': frame['Polluant'].map(PROCEDURES),
+        'type de valeur': 'moyenne horaire',
+        'valeur': np.where(valid, values, np.nan),
+        'valeur brute': values,
+        'unité de mesure': np.where(frame['Polluant'] == 'CO', 'mg-m3', 'Âµg-m3'),
+        'taux de saisie': np.nan,
+        'couverture temporelle': np.nan,
+        'couverture de données': np.nan,
+        'code qualité': np.where(valid, np.where(rng.random(len(frame)) < REVIEWED_RATE, 'R', 'A'), 'N'),
+        'validité': np.where(valid, 1, -1),
+    }, columns=COLUMNS)
+    return df
+
+
+def lcsqa_filename(day):
+    return f'FR_E2_{day.isoformat()}.csv'
+
+
+# Fichiers défectueux rencontrés sur le site LCSQA, que le pipeline doit ignorer sans échouer :
+# fichier vide, en-tête seul, ancien format sans colonnes Zas/Polluant, dernière ligne tronquée
+# (publication interrompue).
+MALFORMED = ('vide', 'entete_seule', 'ancien_format', 'ligne_tronquee')
+
+
+def write_day(file_path, df, malformed=None):
+    if malformed == 'vide':
+        open(file_path, 'wb').close()
+    elif malformed == 'entete_seule':
+        df.iloc[:0].to_csv(file_path, sep=';', index=False)
+    elif malformed == 'ancien_format':
+        df.drop(columns=['Zas', 'Polluant']).to_csv(file_path, sep=';', index=False)
+    elif malformed == 'ligne_tronquee':
+        body = df.to_csv(sep=';', index=False).encode('utf-8')
+        with open(file_path, 'wb') as f:
+            f.write(body[:body.rindex(b';', 0, len(body) - 1)])
+    else:
+        df.to_csv(file_path, sep=';', index=False)
+
+
+# Écrit n_days fichiers journaliers consécutifs dans folder et renvoie leurs noms.
+# malformed_rate : part des fichiers remplacés par un fichier défectueux (types de MALFORMED en alternance).
+def write_days(folder, start=date(2024, 1, 1), n_days=30, zones=1, stations_per_zone=8, seed=0, malformed_rate=0.0):
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    names = []
+    n_malformed = 0
+    for offset in range(n_days):
+        day = start + timedelta(days=offset)
+        df = make_day(day, zones=zones, stations_per_zone=stations_per_zone, rng=rng)
+        malformed = None
+        if malformed_rate and rng.random() < malformed_rate:
+            malformed = MALFORMED[n_malformed % len(MALFORMED)]
+            n_malformed += 1
+        name = lcsqa_filename(day)
+        write_day(os.path.join(folder, name), df, malformed)
+        names.append(name)
+    return names
+
+
+# Arborescence du site distant : un dossier par année (root/2023/, root/2024/, ...) contenant les
+# fichiers journaliers de l'année entière, ou des days premiers jours. Renvoie {année: [noms]}.
+def write_years(root, years, zones=1, stations_per_zone=8, seed=0, malformed_rate=0.0, days=None):
+    tree = {}
+    for i, year in enumerate(years):
+        start = date(int(year), 1, 1)
+        n_days = days or (date(int(year) + 1, 1, 1) - start).days
+        tree[str(year)] = write_days(os.path.join(root, str(year)), start=start, n_days=n_days, zones=zones,
+                                     stations_per_zone=stations_per_zone, seed=seed + i, malformed_rate=malformed_rate)
+    return tree
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génère des fichiers journaliers au format LCSQA temps réel.")
+    parser.add_argument('dossier', help="dossier de sortie, un sous-dossier par année")
+    parser.add_argument('--annees', nargs='+', default=['2024'])
+    parser.add_argument('--jours', type=int, default=None, help="jours par année (année entière par défaut)")
+    parser.add_argument('--zones', type=int, default=6)
+    parser.add_argument('--stations', type=int, default=8, help="stations par zone")
+    parser.add_argument('--malformes', type=float, default=0.0, help="part de fichiers défectueux")
+    parser.add_argument('--graine', type=int, default=0)
+    args = parser.parse_args()
+
+    tree = write_years(args.dossier, args.annees, zones=args.zones, stations_per_zone=args.stations, seed=args.graine,
+                       malformed_rate=args.malformes, days=args.jours)
+    size = sum(os.path.getsize(os.path.join(args.dossier, year, name)) for year, names in tree.items() for name in names)
+    print(f"{sum(map(len, tree.values()))} fichiers ({size / 2**20:.1f} Mo) dans {args.dossier}")
+
+
+if __name__ == "__main__":
+    main()
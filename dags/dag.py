@@ -4,10 +4,9 @@ import json
 from datetime import datetime, timedelta
 from airflow import DAG
 from airflow.operators.python_operator import PythonOperator
-from src.gaz_data import GazsData
-from src.gaz_data_processor import GazDataProcessor
-from src.gaz_data_parquet import CSVtoParquetProcessor
-from src.model import run_model_and_forecast  # Ensure the function is imported
+
+# The scheduler parses this file continuously: only Airflow and the standard library are imported
+# here. Each task imports its src modules (pandas, pyarrow, statsmodels, ...) when it runs.
 
 # Default arguments for the DAG
 default_args = {
@@ -28,58 +27,276 @@ dag = DAG(
     schedule_interval=timedelta(days=1),
 )
 
+# Shared file manifest (size, hash, remote validators and processing state per raw file)
+manifest_path = r'/opt/airflow/dags/data/manifest.sqlite'
+
+# Versioned model registry read by the API (mounted there as /app/model/registry)
+registry_path = r'/shared_data/registry'
+
+# 'fused' runs raw CSV -> Parquet store in a single task (gaz_pipeline) instead of
+# gaz_data_processor + gaz_data_parquet ('staged'). GAZ_DEBUG_CSV=1 keeps writing the
+# intermediate *_output.csv files in fused mode.
+# 'mapped' fans the same work out over the Celery workers with dynamic task mapping: downloads
+# and processing per batch of files, one store commit per partition, one forecast task per group
+# of series, each stage closed by a single reduce task (src/sharding.py). GAZ_SHARDS sets the
+# number of download, processing and series shards (processing uses more batches only when
+# a shard would exceed its 32 MB batch limit).
+# In every mode, the per-series forecasts (forecast_all_series, or fit_series_shard when mapped)
+# fit the fixed (4, 2, 2) order from scratch: the order search and the warm start only apply to
+# the ZAG PARIS model of run_model.
+pipeline_mode = os.environ.get('GAZ_PIPELINE_MODE', 'fused')
+debug_csv = os.environ.get('GAZ_DEBUG_CSV', '0') == '1'
+shard_count = int(os.environ.get('GAZ_SHARDS', '8'))
+
+download_folder = r'/opt/airflow/dags/data/gazs'
+output_folder_parquet = r'/opt/airflow/dags/data/gazs_output_parquet'
+forecasts_folder = r'/shared_data/forecasts'
+
 # Define tasks
 def download_csv_files():
-    download_folder = r'/opt/airflow/dags/data/gazs'
+    from src.gaz_data import GazsData
+    from src.manifest import Manifest
     os.makedirs(download_folder, exist_ok=True)
-    gazs_data = GazsData(download_folder)
-    gazs_data.download_csv_files()
+    with Manifest(manifest_path) as manifest:
+        gazs_data = GazsData(download_folder, manifest=manifest)
+        gazs_data.download_csv_files()
 
 def gaz_data_processor():
+    from src.gaz_data_processor import GazDataProcessor
+    from src.manifest import Manifest
     input_folder = r"/opt/airflow/dags/data/gazs"
     output_folder = r"/opt/airflow/dags/data/gazs_output"
     os.makedirs(output_folder, exist_ok=True)
-    processor = GazDataProcessor(input_folder, output_folder)
-    processor.process_csv_files()
+    with Manifest(manifest_path) as manifest:
+        processor = GazDataProcessor(input_folder, output_folder, manifest=manifest)
+        # One process per core on the worker
+        processor.process_csv_files(workers=os.cpu_count())
     
 def gaz_data_parquet():
+    from src.gaz_data_parquet import CSVtoParquetProcessor
+    from src.manifest import Manifest
     input_folder_parquet = r'/opt/airflow/dags/data/gazs_output'
-    output_folder_parquet = r'/opt/airflow/dags/data/gazs_output_parquet'
     os.makedirs(output_folder_parquet, exist_ok=True)
-    processor = CSVtoParquetProcessor(input_folder_parquet, output_folder_parquet)
-    processor.process_files()
-    processor.concatenate_and_save()
+    with Manifest(manifest_path) as manifest:
+        processor = CSVtoParquetProcessor(input_folder_parquet, output_folder_parquet, manifest=manifest)
+        # Files are streamed into the store one at a time: memory does not grow with the backlog
+        processor.stream_files()
+
+def gaz_pipeline():
+    from src.pipeline import GazPipeline
+    from src.manifest import Manifest
+    input_folder = download_folder
+    debug_csv_folder = r"/opt/airflow/dags/data/gazs_output" if debug_csv else None
+    os.makedirs(output_folder_parquet, exist_ok=True)
+    if debug_csv_folder is not None:
+        os.makedirs(debug_csv_folder, exist_ok=True)
+    with Manifest(manifest_path) as manifest:
+        # all_zones: every zone also goes to ZAS_dataset for forecast_all_series
+        pipeline = GazPipeline(input_folder, output_folder_parquet, manifest=manifest, debug_csv_folder=debug_csv_folder,
+                               all_zones=True)
+        pipeline.run(workers=os.cpu_count())
+
+# One ARIMA per (zas, polluant) over every zone, fitted in parallel. Written to the shared
+# volume, where the API's /forecast/batch endpoint reads them (/app/model/forecasts).
+def forecast_all_series():
+    from src.forecasting import ForecastEngine
+    from src.parquet_store import PartitionedParquetStore
+    store = PartitionedParquetStore(os.path.join(output_folder_parquet, 'ZAS_dataset'))
+    engine = ForecastEngine(order=(4, 2, 2), steps=7, timeout=120, workers=os.cpu_count())
+    engine.run(store, forecasts_folder)
+
+# Callable of a mapped-mode task: the src.sharding function of that name, imported when the task runs.
+# Timed like the other tasks (see traced); each instance of a mapped task writes its own textfile
+# (<task>_<map index>.prom, with a shard label), while spans.jsonl keeps every shard.
+def sharded(name):
+    def call(*args, **context):
+        from src import sharding
+        from src.instrumentation import task
+        fn = getattr(sharding, name)
+        ti = context.get('ti')
+        map_index = getattr(ti, 'map_index', -1)
+        with task(name, shard=map_index if map_index is not None and map_index >= 0 else None):
+            return fn(*args, **own_kwargs(fn, context))
+    call.__name__ = name
+    return call
+
+# Task callable with its stages timed (src.instrumentation): with GAZ_METRICS_DIR set, the spans are
+# appended to spans.jsonl and the task totals written to <task>.prom for the textfile collector
+def traced(fn):
+    def call(*args, **context):
+        from src.instrumentation import task
+        with task(fn.__name__):
+            return fn(*args, **own_kwargs(fn, context))
+    call.__name__ = fn.__name__
+    return call
+
+# PythonOperator passes the whole Airflow context to a callable taking **kwargs: only the
+# function's own parameters (its op_kwargs) are forwarded to it
+def own_kwargs(fn, context):
+    import inspect
+    parameters = inspect.signature(fn).parameters
+    return {key: value for key, value in context.items() if key in parameters}
 
 def run_model():
-    historical_file_path = r'/opt/airflow/dags/data/gazs_output_parquet/main_data.parquet'
-    new_day_file_path = r'/opt/airflow/dags/data/gazs_output_parquet/ZAG_PARIS_combined_output.parquet'
-    json_result = run_model_and_forecast(historical_file_path, new_day_file_path)
-    with open('/shared_data/metrics.json', 'w+') as f:
-        json.dump(json_result, f, indent=4)
-
-task1 = PythonOperator(
-    task_id='download_csv_files',
-    python_callable=download_csv_files,
-    dag=dag,
-)
+    from src.model import run_model_and_forecast
+    from src.model_output import dumps
+    from src.order_selection import OrderSearch
+    from src.registry import ModelRegistry
+    from src.warm_start import RefitPolicy
+    historical_file_path = os.path.join(output_folder_parquet, 'main_data.parquet')
+    new_day_file_path = os.path.join(output_folder_parquet, 'ZAG_PARIS_dataset')
+    # ARIMA order chosen by a stepwise AIC search, redone only when the data materially changes
+    order_search = OrderSearch(criterion='aic', method='stepwise', workers=os.cpu_count(),
+                               cache_path='/shared_data/order_cache.json')
+    # Daily warm update of the saved results; full refit weekly or when the holdout RMSE drifts by 50%
+    model_path = '/shared_data/model.pkl'
+    # Forecast-only export served by the API (a few KB, loaded without statsmodels)
+    forecaster_path = '/shared_data/forecaster.npz'
+    # Output series as contiguous float32 values, memory-mapped by the API workers for /history/
+    series_path = '/shared_data/series.bin'
+    json_result = run_model_and_forecast(historical_file_path, new_day_file_path, model_path=model_path,
+                                         policy=RefitPolicy(refit_every_days=7, drift_threshold=0.5),
+                                         order_search=order_search, forecaster_path=forecaster_path,
+                                         series_path=series_path)
+    # Model and metrics published together as a new registry version; the API switches to it on its own
+    registry = ModelRegistry(registry_path)
+    registry.publish({'model.pkl': model_path, 'forecaster.npz': forecaster_path, 'series.bin': series_path,
+                      'metrics.json': dumps(json_result)},
+                     metadata={'dag_run_at': datetime.now().isoformat(timespec='seconds')})
+    registry.prune(keep=7)
 
-task2 = PythonOperator(
-    task_id='gaz_data_processor',
-    python_callable=gaz_data_processor,
-    dag=dag,
-)
+if pipeline_mode == 'mapped':
+    all_zones_store = os.path.join(output_folder_parquet, 'ZAS_dataset')
 
-task3 = PythonOperator(
-    task_id='gaz_data_parquet',
-    python_callable=gaz_data_parquet,
-    dag=dag,
-)
+    plan_downloads = PythonOperator(
+        task_id='plan_downloads',
+        python_callable=sharded('plan_downloads'),
+        op_args=[download_folder, shard_count],
+        dag=dag,
+    )
+    # One task instance per shard; a failed shard is retried on its own
+    download_shards = PythonOperator.partial(
+        task_id='download_shard',
+        python_callable=sharded('download_shard'),
+        op_kwargs={'download_folder': download_folder, 'manifest_path': manifest_path},
+        dag=dag,
+    ).expand(op_args=plan_downloads.output)
 
-task4 = PythonOperator(
-    task_id='run_model',
-    python_callable=run_model,
-    dag=dag,
-)
+    plan_processing = PythonOperator(
+        task_id='plan_processing',
+        python_callable=sharded('plan_processing'),
+        op_args=[download_folder, output_folder_parquet, manifest_path, shard_count],
+        # Nothing to download (empty index) still processes the pending files
+        trigger_rule='none_failed',
+        dag=dag,
+    )
+    process_shards = PythonOperator.partial(
+        task_id='process_shard',
+        python_callable=sharded('process_shard'),
+        op_kwargs={'input_folder': download_folder, 'output_folder_parquet': output_folder_parquet},
+        dag=dag,
+    ).expand(op_args=plan_processing.output)
+
+    plan_partitions = PythonOperator(
+        task_id='plan_partitions',
+        python_callable=sharded('plan_partitions'),
+        op_args=[process_shards.output],
+        trigger_rule='none_failed',
+        dag=dag,
+    )
+    merge_partitions = PythonOperator.partial(
+        task_id='merge_partition',
+        python_callable=sharded('merge_partition'),
+        op_kwargs={'output_folder_parquet': output_folder_parquet},
+        dag=dag,
+    ).expand(op_args=plan_partitions.output)
+
+    # Reduce: manifest states and staging cleanup once every partition is committed
+    commit_processing = PythonOperator(
+        task_id='commit_processing',
+        python_callable=sharded('commit_processing'),
+        op_kwargs={'manifest_path': manifest_path, 'shard_results': process_shards.output,
+                   'partition_results': merge_partitions.output},
+        trigger_rule='none_failed',
+        dag=dag,
+    )
+
+    plan_series = PythonOperator(
+        task_id='plan_series',
+        python_callable=sharded('plan_series'),
+        op_args=[all_zones_store, forecasts_folder, shard_count],
+        dag=dag,
+    )
+    fit_series_shards = PythonOperator.partial(
+        task_id='fit_series_shard',
+        python_callable=sharded('fit_series_shard'),
+        op_kwargs={'store_root': all_zones_store, 'order': (4, 2, 2), 'steps': 7, 'timeout': 120},
+        dag=dag,
+    ).expand(op_args=plan_series.output)
+    commit_forecasts = PythonOperator(
+        task_id='commit_forecasts',
+        python_callable=sharded('commit_forecasts'),
+        op_kwargs={'output_folder': forecasts_folder, 'shard_results': fit_series_shards.output, 'steps': 7},
+        trigger_rule='none_failed',
+        dag=dag,
+    )
+
+    task4 = PythonOperator(
+        task_id='run_model',
+        python_callable=traced(run_model),
+        dag=dag,
+    )
+
+    download_shards >> plan_processing
+    merge_partitions >> commit_processing >> [plan_series, task4]
+    fit_series_shards >> commit_forecasts
+else:
+    task1 = PythonOperator(
+        task_id='download_csv_files',
+        python_callable=traced(download_csv_files),
+        dag=dag,
+    )
+
+    if pipeline_mode == 'fused':
+        task2 = PythonOperator(
+            task_id='gaz_pipeline',
+            python_callable=traced(gaz_pipeline),
+            dag=dag,
+        )
+        task3 = None
+        # The all-zones store is only fed by the fused pipeline
+        task5 = PythonOperator(
+            task_id='forecast_all_series',
+            python_callable=traced(forecast_all_series),
+            dag=dag,
+        )
+        task2 >> task5
+    else:
+        task2 = PythonOperator(
+            task_id='gaz_data_processor',
+            python_callable=traced(gaz_data_processor),
+            dag=dag,
+        )
+
+        task3 = PythonOperator(
+            task_id='gaz_data_parquet',
+            python_callable=traced(gaz_data_parquet),
+            dag=dag,
+        )
+
+    task4 = PythonOperator(
+        task_id='run_model',
+        python_callable=traced(run_model),
+        dag=dag,
+    )
+
+    # Set task dependencies
+    if task3 is None:
+        task1 >> task2 >> task4
+    else:
+        task1 >> task2 >> task3 >> task4
 
-# Set task dependencies
-task1 >> task2 >> task3 >> task4
\ No newline at end of file
+# Local run of one DAG run in this process, without scheduler or Celery workers (mapped tasks
+# included): python dags/dag.py, or airflow dags test aa_gaz_pipeline (make test_dag)
+if __name__ == "__main__":
+    dag.test()
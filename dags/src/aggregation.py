@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+# Avec pandas >= 2, une colonne objet n'est une « chaîne » que si toutes ses valeurs
+# (manquantes comprises) sont des str : custom_agg renvoie alors NaN pour un groupe
+# contenant une valeur manquante. Avec pandas 1.x, toute colonne objet est une chaîne.
+_STRICT_STRING_CHECK = not pd.api.types.is_string_dtype(pd.Series(['a', np.nan], dtype=object))
+
+MEAN = 'mean'
+FIRST = 'first'
+FIRST_IF_COMPLETE = 'first_if_complete'
+MISSING = 'missing'
+PYTHON = 'python'
+
+
+# Plan d'agrégation établi une fois par colonne (et non par groupe) en reproduisant
+# les tests de type de GazDataProcessor.custom_agg : moyenne pour les colonnes
+# numériques, première valeur pour les colonnes texte, NaN sinon.
+def plan_aggregation(data, keys):
+    plan = {}
+    for column in data.columns:
+        if column in keys:
+            continue
+        values = data[column]
+        if values.dtype == object:
+            if not _STRICT_STRING_CHECK or pd.api.types.infer_dtype(values, skipna=False) == 'string':
+                # Que des chaînes, sans valeur manquante : tous les groupes prennent leur première valeur.
+                plan[column] = FIRST
+            elif pd.api.types.infer_dtype(values, skipna=True) in ('string', 'empty'):
+                plan[column] = FIRST_IF_COMPLETE
+            else:
+                # Colonne objet hétérogène : le résultat dépend du contenu de chaque groupe.
+                plan[column] = PYTHON
+        elif pd.api.types.is_string_dtype(values):
+            plan[column] = FIRST
+        elif pd.api.types.is_numeric_dtype(values):
+            # Les types numériques « extension » (Int64, Float32 nullables...) gardent le chemin Python.
+            plan[column] = MEAN if isinstance(values.dtype, np.dtype) else PYTHON
+        else:
+            plan[column] = MISSING
+    return plan
+
+
+# Équivalent vectorisé de data.groupby(keys).agg(custom_agg).reset_index() :
+# les groupes sont identifiés une seule fois, puis chaque colonne est réduite en bloc.
+def groupby_aggregate(data, keys, plan=None, fallback=None):
+    plan = plan if plan is not None else plan_aggregation(data, keys)
+    grouped = data.groupby(keys, sort=True, observed=True)
+    if grouped.ngroups == 0:
+        return grouped.agg(fallback).reset_index()
+    result_index = grouped.size().index
+
+    # Lignes triées par groupe (tri stable : l'ordre d'origine est conservé dans chaque groupe).
+    group_ids = grouped.ngroup().to_numpy()
+    rows = np.flatnonzero(pd.notna(group_ids) & (group_ids >= 0))
+    group_ids = group_ids[rows].astype(np.intp)
+    permutation = np.argsort(group_ids, kind='stable')
+    order = rows[permutation]
+    sorted_ids = group_ids[permutation]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    sizes = np.diff(np.r_[starts, len(sorted_ids)])
+
+    columns = {}
+    for column, operation in plan.items():
+        if operation == MEAN:
+            columns[column] = _group_mean(data[column].to_numpy()[order], starts, sizes)
+        elif operation == FIRST:
+            # Le chemin Python renvoie des objets, y compris pour une colonne catégorielle.
+            columns[column] = data[column].to_numpy(dtype=object)[order[starts]]
+        elif operation == FIRST_IF_COMPLETE:
+            values = data[column].to_numpy()[order]
+            incomplete = np.logical_or.reduceat(pd.isna(values), starts)
+            first = values[starts]
+            first[incomplete] = np.nan
+            # Comme maybe_convert_objects côté pandas : une colonne entièrement vide devient float64.
+            columns[column] = np.full(len(starts), np.nan) if incomplete.all() else first
+        elif operation == MISSING:
+            columns[column] = np.full(len(starts), np.nan)
+        else:
+            columns[column] = grouped[column].agg(fallback).array
+
+    return pd.DataFrame(columns, index=result_index).reset_index()
+
+
+# Moyenne par groupe calculée comme Series.mean (pandas.core.nanops.nanmean, privé : la réduction
+# est reproduite ici) : valeurs manquantes remplacées par 0, somme dans le même type, divisée par
+# le nombre de valeurs présentes. Appliquée à une matrice par taille de groupe, l'ordre de
+# sommation, et donc le résultat au bit près, est identique à celui du calcul groupe par groupe.
+# GroupBy.mean somme autrement (Kahan) et s'écarte de custom_agg sur le dernier bit.
+def _group_mean(sorted_values, starts, sizes):
+    kind = sorted_values.dtype.kind
+    # float32 reste float32, comme avec custom_agg ; les autres types donnent du float64.
+    means = np.empty(len(starts), dtype=sorted_values.dtype if kind == 'f' else np.float64)
+    sum_dtype = sorted_values.dtype if kind == 'f' else np.int64 if kind == 'b' else np.float64
+    count_dtype = sorted_values.dtype if kind == 'f' else np.float64
+    missing = np.isnan(sorted_values) if kind == 'f' else np.zeros(len(sorted_values), dtype=bool)
+    if missing.any():
+        sorted_values = sorted_values.copy()
+        sorted_values[missing] = 0
+    for size in np.unique(sizes):
+        groups = np.flatnonzero(sizes == size)
+        positions = starts[groups][:, None] + np.arange(size)
+        counts = (size - missing[positions].sum(axis=1)).astype(count_dtype)
+        with np.errstate(all='ignore'):
+            means[groups] = sorted_values[positions].sum(axis=1, dtype=sum_dtype) / counts
+        means[groups[counts == 0]] = np.nan
+    return means
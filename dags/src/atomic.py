@@ -0,0 +1,23 @@
+import os
+import uuid
+from contextlib import contextmanager
+
+
+# Temporary path next to path, moved onto it with os.replace when the block succeeds and removed
+# when it fails, so readers only ever see the old or the new file. The name is unique per call
+# (pid and random suffix): concurrent writers of the same file (Celery workers, API processes)
+# never share a temporary file. It starts with a dot so that listings and Arrow datasets skip it.
+#
+#   with atomic_path(path) as tmp_path:
+#       pq.write_table(table, tmp_path)
+@contextmanager
+def atomic_path(path):
+    folder, name = os.path.split(path)
+    tmp_path = os.path.join(folder, f'.{name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp')
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,137 @@
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.arima.model import ARIMA
+
+from src.instrumentation import peak_rss_bytes, reset_peak_rss
+
+# Horizons evaluated, in days: the four options of the API's /forecast/ endpoint
+HORIZONS = (1, 2, 4, 7)
+
+
+# Rolling-origin backtest of the ARIMA forecaster. The series is cut at n_origins origins, step
+# days apart, ending max(horizons) days before its last observation; at each origin the model is
+# fitted on the days before it and forecasts max(horizons) days, compared with what was observed.
+#
+# Folds are grouped by refit: the first fold of a group is a full fit, the next refit_every - 1
+# reuse its parameters and only append the new days (as the daily warm start does), so a group
+# costs about one fit. Groups run in a process pool. refit_every=1 refits every fold,
+# refit_every=None fits once and appends through the whole backtest.
+class Backtest:
+    def __init__(self, order=(4, 2, 2), horizons=HORIZONS, n_origins=28, step=1, refit_every=7, min_train=60,
+                 workers=None):
+        self.order = tuple(order)
+        self.horizons = tuple(sorted(horizons))
+        self.n_origins = n_origins
+        self.step = step
+        self.refit_every = refit_every
+        self.min_train = min_train
+        self.workers = workers
+
+    # Positions of the origins in ts (number of training days of each fold), oldest first
+    def origins(self, ts):
+        last = len(ts) - max(self.horizons)
+        origins = last - self.step * np.arange(self.n_origins)[::-1]
+        return origins[origins >= self.min_train]
+
+    # ts is put on a daily index first: missing days become NaN, so that positions are days
+    # (origins, horizons and the index rebuilt in the workers)
+    def run(self, ts):
+        ts = ts.asfreq('D')
+        values = ts.to_numpy(dtype=float)
+        origins = self.origins(ts)
+        if not len(origins):
+            raise ValueError(f"series too short for a backtest ({len(ts)} days)")
+        size = self.refit_every or len(origins)
+        groups = [origins[i:i + size] for i in range(0, len(origins), size)]
+        workers = min(self.workers or os.cpu_count() or 1, len(groups))
+        args = (values, ts.index[0], self.order, max(self.horizons))
+
+        if workers == 1:
+            parts = [_run_group(*args, group) for group in groups]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                parts = list(executor.map(_run_group, *zip(*[args + (group,) for group in groups])))
+
+        forecasts = np.concatenate([forecasts for forecasts, _ in parts])
+        folds = pd.DataFrame([fold for _, rows in parts for fold in rows])
+        folds.insert(0, 'origin', ts.index[origins])
+        return BacktestResult(self, values, origins, forecasts, folds)
+
+
+# Forecasts of every fold (n_folds x max horizon) with the observed values at the same dates,
+# and one row of timings per fold (mode, fit and forecast seconds, peak RSS of the worker).
+class BacktestResult:
+    def __init__(self, backtest, values, origins, forecasts, folds):
+        self.backtest = backtest
+        self.origins = origins
+        self.forecasts = forecasts
+        # Observed value h days after each origin, gathered in one indexing operation
+        self.actuals = values[origins[:, None] + np.arange(forecasts.shape[1])]
+        self.folds = folds
+
+    # One row per horizon, computed over all folds at once; days without observation are ignored
+    def metrics(self):
+        columns = np.array(self.backtest.horizons) - 1
+        errors = self.actuals[:, columns] - self.forecasts[:, columns]
+        actuals = self.actuals[:, columns]
+        valid = np.isfinite(errors)
+        n = valid.sum(axis=0)
+        errors = np.where(valid, errors, 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mae = np.abs(errors).sum(axis=0) / n
+            mse = (errors ** 2).sum(axis=0) / n
+            bias = errors.sum(axis=0) / n
+            ape = np.where(valid & (actuals != 0), np.abs(errors / np.where(actuals != 0, actuals, 1.0)), 0.0)
+            mape = ape.sum(axis=0) / (valid & (actuals != 0)).sum(axis=0) * 100
+            # Lag-1 autocorrelation of the errors from one origin to the next
+            centered = np.where(valid, errors - bias, 0.0)
+            acf1 = (centered[1:] * centered[:-1]).sum(axis=0) / (centered ** 2).sum(axis=0)
+        return pd.DataFrame({'horizon': self.backtest.horizons, 'n': n, 'mae': mae, 'mse': mse, 'rmse': np.sqrt(mse),
+                             'mape': mape, 'bias': bias, 'acf1': acf1})
+
+    # Cost and accuracy of the model choice in one row
+    def summary(self):
+        metrics = self.metrics().set_index('horizon')
+        summary = {'order': self.backtest.order, 'refit_every': self.backtest.refit_every, 'folds': len(self.folds),
+                   'fits': int((self.folds['mode'] == 'fit').sum()),
+                   'fit_seconds': float(self.folds['fit_seconds'].sum()),
+                   'forecast_seconds': float(self.folds['forecast_seconds'].sum()),
+                   'peak_rss_mb': float(self.folds['peak_rss_mb'].max())}
+        for horizon, row in metrics.iterrows():
+            summary[f'mae_{horizon}d'] = row['mae']
+            summary[f'rmse_{horizon}d'] = row['rmse']
+        return summary
+
+
+# Backtests each order on the same origins: one summary row per order
+def compare(ts, orders, **kwargs):
+    return pd.DataFrame([Backtest(order=order, **kwargs).run(ts).summary() for order in orders])
+
+
+# Runs a group of consecutive folds in a worker: full fit at the first origin, then the days up
+# to each next origin are appended with the parameters kept. The series travels as a float array
+# plus its first date, as in src.forecasting.
+def _run_group(values, first_date, order, steps, origins):
+    ts = pd.Series(values, index=pd.date_range(first_date, periods=len(values), freq='D'))
+    forecasts = np.full((len(origins), steps), np.nan)
+    rows = []
+    model_fit = None
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for i, origin in enumerate(origins):
+            reset_peak_rss()
+            start = time.perf_counter()
+            if model_fit is None:
+                model_fit, mode = ARIMA(ts.iloc[:origin], order=order).fit(), 'fit'
+            else:
+                model_fit, mode = model_fit.append(ts.iloc[origins[i - 1]:origin], refit=False), 'append'
+            fitted = time.perf_counter()
+            forecasts[i] = np.asarray(model_fit.forecast(steps))
+            rows.append({'mode': mode, 'n_train': int(origin), 'fit_seconds': fitted - start,
+                         'forecast_seconds': time.perf_counter() - fitted, 'peak_rss_mb': peak_rss_bytes() / 2**20})
+    return forecasts, rows
@@ -0,0 +1,120 @@
+import json
+import os
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from src.atomic import atomic_path
+
+FORMAT_VERSION = 1
+
+# Time-invariant state-space matrices needed to forecast, as stored by statsmodels
+MATRICES = ('design', 'obs_cov', 'transition', 'state_intercept', 'selection', 'state_cov')
+
+
+# Forecast-only export of a fitted statsmodels ARIMA: the state-space matrices, the predicted
+# state after the last observation and its covariance. That is everything get_forecast() uses;
+# the training data, filter output and parameter covariance of the pickled results are left out.
+#
+# Saved as an uncompressed .npz of a few small arrays (no pickle), loaded with NumPy and pandas
+# only, so the API does not import statsmodels to serve it.
+class CompactForecaster:
+    def __init__(self, arrays, meta):
+        self.arrays = arrays
+        self.meta = meta
+        self.last_date = pd.Timestamp(meta['last_date'])
+        self.freq = meta['freq']
+
+    @classmethod
+    def from_results(cls, model_fit):
+        model = model_fit.model
+        if getattr(model, 'k_exog', 0):
+            raise ValueError("Models with exogenous regressors cannot be exported")
+        results = model_fit.filter_results
+        arrays = {}
+        for name in MATRICES:
+            matrix = getattr(results, name)
+            if matrix.shape[-1] != 1:
+                raise ValueError(f"Time-varying {name} matrix cannot be exported")
+            arrays[name] = np.ascontiguousarray(matrix[..., 0], dtype=float)
+
+        # The trend ('c', 't', 'ct') goes through the observation intercept, constant or linear in time
+        intercept = results.obs_intercept[0]
+        slope = intercept[-1] - intercept[-2] if len(intercept) > 1 else 0.0
+        if not np.allclose(np.diff(intercept), slope):
+            raise ValueError("Observation intercept is not affine in time")
+        arrays['obs_intercept'] = np.array([intercept[-1], slope], dtype=float)
+
+        arrays['state'] = np.array(results.predicted_state[:, -1], dtype=float)
+        arrays['predicted_state_cov'] = np.array(results.predicted_state_cov[:, :, -1], dtype=float)
+        arrays['params'] = np.asarray(model_fit.params, dtype=float)
+
+        index = model.data.row_labels
+        meta = {'format': FORMAT_VERSION, 'order': list(getattr(model, 'order', ())), 'nobs': int(results.nobs),
+                'last_date': index[-1].isoformat(), 'freq': index.freqstr or 'D',
+                'param_names': list(model.param_names)}
+        return cls(arrays, meta)
+
+    # Writes the artifact atomically; returns its size in bytes
+    def save(self, path):
+        with atomic_path(path) as tmp_path, open(tmp_path, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(self.meta)), **self.arrays)
+        return os.path.getsize(path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('format') != FORMAT_VERSION:
+                raise ValueError(f"Unsupported forecaster format: {meta.get('format')}")
+            arrays = {name: data[name] for name in data.files if name != 'meta'}
+        return cls(arrays, meta)
+
+    # Same recursion as the Kalman filter forecast without observations:
+    #   y_h = Z a_h + d_h,          F_h = Z P_h Z' + H
+    #   a_h+1 = T a_h + c,          P_h+1 = T P_h T' + R Q R'
+    def get_forecast(self, steps=1):
+        a = self.arrays
+        design, transition = a['design'], a['transition']
+        rqr = a['selection'] @ a['state_cov'] @ a['selection'].T
+        state, cov = a['state'], a['predicted_state_cov']
+        intercept, slope = a['obs_intercept']
+
+        mean = np.empty(steps)
+        var = np.empty(steps)
+        for h in range(steps):
+            mean[h] = (design @ state)[0] + intercept + slope * (h + 1)
+            var[h] = (design @ cov @ design.T + a['obs_cov'])[0, 0]
+            state = transition @ state + a['state_intercept']
+            cov = transition @ cov @ transition.T + rqr
+
+        index = pd.date_range(self.last_date, periods=steps + 1, freq=self.freq)[1:]
+        return CompactForecast(pd.Series(mean, index=index, name='predicted_mean'),
+                               pd.Series(np.sqrt(var), index=index, name='mean_se'))
+
+    def forecast(self, steps=1):
+        return self.get_forecast(steps).predicted_mean
+
+
+# Subset of statsmodels' PredictionResults used by the callers
+class CompactForecast:
+    def __init__(self, predicted_mean, se_mean):
+        self.predicted_mean = predicted_mean
+        self.se_mean = se_mean
+
+    def conf_int(self, alpha=0.05):
+        width = NormalDist().inv_cdf(1 - alpha / 2) * self.se_mean
+        return pd.DataFrame({'lower': self.predicted_mean - width, 'upper': self.predicted_mean + width})
+
+
+def export_forecaster(model_fit, path):
+    return CompactForecaster.from_results(model_fit).save(path)
+
+
+# Loads either artifact format: the compact .npz export or a pickled statsmodels results
+def load_forecaster(path):
+    if path.endswith('.npz'):
+        return CompactForecaster.load(path)
+    import joblib
+    return joblib.load(path)
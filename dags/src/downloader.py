@@ -0,0 +1,207 @@
+import contextvars
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.utils import formatdate, parsedate_to_datetime
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from src.instrumentation import span
+
+
+# Moteur de téléchargement concurrent : un pool de threads borné partage une
+# session HTTP (connexions réutilisées), chaque fichier est écrit en flux dans
+# un fichier temporaire '.part' puis renommé, et les requêtes conditionnelles
+# (If-None-Match / If-Modified-Since / Range) évitent de relire les fichiers inchangés.
+# Avec un manifeste, les validateurs viennent de la base et non d'un stat du disque.
+class ConcurrentDownloader:
+    PART_SUFFIX = '.part'
+
+    def __init__(self, download_folder, manifest=None, max_workers=8, timeout=(10, 60), chunk_size=1 << 16, retries=3):
+        self.download_folder = download_folder
+        self.manifest = manifest
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.session = self._build_session(retries)
+
+    # Crée une session dont le pool de connexions est dimensionné sur le nombre de workers.
+    def _build_session(self, retries):
+        session = Session()
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504),
+                      allowed_methods=frozenset(['GET', 'HEAD']))
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.max_workers, max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def close(self):
+        self.session.close()
+
+    # Récupère une page d'index (liste des années ou des fichiers).
+    def get_text(self, url):
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.text
+
+    # Télécharge une liste de (url, nom de fichier) en parallèle et renvoie un résumé par statut.
+    def download_all(self, jobs):
+        summary = {'downloaded': [], 'resumed': [], 'skipped': [], 'failed': []}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Chaque thread hérite du contexte du span englobant
+            futures = {executor.submit(contextvars.copy_context().run, self.timed_download, url, filename): filename
+                       for url, filename in jobs}
+            for future in as_completed(futures):
+                filename = futures[future]
+                try:
+                    status = future.result()
+                except Exception as e:
+                    print(f"Échec du téléchargement de {filename} : {e}")
+                    summary['failed'].append(filename)
+                    continue
+                summary[status].append(filename)
+                if status != 'skipped':
+                    print(f"Le fichier {filename} a été téléchargé avec succès.")
+        summary['seconds'] = time.perf_counter() - start
+        return summary
+
+    # download() mesuré fichier par fichier : durée et taille du fichier reçu. Les threads tournent
+    # en parallèle, les compteurs du processus (CPU, E/S, mémoire) ne sont donc pas attribués.
+    def timed_download(self, url, filename):
+        with span('download_file', resources=False, file=filename) as s:
+            status = self.download(url, filename)
+            if status != 'skipped':
+                s.add(files=1, bytes_read=os.path.getsize(os.path.join(self.download_folder, filename)))
+            return status
+
+    # Télécharge un fichier s'il est absent, partiel ou modifié côté serveur.
+    # Renvoie 'downloaded', 'resumed' ou 'skipped'.
+    def download(self, url, filename):
+        target_path = os.path.join(self.download_folder, filename)
+        part_path = target_path + self.PART_SUFFIX
+        headers = {}
+        resume_from = 0
+
+        target_stat = None
+        record = self.manifest.get(filename) if self.manifest is not None else None
+        if record is not None:
+            # Validateurs enregistrés au dernier téléchargement réussi : aucun accès disque.
+            if record['etag']:
+                headers['If-None-Match'] = record['etag']
+            if record['last_modified']:
+                headers['If-Modified-Since'] = formatdate(record['last_modified'], usegmt=True)
+        else:
+            target_stat = _stat_or_none(target_path)
+            part_stat = _stat_or_none(part_path)
+            if target_stat is not None:
+                # Le mtime local est aligné sur le Last-Modified distant après chaque téléchargement.
+                headers['If-Modified-Since'] = formatdate(target_stat.st_mtime, usegmt=True)
+            elif part_stat is not None and part_stat.st_size > 0:
+                resume_from = part_stat.st_size
+                headers['Range'] = f'bytes={resume_from}-'
+                headers['If-Range'] = formatdate(part_stat.st_mtime, usegmt=True)
+
+        with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+            if response.status_code == 304:
+                if record is None and self.manifest is not None:
+                    # Fichier antérieur au manifeste : il est empreint une seule fois.
+                    self._record(filename, target_path, response.headers.get('ETag'), target_stat.st_mtime)
+                return 'skipped'
+            if response.status_code == 416:
+                # Le fichier partiel est plus grand que la ressource : on repart de zéro.
+                os.remove(part_path)
+                return self.download(url, filename)
+            response.raise_for_status()
+
+            last_modified = _parse_http_date(response.headers.get('Last-Modified'))
+            etag = response.headers.get('ETag')
+            content_length = response.headers.get('Content-Length')
+            if response.status_code == 200 and (
+                    (record is not None and _record_unchanged(record, content_length, etag, last_modified)) or
+                    (target_stat is not None and _is_unchanged(target_stat, content_length, last_modified))):
+                # Serveur sans support des requêtes conditionnelles : le corps n'est pas lu.
+                return 'skipped'
+
+            resumed = response.status_code == 206 and resume_from > 0
+            expected_size = _expected_size(response, resume_from if resumed else 0)
+            digest = hashlib.sha256()
+            if resumed:
+                _hash_file(part_path, digest, self.chunk_size)
+            try:
+                with open(part_path, 'ab' if resumed else 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        f.write(chunk)
+                        digest.update(chunk)
+            finally:
+                # Date de la version en cours, utilisée comme If-Range pour une reprise.
+                if last_modified is not None and os.path.exists(part_path):
+                    os.utime(part_path, (last_modified, last_modified))
+
+        size = os.path.getsize(part_path)
+        if expected_size is not None and size != expected_size:
+            raise IOError(f"téléchargement incomplet ({size}/{expected_size} octets), reprise au prochain passage")
+
+        os.replace(part_path, target_path)
+        if last_modified is not None:
+            os.utime(target_path, (last_modified, last_modified))
+        if self.manifest is not None:
+            self.manifest.record_download(filename, size, digest.hexdigest(), etag, last_modified)
+        return 'resumed' if resumed else 'downloaded'
+
+    def _record(self, filename, file_path, etag, last_modified):
+        digest = _hash_file(file_path, hashlib.sha256(), self.chunk_size)
+        self.manifest.record_download(filename, os.path.getsize(file_path), digest.hexdigest(), etag, last_modified)
+
+
+def _stat_or_none(file_path):
+    try:
+        return os.stat(file_path)
+    except FileNotFoundError:
+        return None
+
+
+def _parse_http_date(value):
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _hash_file(file_path, digest, chunk_size):
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest
+
+
+def _record_unchanged(record, content_length, etag, last_modified):
+    if etag is not None and record['etag']:
+        return etag == record['etag']
+    if content_length is None or last_modified is None or record['last_modified'] is None:
+        return False
+    return int(content_length) == record['size'] and int(last_modified) == int(record['last_modified'])
+
+
+def _is_unchanged(local_stat, content_length, last_modified):
+    if content_length is None or last_modified is None:
+        return False
+    return int(content_length) == local_stat.st_size and int(last_modified) == int(local_stat.st_mtime)
+
+
+# Taille totale attendue du fichier une fois le flux terminé.
+def _expected_size(response, offset):
+    content_range = response.headers.get('Content-Range')
+    if content_range and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        if total.isdigit():
+            return int(total)
+    content_length = response.headers.get('Content-Length')
+    if content_length is not None and 'gzip' not in response.headers.get('Content-Encoding', ''):
+        return offset + int(content_length)
+    return None
@@ -0,0 +1,282 @@
+import copy
+import os
+import signal
+import threading
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from statsmodels.tsa.arima.model import ARIMA
+
+from src.atomic import atomic_path
+from src.instrumentation import span
+from src.query import ObservationQuery
+from src.series_store import FORECAST_SERIES_FILE, group_series, write_series
+
+SERIES_KEYS = ['zas', 'polluant']
+
+FORECASTS_FILE = 'forecasts.parquet'
+METRICS_FILE = 'metrics.parquet'
+
+
+# Raised by _time_limit. A BaseException, like KeyboardInterrupt, so that the catch-all handlers
+# of a candidate fit (src.order_selection.evaluate_order) or of statsmodels do not swallow it
+class SeriesTimeout(BaseException):
+    pass
+
+
+# Builds every daily (zas, polluant) series from the store's daily rollups (src.query), in one
+# grouped pass. Returns {(zas, polluant): pd.Series} with a daily frequency; days without data are
+# NaN (the state-space ARIMA handles them as missing observations).
+def build_series(store, start=None, end=None, zas=None, polluant=None, min_obs=30):
+    daily = ObservationQuery(store).daily(start=start, end=end, zas=zas, polluant=polluant, by=SERIES_KEYS)
+    series = {}
+    for key, group in daily.groupby(SERIES_KEYS, sort=True):
+        # Duplicate dates are averaged, as in run_model_and_forecast
+        ts = pd.Series(group['mean'].to_numpy(), index=pd.DatetimeIndex(group['date'], name='date de fin'),
+                       name='valeur').asfreq('D')
+        if ts.count() >= min_obs:
+            series[key] = ts
+    return series
+
+
+# Share of a series' time limit its order search may use; the rest is left to the fit
+ORDER_SEARCH_SHARE = 0.5
+
+
+# Fits one series and forecasts it. Runs in a worker process; the series travels as a float
+# array plus its first date to keep the pickled payload small.
+# timeout bounds the whole series: with an order_search (src.order_selection.OrderSearch), the
+# order is searched first, for at most ORDER_SEARCH_SHARE of it, then fitted in what remains. A
+# failed or timed-out search falls back to order; a found order is returned as the cache entry
+# result['order_entry'].
+def fit_series(key, values, first_date, order=(4, 2, 2), steps=7, holdout=7, timeout=None, order_search=None):
+    start = time.perf_counter()
+    result = _empty_result(key, values, first_date)
+    try:
+        with _time_limit(timeout), warnings.catch_warnings():
+            # Convergence warnings on hundreds of series would flood the task log; status and
+            # metrics are kept per series instead
+            warnings.simplefilter('ignore')
+            ts = pd.Series(values, index=pd.date_range(first_date, periods=len(values), freq='D'))
+            if order_search is not None:
+                order = _search_order(order_search, key, ts, order, timeout and timeout * ORDER_SEARCH_SHARE, result)
+            result['order'] = str(tuple(order))
+            model_fit = ARIMA(ts, order=order).fit()
+
+            # In-sample predictions for the last holdout days
+            predicted = model_fit.predict(start=len(ts) - holdout, end=len(ts) - 1).to_numpy()
+            result.update(holdout_metrics(values[-holdout:], predicted))
+            result['forecast'] = model_fit.get_forecast(steps=steps).predicted_mean.to_numpy()
+    except SeriesTimeout:
+        result['status'] = 'timeout'
+        result['error'] = f"series exceeded {timeout}s"
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+# Searched order of ts, or the default order when the search fails or exceeds timeout (the
+# reason is kept in result['order_error'])
+def _search_order(order_search, key, ts, default, timeout, result):
+    try:
+        with _time_limit(timeout):
+            found = order_search.search(ts)
+    except SeriesTimeout:
+        result['order_error'] = f"order search exceeded {timeout:g}s"
+    except Exception as e:
+        result['order_error'] = f"{type(e).__name__}: {e}"
+    else:
+        result['order_entry'] = order_search.cache_entry(ts, found)
+        return found['order']
+    print(f"Order search failed for {' / '.join(key)}, using {tuple(default)}: {result['order_error']}")
+    return default
+
+
+def _empty_result(key, values, first_date, status='ok', error=None):
+    return {'zas': key[0], 'polluant': key[1], 'n_obs': int(np.isfinite(values).sum()),
+            'first_date': first_date, 'last_date': first_date + pd.Timedelta(days=len(values) - 1),
+            'status': status, 'error': error, 'mae': np.nan, 'mse': np.nan, 'rmse': np.nan,
+            'forecast': None, 'seconds': 0.0, 'order': None, 'order_error': None}
+
+
+# MAE / MSE / RMSE on the days that have an observation
+def holdout_metrics(actual, predicted):
+    errors = np.asarray(actual, dtype=float) - np.asarray(predicted, dtype=float)
+    errors = errors[np.isfinite(errors)]
+    if errors.size == 0:
+        return {'mae': np.nan, 'mse': np.nan, 'rmse': np.nan}
+    mse = float(np.mean(errors ** 2))
+    return {'mae': float(np.mean(np.abs(errors))), 'mse': mse, 'rmse': float(np.sqrt(mse))}
+
+
+# Per-series timeout with SIGALRM. Signals can only be set from the main thread: elsewhere
+# (or without a timeout) the fit runs unbounded. An alarm already pending in the process (the
+# Airflow task timeout when fits run in the task process) is put back on exit with the time it
+# had left, and is left alone when it would fire before ours. This is also how fit_series bounds
+# the order search inside the limit of its series.
+class _time_limit:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.armed = bool(seconds) and threading.current_thread() is threading.main_thread()
+
+    def __enter__(self):
+        if self.armed:
+            self.outer, self.outer_interval = signal.getitimer(signal.ITIMER_REAL)
+            if self.outer and self.outer <= self.seconds:
+                self.armed = False
+                return self
+            self.started = time.monotonic()
+            self.previous = signal.signal(signal.SIGALRM, self._raise)
+            signal.setitimer(signal.ITIMER_REAL, self.seconds)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.armed:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self.previous)
+            if self.outer:
+                remaining = self.outer - (time.monotonic() - self.started)
+                signal.setitimer(signal.ITIMER_REAL, max(remaining, 1e-3), self.outer_interval)
+        return False
+
+    def _raise(self, signum, frame):
+        raise SeriesTimeout()
+
+
+# Batch forecasting over every (zas, polluant) series of the store. Fits run in a process pool,
+# longest series first so that the slowest fits do not end up alone at the tail of the run.
+# With an order_search (src.order_selection.OrderSearch), each series gets its own cached order.
+# A series whose cached order is stale is searched in its worker, within the series' time limit
+# (see fit_series): the search is sequential there, the pool already runs one series per core.
+# A series whose search fails or times out is fitted with the default order, and the reason is
+# kept in its metrics row (order_error).
+class ForecastEngine:
+    def __init__(self, order=(4, 2, 2), steps=7, holdout=7, timeout=120, workers=None, min_obs=30, order_search=None):
+        self.order = tuple(order)
+        self.order_search = order_search
+        self.steps = steps
+        self.holdout = holdout
+        self.timeout = timeout
+        self.workers = workers
+        self.min_obs = min_obs
+
+    def fit_all(self, series):
+        # Longest first: the executor hands out tasks in submission order
+        keys = sorted(series, key=lambda key: len(series[key]), reverse=True)
+        workers = min(self.workers or os.cpu_count() or 1, max(len(keys), 1))
+        payloads = [(key, series[key].to_numpy(dtype=float), series[key].index[0]) for key in keys]
+        cache, search = {}, None
+        if self.order_search is not None:
+            cache = self.order_search.load_cache()
+            # Searches run in the workers, sequentially: the pool already runs one series per core
+            search = copy.copy(self.order_search)
+            search.workers = 1
+        options = [self._fit_options(series[key], key, cache, search) for key in keys]
+
+        if workers == 1:
+            results = [fit_series(*payload, **kwargs) for payload, kwargs in zip(payloads, options)]
+        else:
+            results = []
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(fit_series, *payload, **kwargs)
+                           for payload, kwargs in zip(payloads, options)]
+                for future, (key, values, first_date) in zip(futures, payloads):
+                    try:
+                        results.append(future.result())
+                    except Exception as e:
+                        # Worker lost (crash, memory): only this series is reported as failed
+                        results.append(_empty_result(key, values, first_date, 'failed', f"{type(e).__name__}: {e}"))
+
+        if self.order_search is not None:
+            # The order cache is read and written once for the whole batch
+            for result, key in zip(results, keys):
+                entry = result.pop('order_entry', None)
+                if entry is not None:
+                    cache[' / '.join(key)] = entry
+            self.order_search.save_cache(cache)
+        return results
+
+    # fit_series arguments of a series: its cached order, or the search to run in its worker
+    def _fit_options(self, ts, key, cache, search):
+        options = {'order': self.order, 'steps': self.steps, 'holdout': self.holdout, 'timeout': self.timeout}
+        if search is None:
+            return options
+        order, reason = search.cached_order(ts, ' / '.join(key), cache)
+        if order is not None:
+            options['order'] = order
+        else:
+            print(f"Searching an order for {' / '.join(key)}: {reason}")
+            options['order_search'] = search
+        return options
+
+    # Builds the series, fits them and writes forecasts.parquet and metrics.parquet (and the
+    # forecasts.bin copy served by the API) to output_folder. Returns a summary of the run.
+    def run(self, store, output_folder, start=None, end=None, zas=None, polluant=None):
+        run_start = time.perf_counter()
+        with span('build_series') as s:
+            series = build_series(store, start=start, end=end, zas=zas, polluant=polluant, min_obs=self.min_obs)
+            s.add(rows_out=len(series))
+        print(f"{len(series)} series with at least {self.min_obs} observations")
+        with span('fit_all', workers=self.workers) as s:
+            results = self.fit_all(series)
+            s.add(rows_in=len(series), rows_out=len(results))
+
+        os.makedirs(output_folder, exist_ok=True)
+        with span('write_forecasts') as s:
+            forecasts = forecasts_table(results, self.steps)
+            metrics = metrics_table(results)
+            _write_atomic(forecasts, os.path.join(output_folder, FORECASTS_FILE))
+            _write_atomic(metrics, os.path.join(output_folder, METRICS_FILE))
+            write_forecast_series(forecasts, os.path.join(output_folder, FORECAST_SERIES_FILE))
+            s.add(files=3, rows_out=forecasts.num_rows)
+
+        statuses = pd.Series([result['status'] for result in results], dtype=object).value_counts().to_dict()
+        summary = {'series': len(results), 'statuses': statuses, 'seconds': time.perf_counter() - run_start,
+                   'fit_seconds': float(sum(result['seconds'] for result in results))}
+        print(f"{summary['series']} series fitted in {summary['seconds']:.1f}s "
+              f"({summary['fit_seconds']:.1f}s of fitting): {statuses}")
+        return summary
+
+
+# Long table: one row per (zas, polluant, forecast day), dictionary-encoded keys, float32 values
+def forecasts_table(results, steps):
+    fitted = [result for result in results if result['forecast'] is not None]
+    n = len(fitted)
+    dates = np.concatenate([
+        (result['last_date'] + pd.to_timedelta(np.arange(1, steps + 1), unit='D')).to_numpy()
+        for result in fitted]) if n else np.array([], dtype='datetime64[ns]')
+    values = np.concatenate([result['forecast'] for result in fitted]) if n else np.array([], dtype=float)
+    return pa.table({
+        'zas': pa.array(np.repeat([result['zas'] for result in fitted], steps).astype(object), pa.string())
+        .dictionary_encode(),
+        'polluant': pa.array(np.repeat([result['polluant'] for result in fitted], steps).astype(object), pa.string())
+        .dictionary_encode(),
+        'date': pa.array(dates, pa.timestamp('ns')),
+        'forecast': pa.array(values.astype(np.float32), pa.float32()),
+    })
+
+
+# The forecasts as a memory-mapped series store (src.series_store): one float32 series per
+# (zas, polluant), shared by the API workers instead of each loading forecasts.parquet
+def write_forecast_series(forecasts, path):
+    df = forecasts.select(SERIES_KEYS + ['date', 'forecast']).to_pandas()
+    write_series(path, group_series(df, SERIES_KEYS, 'date', 'forecast'), SERIES_KEYS)
+
+
+def metrics_table(results):
+    columns = ['zas', 'polluant', 'n_obs', 'first_date', 'last_date', 'mae', 'mse', 'rmse', 'seconds', 'status', 'error',
+               'order', 'order_error']
+    df = pd.DataFrame([{column: result[column] for column in columns} for result in results], columns=columns)
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def _write_atomic(table, path):
+    with atomic_path(path) as tmp_path:
+        pq.write_table(table, tmp_path, compression='zstd')
@@ -15,51 +15,72 @@ from pandas import (
     read_csv,
 )
 
-from requests import (
-    get,
-)
+from src.downloader import ConcurrentDownloader
+from src.instrumentation import span
+from src.ingestion import read_lcsqa_csv
 
 ##################################################################################################################
 class GazsData:
     # Initialisation de la classe avec le dossier de téléchargement des fichiers CSV.
-    def __init__(self, download_folder):
+    # Le manifeste (optionnel) mémorise l'état de chaque fichier entre deux runs.
+    def __init__(self, download_folder, manifest=None):
         self.download_folder = download_folder
+        self.manifest = manifest
         self.url = "https://files.data.gouv.fr/lcsqa/concentrations-de-polluants-atmospheriques-reglementes/temps-reel/"
 
-    # Télécharge les fichiers CSV depuis une URL donnée.
-    def download_csv_files(self, target_year="2024"):
-        downloaded_files = listdir(self.download_folder)
-        response = get(self.url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # Parcoure les dossiers de chaque année sur la page web.
-        for year_folder in soup.select('a[href$="/"]'):
-            year = year_folder['href'].strip('/')
-            if year == target_year:
-                year_url = self.url + year_folder['href']
-                response_year = get(year_url)
-                soup_year = BeautifulSoup(response_year.text, 'html.parser')
+    # Liste les fichiers CSV de l'année visée sur la page web : [(url, nom de fichier)].
+    def list_csv_files(self, target_year="2024", downloader=None):
+        own_downloader = downloader is None
+        if own_downloader:
+            downloader = ConcurrentDownloader(self.download_folder, manifest=self.manifest)
+        try:
+            with span('list_csv_files') as s:
+                soup = BeautifulSoup(downloader.get_text(self.url), 'html.parser')
 
-                # Parcoure les fichiers CSV dans chaque dossier annuel.
-                for csv_file in soup_year.select('a[href$=".csv"]'):
-                    csv_url = year_url + csv_file['href']
-                    csv_filename = path.join(self.download_folder, csv_file['href'])
+                # Parcoure les dossiers de chaque année sur la page web.
+                jobs = []
+                for year_folder in soup.select('a[href$="/"]'):
+                    year = year_folder['href'].strip('/')
+                    if year == target_year:
+                        year_url = self.url + year_folder['href']
+                        soup_year = BeautifulSoup(downloader.get_text(year_url), 'html.parser')
 
-                    # Si le fichier CSV n'a pas encore été téléchargé, le télécharge.
-                    if csv_file['href'] not in downloaded_files:
-                        with open(csv_filename, 'wb') as f:
-                            f.write(get(csv_url).content)
+                        # Parcoure les fichiers CSV dans chaque dossier annuel.
+                        for csv_file in soup_year.select('a[href$=".csv"]'):
+                            jobs.append((year_url + csv_file['href'], csv_file['href']))
+                s.add(files=len(jobs))
+            return jobs
+        finally:
+            if own_downloader:
+                downloader.close()
 
-                            print(f"Le fichier {csv_file['href']} a été téléchargé avec succès.")
+    # Télécharge les fichiers CSV depuis une URL donnée.
+    # Les fichiers sont récupérés en parallèle (max_workers) via une session HTTP partagée ;
+    # les fichiers déjà présents et inchangés côté serveur ne sont pas relus.
+    # jobs (liste de (url, nom)) limite le téléchargement à une partie des fichiers, sans relire l'index.
+    def download_csv_files(self, target_year="2024", max_workers=8, jobs=None):
+        downloader = ConcurrentDownloader(self.download_folder, manifest=self.manifest, max_workers=max_workers)
+        try:
+            if jobs is None:
+                jobs = self.list_csv_files(target_year, downloader=downloader)
+            with span('download') as s:
+                summary = downloader.download_all(jobs)
+                s.add(files=len(summary['downloaded']) + len(summary['resumed']))
+        finally:
+            downloader.close()
 
-                    downloaded_files.append(csv_file['href'])
+        print(f"{len(summary['downloaded'])} fichiers téléchargés, {len(summary['resumed'])} repris, "
+              f"{len(summary['skipped'])} inchangés, {len(summary['failed'])} en échec "
+              f"en {summary['seconds']:.1f}s.")
+        return summary
 
-    # Lit un fichier CSV spécifique et renvoie un DataFrame pandas.
-    def read_csv(self, f):
+    # Lit un fichier CSV spécifique et renvoie un DataFrame pandas typé selon le schéma LCSQA.
+    # columns limite la lecture aux colonnes utiles.
+    def read_csv(self, f, columns=None):
         file_path = path.join(self.download_folder, f)
 
         if path.getsize(file_path) > 0:  # Vérifie si le fichier n'est pas vide
-            df = read_csv(file_path, sep=';')
+            df = read_lcsqa_csv(file_path, columns=columns, parse_dates=True)
             return df
         else:
             print(f'Le fichier {f} est vide et ne peut pas être lu.')
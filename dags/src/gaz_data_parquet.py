@@ -1,12 +1,30 @@
 import pandas as pd
 import os
+import time
+from collections import defaultdict
 from datetime import datetime
 
+from src.instrumentation import span
+from src.manifest import Manifest, output_name
+from src.parquet_store import PartitionedParquetStore
+
+# Former single-file output, rewritten in full on every run
+LEGACY_OUTPUT_FILE = 'ZAG_PARIS_combined_output.parquet'
+# Partitioned dataset that replaces it, under the output folder
+STORE_FOLDER = 'ZAG_PARIS_dataset'
+# Same layout with every zone, used by the multi-series forecasting engine
+ALL_ZONES_STORE_FOLDER = 'ZAS_dataset'
+PARIS_ZAS = 'ZAG PARIS'
+
 class CSVtoParquetProcessor:
-    def __init__(self, input_folder_parquet, output_folder_parquet):
+    def __init__(self, input_folder_parquet, output_folder_parquet, manifest=None):
         self.input_folder_parquet = input_folder_parquet
         self.output_folder_parquet = output_folder_parquet
+        self.manifest = manifest
+        self.store = PartitionedParquetStore(os.path.join(output_folder_parquet, STORE_FOLDER))
         self.dataframes = []
+        # Raw file names whose output was read in this run (marked 'stored' once saved)
+        self.processed_names = []
         self.current_timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
 
     def check_today_files_exist(self):
@@ -17,63 +35,132 @@ class CSVtoParquetProcessor:
                 return True
         return False
 
+    # Processed CSV files to convert: taken from the manifest ('processed' state) when available,
+    # otherwise every CSV found in the input folder.
+    def pending_files(self):
+        if self.manifest is not None:
+            return [(name, output_name(name)) for name in self.manifest.names_in_state(Manifest.PROCESSED)]
+        return [(None, filename) for filename in os.listdir(self.input_folder_parquet)]
+
     def process_files(self):
-        if self.check_today_files_exist():
+        if self.manifest is None and self.check_today_files_exist():
             print("Today's files already exist. Skipping processing.")
             return
         
-        for filename in os.listdir(self.input_folder_parquet):
-            if filename.endswith('.csv'):
-                file_path = os.path.join(self.input_folder_parquet, filename)
-                df = pd.read_csv(file_path)
-                
-                # Normalize column names
-                df.columns = df.columns.str.strip().str.lower()
-                
-                # Print the column names for debugging
-                print(f"Columns in {filename}: {df.columns.tolist()}")
-                
-                # Extract the date from the filename
-                date_str = filename.split('_')[2]
-                file_date = datetime.strptime(date_str, '%Y-%m-%d')
-                
-                # Filter the DataFrame
-                if 'zas' in df.columns:
-                    df_filtered = df[df['zas'] == 'ZAG PARIS'].copy()
-                    
-                    if not df_filtered.empty:
-                        # Add dates to the DataFrame
-                        df_filtered.loc[:, 'file_date'] = file_date
-                        df_filtered.loc[:, 'processing_date'] = self.current_timestamp
-                        
-                        # Append to the list
-                        self.dataframes.append(df_filtered)
-                    else:
-                        print(f"No data for 'zag paris' in {filename}")
-                else:
-                    print(f"'zas' column not found in {filename}")
+        for raw_name, filename in self.pending_files():
+            if raw_name is not None:
+                self.processed_names.append(raw_name)
+            df_filtered = self.read_output_file(filename)
+            if df_filtered is not None:
+                # Append to the list
+                self.dataframes.append(df_filtered)
+
+    # Reads one processed CSV and returns its ZAG PARIS rows with file_date and processing_date,
+    # or None when there is nothing to keep.
+    def read_output_file(self, filename):
+        if not filename.endswith('.csv'):
+            return None
+        file_path = os.path.join(self.input_folder_parquet, filename)
+        # Text columns stay strings even when a file has them all empty, so that every
+        # file yields the same schema
+        df = pd.read_csv(file_path, dtype=defaultdict(lambda: str, {'valeur': 'float64'}))
+        return store_rows(df, filename, self.current_timestamp)
+
+    # Streaming alternative to process_files + concatenate_and_save: each file is read, filtered
+    # and handed to a StoreWriter right away, so memory stays bounded by one file and one month
+    # partition whatever the backlog. Returns a summary with rows/sec and bytes written.
+    def stream_files(self):
+        start = time.perf_counter()
+        self.import_legacy_output()
+        summary = {'files': 0, 'rows': 0, 'staged_bytes': 0, 'bytes': 0, 'partitions': []}
+
+        with self.store.writer() as writer:
+            for raw_name, filename in self.pending_files():
+                if raw_name is not None:
+                    self.processed_names.append(raw_name)
+                with span('stream_file', file=filename) as s:
+                    df_filtered = self.read_output_file(filename)
+                    summary['files'] += 1
+                    if df_filtered is not None:
+                        writer.write(df_filtered)
+                        s.add(files=1, rows_out=len(df_filtered))
+            with span('store_commit', store=self.store.root) as s:
+                partitions = writer.commit()
+                s.add(rows_in=writer.rows)
+            summary['rows'] = writer.rows
+            summary['staged_bytes'] = writer.staged_bytes
+
+        summary['partitions'] = [stat['partition'] for stat in partitions]
+        summary['bytes'] = summary['staged_bytes'] + sum(stat['bytes'] for stat in partitions)
+        summary['seconds'] = time.perf_counter() - start
+        summary['rows_per_second'] = summary['rows'] / summary['seconds'] if summary['seconds'] else 0.0
+        print(f"{summary['rows']} ZAG PARIS rows from {summary['files']} files streamed into {self.store.root} "
+              f"in {summary['seconds']:.1f}s ({summary['rows_per_second']:.0f} rows/s, "
+              f"{summary['bytes'] / 2**20:.2f} MB written, partitions: {', '.join(summary['partitions']) or 'none'})")
+
+        self.mark_stored()
+        return summary
+
+    # First run on the partitioned layout: import the former single-file output once
+    def import_legacy_output(self):
+        legacy_file_path = os.path.join(self.output_folder_parquet, LEGACY_OUTPUT_FILE)
+        if self.store.is_empty() and os.path.exists(legacy_file_path):
+            print(f"Importing {legacy_file_path} into {self.store.root}")
+            self.store.import_file(legacy_file_path)
 
+    def mark_stored(self):
+        if self.manifest is not None and self.processed_names:
+            self.manifest.mark(self.processed_names, Manifest.STORED)
+            self.processed_names = []
+
+    # Appends the collected rows to the partitioned store: only the months they fall into are
+    # rewritten, deduplicated on (date de fin, polluant, zas), and each month is replaced atomically.
     def concatenate_and_save(self):
         if self.dataframes:
             combined_df = pd.concat(self.dataframes, ignore_index=True)
-            
-            # Define the output file path
-            output_file_path = os.path.join(self.output_folder_parquet, 'ZAG_PARIS_combined_output.parquet')
-            
-            # Check if the Parquet file already exists
-            if os.path.exists(output_file_path):
-                existing_df = pd.read_parquet(output_file_path)
-                combined_df = pd.concat([existing_df, combined_df]).drop_duplicates().reset_index(drop=True)
-            
-            # Save the combined DataFrame to the Parquet file
-            combined_df.to_parquet(output_file_path, index=False)
-            if os.path.exists(output_file_path):
-                print(f"File updated successfully: {output_file_path}")
-            else:
-                print(f"Failed to update file: {output_file_path}")
+            self.import_legacy_output()
+            with span('store_commit', store=self.store.root) as s:
+                partitions = self.store.append(combined_df)
+                s.add(rows_in=len(combined_df))
+            print(f"Store updated successfully: {self.store.root} "
+                  f"({', '.join(stat['partition'] for stat in partitions)})")
+            self.dataframes = []
         else:
             print("No data for ZAG PARIS found in the files.")
 
+        self.mark_stored()
+
+# Extracts the date from a raw or processed file name (FR_E2_YYYY-MM-DD[_output].csv)
+def file_date_from_name(filename):
+    return datetime.strptime(filename.split('_')[2][:10], '%Y-%m-%d')
+
+# Normalizes a processed frame to the store schema: lower-case column names, rows of the given
+# zone (every zone when zas is None), plus file_date and processing_date.
+# Returns None when there is nothing to keep.
+def store_rows(df, filename, processing_date, zas=PARIS_ZAS):
+    # Normalize column names
+    df.columns = df.columns.str.strip().str.lower()
+
+    # Print the column names for debugging
+    print(f"Columns in {filename}: {df.columns.tolist()}")
+
+    # Extract the date from the filename
+    file_date = file_date_from_name(filename)
+
+    # Filter the DataFrame
+    if 'zas' not in df.columns:
+        print(f"'zas' column not found in {filename}")
+        return None
+    df_filtered = (df if zas is None else df[df['zas'] == zas]).copy()
+    if df_filtered.empty:
+        print(f"No data for '{(zas or 'any zone').lower()}' in {filename}")
+        return None
+
+    # Add dates to the DataFrame
+    df_filtered.loc[:, 'file_date'] = file_date
+    df_filtered.loc[:, 'processing_date'] = processing_date
+    return df_filtered
+
 # Example usage
 if __name__ == "__main__":
     input_folder_parquet = r'/opt/airflow/dags/data/gazs_output'
@@ -83,5 +170,4 @@ if __name__ == "__main__":
     #output_folder_parquet = r'/home/sofianne/dev/orchestration/data/gazs_output_parquet'
     
     processor = CSVtoParquetProcessor(input_folder_parquet, output_folder_parquet)
-    processor.process_files()
-    processor.concatenate_and_save()
+    processor.stream_files()
@@ -1,7 +1,9 @@
 import os
+import time
 import pandas as pd
 import numpy as np
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 from os import (
     listdir,
@@ -19,10 +21,20 @@ from requests import (
     get,
 )
 
+from src.aggregation import groupby_aggregate
+from src.ingestion import PROCESSOR_COLUMNS, parse_lcsqa_dates, read_lcsqa_csv, replace_values
+from src.instrumentation import span
+from src.manifest import Manifest, output_name
+
 class GazDataProcessor:
-    def __init__(self, input_folder, output_folder):
+    # agg_engine : 'vectorized' (réductions pandas/NumPy natives) ou 'python' (custom_agg groupe par groupe)
+    def __init__(self, input_folder, output_folder, manifest=None, agg_engine='vectorized'):
+        if agg_engine not in ('vectorized', 'python'):
+            raise ValueError(f"Unknown aggregation engine: {agg_engine}")
         self.input_folder = input_folder
         self.output_folder = output_folder
+        self.manifest = manifest
+        self.agg_engine = agg_engine
 
     # Définit une fonction d'agrégation personnalisée pour utiliser dans la méthode groupby
     def custom_agg(self, x):
@@ -33,61 +45,180 @@ class GazDataProcessor:
         else:
             return np.nan
 
-    # Traite les fichiers CSV pour nettoyer les données et extraire les informations pertinentes
-    def process_csv_files(self):
-        # Parcourir tous les fichiers du répertoire
+    # Agrège par clés : moyenne des colonnes numériques, première valeur des colonnes texte
+    def aggregate(self, data, keys):
+        if self.agg_engine == 'python':
+            return data.groupby(keys, observed=True).agg(self.custom_agg).reset_index()
+        return groupby_aggregate(data, keys, fallback=self.custom_agg)
+
+    # Liste les fichiers bruts à traiter : depuis le manifeste (état 'downloaded') si disponible,
+    # sinon en parcourant le dossier d'entrée et en ignorant les sorties déjà présentes.
+    def pending_files(self):
+        if self.manifest is not None:
+            return self.manifest.names_in_state(Manifest.DOWNLOADED)
+
+        file_names = []
         for file_name in os.listdir(self.input_folder):
             # Vérifier si le fichier est un fichier CSV et ne se termine pas par '_output.csv'
             if file_name.endswith('.csv') and not file_name.endswith('_output.csv'):
-                # Définir le chemin complet du fichier
-                file_path = os.path.join(self.input_folder, file_name)
-
                 # Vérifier si le fichier de sortie existe déjà
-                output_file_name = file_name[:-4] + '_output.csv'
-                output_file_path = os.path.join(self.output_folder, output_file_name)
-                if os.path.exists(output_file_path):
+                output_file_name = output_name(file_name)
+                if os.path.exists(os.path.join(self.output_folder, output_file_name)):
                     print(f"Output file {output_file_name} already exists in the output folder. Skipping this file.")
                     continue
-
-                # Charger les données
-                data = pd.read_csv(file_path, sep=';')
-
-                # Vérifier si les colonnes 'Polluant' et 'Zas' existent dans le DataFrame
-                if 'Polluant' not in data.columns or 'Zas' not in data.columns:
-                    print(f"'Polluant' or 'Zas' column not found in {file_name}. Skipping this file.")
-                    continue
-
-                # Remplacer les polluants selon les conditions données
-                data['Polluant'] = data['Polluant'].replace({'NO': 'NO2', 'NOX': 'NO2', 'NOX as NO2': 'NO2', 'PM2.5': 'PM25'})
-
-                # Supprimer les lignes contenant 'C6H6', 'SO2', et 'CO' dans la colonne 'Polluant'
-                data = data[~data['Polluant'].isin(['C6H6', 'SO2', 'CO'])]
-
-                # Définir les colonnes d'intérêt
-                cols_of_interest = ['Date de début', 'Date de fin', 'Polluant', 'valeur', 'code qualité', 'unité de mesure']
-
-                # Supprimer les lignes contenant des valeurs vides dans les colonnes d'intérêt
-                data = data.dropna(subset=cols_of_interest)
-
-                # Convertir 'Date de fin' au format datetime et extraire uniquement la date
-                data['Date de fin'] = pd.to_datetime(data['Date de fin']).dt.date
-
-                # Grouper par 'Date de fin', 'Polluant', et 'Zas' et calculer la moyenne de 'valeur'
-                # Garder aussi les autres colonnes en prenant la première valeur de chaque groupe
-                grouped_data = data.groupby(['Date de fin', 'Polluant', 'Zas']).agg(self.custom_agg).reset_index()
-
-                # Supprimer les colonnes spécifiées
-                grouped_data = grouped_data.drop(columns=['taux de saisie', 'couverture temporelle', 'couverture de données'])
-                grouped_data['unité de mesure'] = grouped_data['unité de mesure'].str.replace('Â', '')
-
-                # Sélectionner les colonnes à conserver selon l'analyse
-                cols_to_keep = ['Date de fin', 'Polluant', 'Zas', "type d'implantation", "type d'influence", "type d'évaluation", 'procédure de mesure', 'valeur', 'code qualité', 'unité de mesure']
-
-                # Créer un nouveau DataFrame contenant uniquement les colonnes à conserver
-                final_data = grouped_data[cols_to_keep]
-
-                # Sauvegarder le DataFrame final dans un nouveau fichier CSV
-                final_data.to_csv(output_file_path, index=False)
+                file_names.append(file_name)
+        return file_names
+
+    # Nettoie et agrège les mesures horaires d'un fichier brut ; renvoie None si les colonnes
+    # 'Polluant' ou 'Zas' sont absentes.
+    def clean_data(self, data):
+        # Vérifier si les colonnes 'Polluant' et 'Zas' existent dans le DataFrame
+        if 'Polluant' not in data.columns or 'Zas' not in data.columns:
+            return None
+
+        # Remplacer les polluants selon les conditions données
+        data['Polluant'] = replace_values(data['Polluant'], {'NO': 'NO2', 'NOX': 'NO2', 'NOX as NO2': 'NO2', 'PM2.5': 'PM25'})
+
+        # Supprimer les lignes contenant 'C6H6', 'SO2', et 'CO' dans la colonne 'Polluant'
+        data = data[~data['Polluant'].isin(['C6H6', 'SO2', 'CO'])]
+
+        # Définir les colonnes d'intérêt
+        cols_of_interest = ['Date de début', 'Date de fin', 'Polluant', 'valeur', 'code qualité', 'unité de mesure']
+
+        # Supprimer les lignes contenant des valeurs vides dans les colonnes d'intérêt
+        data = data.dropna(subset=cols_of_interest)
+
+        # Sélectionner les colonnes à conserver selon l'analyse
+        cols_to_keep = ['Date de fin', 'Polluant', 'Zas', "type d'implantation", "type d'influence", "type d'évaluation", 'procédure de mesure', 'valeur', 'code qualité', 'unité de mesure']
+        if data.empty:
+            return pd.DataFrame(columns=cols_to_keep)
+
+        # Convertir 'Date de fin' au format datetime et extraire uniquement la date
+        data['Date de fin'] = parse_lcsqa_dates(data['Date de fin']).dt.date
+
+        # Grouper par 'Date de fin', 'Polluant', et 'Zas' et calculer la moyenne de 'valeur'
+        # Garder aussi les autres colonnes en prenant la première valeur de chaque groupe
+        grouped_data = self.aggregate(data, ['Date de fin', 'Polluant', 'Zas'])
+
+        # Supprimer les colonnes spécifiées
+        grouped_data = grouped_data.drop(columns=['taux de saisie', 'couverture temporelle', 'couverture de données'], errors='ignore')
+        grouped_data['unité de mesure'] = grouped_data['unité de mesure'].str.replace('Â', '')
+
+        # Créer un nouveau DataFrame contenant uniquement les colonnes à conserver
+        return grouped_data[cols_to_keep]
+
+    # Traite un fichier brut et écrit son *_output.csv ; renvoie le statut et le nombre de lignes écrites
+    def process_file(self, file_name):
+        # Définir le chemin complet du fichier
+        file_path = os.path.join(self.input_folder, file_name)
+        output_file_path = os.path.join(self.output_folder, output_name(file_name))
+
+        # Charger les données : colonnes utiles seulement, types déclarés ('valeur' reste en float64
+        # pour que les moyennes écrites soient identiques à celles des runs précédents)
+        with span('read_csv', file=file_name) as s:
+            data = read_lcsqa_csv(file_path, columns=PROCESSOR_COLUMNS, dtypes={'valeur': 'float64'})
+            s.add(files=1, rows_out=len(data))
+        if data.empty:
+            print(f"Le fichier {file_name} est vide. Skipping this file.")
+            return Manifest.SKIPPED, 0
+
+        with span('clean', file=file_name) as s:
+            final_data = self.clean_data(data)
+            s.add(rows_in=len(data), rows_out=0 if final_data is None else len(final_data))
+        if final_data is None:
+            print(f"'Polluant' or 'Zas' column not found in {file_name}. Skipping this file.")
+            return Manifest.SKIPPED, 0
+
+        # Sauvegarder le DataFrame final dans un nouveau fichier CSV
+        with span('write_csv', file=file_name) as s:
+            final_data.to_csv(output_file_path, index=False)
+            s.add(files=1, rows_in=len(final_data))
+        return Manifest.PROCESSED, len(final_data)
+
+    # Traite une liste de fichiers en isolant les erreurs : un fichier en échec n'arrête pas les autres
+    def process_batch(self, file_names):
+        results = []
+        for file_name in file_names:
+            try:
+                status, rows = self.process_file(file_name)
+                results.append((file_name, status, rows, None))
+            except Exception as e:
+                results.append((file_name, 'failed', 0, f"{type(e).__name__}: {e}"))
+        return results
+
+    # Traite les fichiers CSV pour nettoyer les données et extraire les informations pertinentes.
+    # workers > 1 (ou None pour tous les coeurs) répartit les fichiers sur un pool de processus,
+    # par lots d'environ batch_bytes pour amortir le coût de chaque tâche.
+    def process_csv_files(self, workers=1, batch_bytes=32 * 1024 * 1024, raise_on_error=True):
+        start = time.perf_counter()
+        file_names = self.pending_files()
+        workers = min(workers or os.cpu_count() or 1, max(len(file_names), 1))
+        summary = {'processed': [], 'skipped': [], 'failed': {}, 'rows': 0, 'workers': workers}
+
+        if workers == 1:
+            for file_name in file_names:
+                self._collect(summary, self.process_batch([file_name]))
+        else:
+            batches = self.make_batches(file_names, batch_bytes, workers)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_process_batch, self.input_folder, self.output_folder, self.agg_engine, batch)
+                           for batch in batches]
+                for future, batch in zip(futures, batches):
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        # Worker perdu (crash, mémoire) : tout le lot est marqué en échec.
+                        results = [(file_name, 'failed', 0, f"{type(e).__name__}: {e}") for file_name in batch]
+                    self._collect(summary, results)
+
+        summary['seconds'] = time.perf_counter() - start
+        print(f"{len(summary['processed'])} files processed, {len(summary['skipped'])} skipped, "
+              f"{len(summary['failed'])} failed ({summary['rows']} rows) in {summary['seconds']:.1f}s "
+              f"with {workers} worker(s).")
+        for file_name, error in summary['failed'].items():
+            print(f"Failed to process {file_name}: {error}")
+        if raise_on_error and summary['failed']:
+            raise RuntimeError(f"{len(summary['failed'])} file(s) failed: {sorted(summary['failed'])}")
+        return summary
+
+    # Regroupe les petits fichiers en lots de taille voisine, environ batches_per_worker lots par
+    # worker (quatre par défaut, pour que les workers finissent ensemble) et au plus batch_bytes par lot
+    def make_batches(self, file_names, batch_bytes, workers, batches_per_worker=4):
+        sizes = {}
+        for file_name in file_names:
+            record = self.manifest.get(file_name) if self.manifest is not None else None
+            sizes[file_name] = record['size'] if record is not None and record['size'] is not None \
+                else os.path.getsize(os.path.join(self.input_folder, file_name))
+        total = sum(sizes.values())
+        target = max(1, min(batch_bytes, total // (workers * batches_per_worker)))
+
+        batches, current, current_bytes = [], [], 0
+        # Les plus gros fichiers d'abord, pour équilibrer la fin du traitement
+        for file_name in sorted(file_names, key=sizes.get, reverse=True):
+            current.append(file_name)
+            current_bytes += sizes[file_name]
+            if current_bytes >= target:
+                batches.append(current)
+                current, current_bytes = [], 0
+        if current:
+            batches.append(current)
+        return batches
+
+    def _collect(self, summary, results):
+        for file_name, status, rows, error in results:
+            if status == 'failed':
+                summary['failed'][file_name] = error
+                continue
+            summary[status].append(file_name)
+            summary['rows'] += rows
+            if self.manifest is not None:
+                self.manifest.mark(file_name, status)
+
+
+# Point d'entrée des workers : un processeur sans manifeste, le processus parent met à jour les états
+def _process_batch(input_folder, output_folder, agg_engine, file_names):
+    processor = GazDataProcessor(input_folder, output_folder, agg_engine=agg_engine)
+    return processor.process_batch(file_names)
 
 if __name__ == "__main__":
     # Dossiers pour le traitement des données
@@ -0,0 +1,123 @@
+import os
+
+import pandas as pd
+
+# Schéma déclaré des fichiers temps réel LCSQA (FR_E2_AAAA-MM-JJ.csv).
+LCSQA_SEPARATOR = ';'
+LCSQA_DATE_FORMAT = '%Y/%m/%d %H:%M:%S'
+LCSQA_DATE_COLUMNS = ['Date de début', 'Date de fin']
+LCSQA_DTYPES = {
+    # Les dates horaires ne prennent que 24 valeurs par fichier : lues en catégories,
+    # elles sont converties une seule fois par valeur distincte (voir parse_lcsqa_dates).
+    'Date de début': 'category',
+    'Date de fin': 'category',
+    'Organisme': 'category',
+    'code zas': 'category',
+    'Zas': 'category',
+    'code site': 'category',
+    'nom site': 'category',
+    "type d'implantation": 'category',
+    'Polluant': 'category',
+    "type d'influence": 'category',
+    'discriminant': 'category',
+    'Réglementaire': 'category',
+    "type d'évaluation": 'category',
+    'procédure de mesure': 'category',
+    'type de valeur': 'category',
+    'valeur': 'float32',
+    'valeur brute': 'float32',
+    'unité de mesure': 'category',
+    'taux de saisie': 'float32',
+    'couverture temporelle': 'float32',
+    'couverture de données': 'float32',
+    'code qualité': 'category',
+    'validité': 'float32',
+}
+
+# Colonnes réellement utilisées par GazDataProcessor.clean_data
+PROCESSOR_COLUMNS = [
+    'Date de début', 'Date de fin', 'Polluant', 'Zas', "type d'implantation", "type d'influence",
+    "type d'évaluation", 'procédure de mesure', 'valeur', 'code qualité', 'unité de mesure',
+]
+
+try:
+    import pyarrow  # noqa: F401
+    DEFAULT_ENGINE = 'pyarrow'
+except ImportError:
+    DEFAULT_ENGINE = 'c'
+
+
+# Lit un fichier LCSQA avec des types déclarés et uniquement les colonnes demandées.
+# Le moteur CSV pyarrow (multithreadé) est utilisé s'il est installé, sinon le moteur C.
+# dtypes permet de surcharger le schéma (ex. {'valeur': 'float64'}).
+def read_lcsqa_csv(file_path, columns=None, dtypes=None, parse_dates=False, engine=None):
+    if os.path.getsize(file_path) == 0:
+        return pd.DataFrame(columns=columns or [])
+
+    schema = dict(LCSQA_DTYPES)
+    schema.update(dtypes or {})
+    # usecols en fonction : les colonnes absentes d'un fichier mal formé ne provoquent pas d'erreur
+    usecols = None
+    if columns is not None:
+        wanted = set(columns)
+        usecols = lambda column: column in wanted
+
+    engine = engine or DEFAULT_ENGINE
+    try:
+        data = _read(file_path, usecols, schema, engine)
+    except (ImportError, ValueError, TypeError, NotImplementedError):
+        if engine == 'c':
+            raise
+        # Option non gérée par le moteur pyarrow ou fichier qu'il refuse : repli sur le moteur C.
+        data = _read(file_path, usecols, schema, 'c')
+
+    for column in data.columns:
+        if isinstance(data[column].dtype, pd.CategoricalDtype):
+            data[column] = sort_categories(data[column])
+    if parse_dates:
+        for column in LCSQA_DATE_COLUMNS:
+            if column in data.columns:
+                data[column] = parse_lcsqa_dates(data[column])
+    return data
+
+
+def _read(file_path, usecols, schema, engine):
+    if engine == 'pyarrow' and callable(usecols):
+        # Le moteur pyarrow n'accepte qu'une liste de colonnes existantes.
+        header = pd.read_csv(file_path, sep=LCSQA_SEPARATOR, nrows=0).columns
+        usecols = [column for column in header if usecols(column)]
+    return pd.read_csv(file_path, sep=LCSQA_SEPARATOR, usecols=usecols, dtype=schema, engine=engine)
+
+
+# Catégories triées : un groupby sur la colonne donne alors le même ordre qu'en objet.
+def sort_categories(series):
+    categories = series.cat.categories
+    if categories.is_monotonic_increasing:
+        return series
+    return series.cat.reorder_categories(categories.sort_values())
+
+
+# Convertit une colonne de dates LCSQA au format explicite ; pour une catégorie,
+# seules les valeurs distinctes sont analysées.
+def parse_lcsqa_dates(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = _to_datetime(pd.Series(series.cat.categories))
+        return pd.Series(categories.to_numpy()[series.cat.codes.to_numpy()], index=series.index, name=series.name) \
+            .where(series.cat.codes.to_numpy() >= 0)
+    return _to_datetime(series)
+
+
+def _to_datetime(series):
+    try:
+        return pd.to_datetime(series, format=LCSQA_DATE_FORMAT)
+    except (ValueError, TypeError):
+        # Format inattendu (export ISO, etc.) : inférence par pandas.
+        return pd.to_datetime(series)
+
+
+# Remplace des valeurs ; pour une catégorie, le remplacement porte sur les catégories seulement.
+def replace_values(series, mapping):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories
+        return series.map({category: mapping.get(category, category) for category in categories})
+    return series.replace(mapping)
@@ -0,0 +1,323 @@
+import bisect
+import contextvars
+import functools
+import json
+import os
+import resource
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from src.atomic import atomic_path
+
+# Folder of the span log (spans.jsonl) and of the Prometheus textfiles (<task>.prom).
+# Instrumentation is off unless it is set or configure() is called.
+METRICS_DIR_ENV = 'GAZ_METRICS_DIR'
+# Task run of the current process, inherited by pool workers: "<task>/<run id>"
+TASK_ENV = 'GAZ_METRICS_TASK'
+SPANS_FILE = 'spans.jsonl'
+# Upper bounds of the duration histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+COUNTERS = ('rows_in', 'rows_out', 'bytes_read', 'bytes_written', 'files', 'cpu_seconds')
+
+_config = {'enabled': False, 'folder': None}
+_lock = threading.Lock()
+# Open spans of the current thread or asyncio task, innermost last
+_stack = contextvars.ContextVar('gaz_spans', default=())
+_task = contextvars.ContextVar('gaz_task', default=None)
+
+
+# Turns instrumentation on. With a folder, every span is appended to <folder>/spans.jsonl and
+# task() writes <folder>/<task>.prom; without one, spans only feed live_stats (API /metrics).
+def configure(folder=None, enabled=True):
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    _config.update(enabled=enabled, folder=folder or None)
+
+
+def enabled():
+    return _config['enabled']
+
+
+# Timed section of a stage, as a context manager:
+#     with span('read_csv', file=file_name) as s:
+#         df = ...
+#         s.add(rows_out=len(df))
+# Records wall time and, with resources=True, CPU time (pool workers included once they have
+# exited), bytes read/written (/proc/self/io) and peak RSS of the process. Those are process-wide: spans running concurrently in threads or
+# asyncio tasks (downloads, API requests) use resources=False and report their own counts.
+# When instrumentation is off, the shared no-op span is returned.
+def span(name, resources=True, **labels):
+    if not _config['enabled']:
+        return _NOOP
+    return Span(name, labels, resources)
+
+
+# Decorator form of span(), named after the function by default
+def instrumented(name=None, resources=True):
+    def decorate(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            if not _config['enabled']:
+                return fn(*args, **kwargs)
+            with Span(span_name, {}, resources):
+                return fn(*args, **kwargs)
+        return call
+    return decorate
+
+
+# Root span of an Airflow task. The spans it contains, including those of its process pool
+# workers, are tagged with the task; at the end their totals are written to <folder>/<name>.prom
+# for the node exporter's textfile collector. Each instance of a mapped task passes its shard
+# (map index): it writes <folder>/<name>_<shard>.prom, with a shard label on every series.
+@contextmanager
+def task(name, shard=None):
+    if not _config['enabled']:
+        yield _NOOP
+        return
+    tag = f'{name}/{uuid.uuid4().hex[:8]}'
+    spans_path = _spans_path()
+    offset = os.path.getsize(spans_path) if spans_path and os.path.exists(spans_path) else 0
+    previous_env = os.environ.get(TASK_ENV)
+    os.environ[TASK_ENV] = tag
+    token = _task.set(tag)
+    try:
+        with Span(name, {}, True) as root:
+            yield root
+    finally:
+        _task.reset(token)
+        if previous_env is None:
+            os.environ.pop(TASK_ENV, None)
+        else:
+            os.environ[TASK_ENV] = previous_env
+        if spans_path:
+            file_name = f'{name}.prom' if shard is None else f'{name}_{shard}.prom'
+            write_textfile(read_spans(spans_path, offset, tag), os.path.join(_config['folder'], file_name),
+                           labels=None if shard is None else {'shard': shard})
+
+
+class Span:
+    __slots__ = ('name', 'labels', 'resources', 'counts', 'peak', '_token', '_started_at', '_start', '_cpu', '_io')
+
+    def __init__(self, name, labels, resources):
+        self.name = name
+        self.labels = labels
+        self.resources = resources
+        self.counts = {}
+        self.peak = 0
+
+    # Adds to the span's counters (rows_in, rows_out, bytes_read, bytes_written, files, ...)
+    def add(self, **counts):
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    def __enter__(self):
+        stack = _stack.get()
+        self._token = _stack.set(stack + (self,))
+        if self.resources:
+            # The peak is reset for this span: enclosing spans keep the peak reached so far
+            peak = peak_rss_bytes()
+            for parent in stack:
+                parent.peak = max(parent.peak, peak)
+            reset_peak_rss()
+            self._io = _io_bytes()
+            self._cpu = _cpu_seconds()
+        self._started_at = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._start
+        stack = _stack.get()
+        _stack.reset(self._token)
+        parent = stack[-2] if len(stack) > 1 else None
+        record = {'span': self.name, 'parent': parent.name if parent is not None else None,
+                  'task': _current_task(), 'at': round(self._started_at, 3), 'pid': os.getpid(),
+                  'seconds': seconds, 'status': 'error' if exc_type is not None else 'ok'}
+        record.update(self.labels)
+        if self.resources:
+            read, written = _io_bytes()
+            self.add(cpu_seconds=_cpu_seconds() - self._cpu, bytes_read=read - self._io[0],
+                     bytes_written=written - self._io[1])
+            self.peak = max(self.peak, peak_rss_bytes())
+            if parent is not None:
+                parent.peak = max(parent.peak, self.peak)
+            record['peak_rss_bytes'] = self.peak
+        record.update(self.counts)
+        _emit(record)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def add(self, **counts):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+# Totals per (task, span): count, duration histogram, counters, errors and peak RSS.
+# Fed live by every span of the process, or from the span log for a task.
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.series = {}
+
+    def add(self, record):
+        task = (record.get('task') or '').split('/')[0]
+        with self._lock:
+            entry = self.series.get((task, record['span']))
+            if entry is None:
+                entry = self.series[(task, record['span'])] = {
+                    'count': 0, 'seconds': 0.0, 'errors': 0, 'peak_rss_bytes': 0, 'buckets': [0] * (len(BUCKETS) + 1),
+                    **{counter: 0 for counter in COUNTERS}}
+            entry['count'] += 1
+            entry['seconds'] += record['seconds']
+            entry['buckets'][bisect.bisect_left(BUCKETS, record['seconds'])] += 1
+            entry['errors'] += record['status'] == 'error'
+            entry['peak_rss_bytes'] = max(entry['peak_rss_bytes'], record.get('peak_rss_bytes', 0))
+            for counter in COUNTERS:
+                entry[counter] += record.get(counter, 0)
+
+    # Prometheus text exposition format. cumulative=True (stats of a live process): counters and a
+    # duration histogram that only grow. cumulative=False (textfile of one task run, rewritten by
+    # every run): the totals of that run as gauges, since values falling back between runs would be
+    # read as counter resets by rate(). extra_labels are added to every series.
+    def render(self, cumulative=True, extra_labels=None):
+        with self._lock:
+            series = sorted(self.series.items())
+        lines = []
+        if cumulative:
+            metrics = [('gaz_stage_duration_seconds', 'histogram', 'Wall time of the stage'),
+                       ('gaz_stage_errors_total', 'counter', 'Stage runs that raised')]
+            metrics += [(f'gaz_stage_{counter}_total', 'counter',
+                         f'{counter.replace("_", " ").capitalize()} of the stage') for counter in COUNTERS]
+        else:
+            metrics = [('gaz_stage_seconds', 'gauge', 'Wall time of the stage in the last run'),
+                       ('gaz_stage_count', 'gauge', 'Stage runs in the last run'),
+                       ('gaz_stage_errors', 'gauge', 'Stage runs that raised in the last run')]
+            metrics += [(f'gaz_stage_{counter}', 'gauge',
+                         f'{counter.replace("_", " ").capitalize()} of the stage in the last run')
+                        for counter in COUNTERS]
+        metrics.append(('gaz_stage_peak_rss_bytes', 'gauge', 'Peak resident memory during the stage'))
+        extra = ''.join(f',{key}="{_escape(value)}"' for key, value in (extra_labels or {}).items())
+        for metric, kind, help_text in metrics:
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} {kind}']
+            for (task, name), entry in series:
+                labels = f'task="{_escape(task)}",stage="{_escape(name)}"{extra}'
+                if kind == 'histogram':
+                    below = 0
+                    for bound, n in zip(BUCKETS + ('+Inf',), entry['buckets']):
+                        below += n
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {below}')
+                    lines.append(f'{metric}_sum{{{labels}}} {entry["seconds"]:.6f}')
+                    lines.append(f'{metric}_count{{{labels}}} {entry["count"]}')
+                else:
+                    key = metric[len('gaz_stage_'):]
+                    key = key[:-len('_total')] if key.endswith('_total') else key
+                    lines.append(f'{metric}{{{labels}}} {entry[key]:g}')
+        return '\n'.join(lines) + '\n'
+
+
+# Spans of this process since it started (served by the API's /metrics)
+live_stats = Stats()
+
+
+# Records of the span log from byte offset onwards, for one task run when tag is given
+def read_spans(path, offset=0, tag=None):
+    records = []
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # line being written by another process
+            if tag is None or record.get('task') == tag:
+                records.append(record)
+    return records
+
+
+# Prometheus textfile of the given records (last-run gauges), replaced atomically as the collector requires
+def write_textfile(records, path, labels=None):
+    stats = Stats()
+    for record in records:
+        stats.add(record)
+    with atomic_path(path) as tmp_path, open(tmp_path, 'w') as f:
+        f.write(stats.render(cumulative=False, extra_labels=labels))
+
+
+def _emit(record):
+    live_stats.add(record)
+    path = _spans_path()
+    if path:
+        line = json.dumps(record, default=str) + '\n'
+        with _lock, open(path, 'a') as f:
+            f.write(line)
+
+
+def _spans_path():
+    return os.path.join(_config['folder'], SPANS_FILE) if _config['folder'] else None
+
+
+def _current_task():
+    return _task.get() or os.environ.get(TASK_ENV)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# CPU time of the process plus that of its terminated children (process pools shut down in the span)
+def _cpu_seconds():
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+# rchar/wchar of /proc/self/io (files and sockets, page cache included)
+def _io_bytes():
+    counters = {}
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                key, value = line.split(':')
+                counters[key] = int(value)
+    except OSError:
+        pass
+    return counters.get('rchar', 0), counters.get('wchar', 0)
+
+
+# Peak resident memory since the last reset: writing 5 to clear_refs resets VmHWM (Linux);
+# elsewhere this is the process-wide maximum.
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_bytes():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+if os.environ.get(METRICS_DIR_ENV):
+    configure(os.environ[METRICS_DIR_ENV])
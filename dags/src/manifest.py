@@ -0,0 +1,91 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+# Manifeste persistant des fichiers LCSQA (SQLite), indexé par nom de fichier brut.
+# Il remplace les listdir / os.path.exists de chaque étape : chaque fichier y a
+# sa taille, son empreinte, les validateurs HTTP distants et son état de traitement.
+class Manifest:
+    DOWNLOADED = 'downloaded'  # fichier brut complet sur disque
+    PROCESSED = 'processed'    # *_output.csv écrit par GazDataProcessor
+    STORED = 'stored'          # intégré au Parquet par CSVtoParquetProcessor
+    SKIPPED = 'skipped'        # fichier sans données exploitables
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                name TEXT PRIMARY KEY,
+                size INTEGER,
+                sha256 TEXT,
+                etag TEXT,
+                last_modified REAL,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS files_state ON files (state)')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, name):
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM files WHERE name = ?', (name,)).fetchone()
+        return dict(row) if row is not None else None
+
+    # Enregistre un téléchargement vérifié ; le fichier repasse à l'état 'downloaded'
+    # pour que les étapes suivantes le retraitent s'il a changé.
+    def record_download(self, name, size, sha256, etag=None, last_modified=None):
+        with self._lock:
+            self._conn.execute('''
+                INSERT INTO files (name, size, sha256, etag, last_modified, state, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET
+                    size = excluded.size, sha256 = excluded.sha256, etag = excluded.etag,
+                    last_modified = excluded.last_modified, state = excluded.state,
+                    updated_at = excluded.updated_at''',
+                (name, size, sha256, etag, last_modified, self.DOWNLOADED, time.time()))
+
+    def mark(self, names, state):
+        if isinstance(names, str):
+            names = [names]
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany('UPDATE files SET state = ?, updated_at = ? WHERE name = ?',
+                                   [(state, now, name) for name in names])
+            self._conn.execute('COMMIT')
+
+    # Noms des fichiers dans un état donné (requête sur index, sans toucher au disque).
+    def names_in_state(self, state):
+        with self._lock:
+            rows = self._conn.execute('SELECT name FROM files WHERE state = ? ORDER BY name', (state,)).fetchall()
+        return [row['name'] for row in rows]
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute('SELECT state, COUNT(*) AS n FROM files GROUP BY state').fetchall()
+        return {row['state']: row['n'] for row in rows}
+
+
+# Nom du fichier produit par GazDataProcessor pour un fichier brut donné.
+def output_name(raw_name):
+    return raw_name[:-4] + '_output.csv'
+
+
+def default_manifest_path(data_folder):
+    return os.path.join(data_folder, 'manifest.sqlite')
@@ -4,37 +4,47 @@ from sklearn.metrics import mean_absolute_error, mean_squared_error
 import numpy as np
 from statsmodels.tsa.stattools import acf
 import joblib
-import json
-
-def run_model_and_forecast(historical_file_path, new_day_file_path):
-    # Read the parquet files
-    historical_df = pd.read_parquet(historical_file_path)
-    new_day_df = pd.read_parquet(new_day_file_path)
-
-    # Combine the two dataframes
-    df = pd.concat([historical_df, new_day_df])
-
-    # Convert 'date_de_fin' to datetime
-    df['date de fin'] = pd.to_datetime(df['date de fin'])
-
-    # Sort by date
-    df = df.sort_values('date de fin')
-
-    # Set the date as the index
-    df.set_index('date de fin', inplace=True)
-
-    # Only keep the 'valeur' column for forecasting
-    ts = df['valeur']
-
-    # Remove duplicate dates by averaging their values
-    ts = ts.groupby(ts.index).mean()
-
-    # Ensure the time series has a daily frequency
-    ts = ts.asfreq('D')
-
-    # Define the ARIMA model
-    model = ARIMA(ts, order=(4, 2, 2))  # (p, d, q) parameters should be tuned
-    model_fit = model.fit()
+from src.query import ObservationQuery
+from src.warm_start import fit_or_update
+from src.compact_model import export_forecaster
+from src.model_output import OUTPUT_KEYS, build_output, dumps, output_series
+from src.series_store import write_series
+from src.instrumentation import span
+
+# With a refit policy (src.warm_start.RefitPolicy), the results saved at model_path are updated
+# with the new days and only refit in full on schedule or on metric drift.
+# With an order search (src.order_selection.OrderSearch), the (p, d, q) order is selected on the
+# series (cached until the data materially changes) instead of the fixed order.
+# With a forecaster_path, a forecast-only export of the results (src.compact_model) is written
+# there as well, for the API.
+# With a series_path, the output series are also written there as a memory-mappable float32
+# store (src.series_store), from which the API serves /history/.
+def run_model_and_forecast(historical_file_path, new_day_file_path, model_path='model.pkl', policy=None,
+                           order=(4, 2, 2), order_search=None, forecaster_path=None, series_path=None):
+    # Daily mean of every observation of both sources (new_day_file_path may be the partitioned
+    # store), computed from their daily rollups rather than from the rows
+    with span('read_observations') as s:
+        ts = ObservationQuery(historical_file_path, new_day_file_path).daily_mean()
+        s.add(rows_out=len(ts))
+
+    if order_search is not None:
+        with span('order_search') as s:
+            s.add(rows_in=len(ts))
+            # A failed search keeps the default order rather than failing the run
+            try:
+                order = order_search.select(ts, key='ZAG PARIS')
+            except Exception as e:
+                print(f"Order search failed, using {order}: {type(e).__name__}: {e}")
+
+    with span('fit', order=list(order)) as s:
+        s.add(rows_in=len(ts))
+        if policy is not None:
+            # Warm start: the decision (update or refit, and why) is printed and logged next to the model
+            model_fit, decision = fit_or_update(ts, model_path, order=order, policy=policy)
+        else:
+            # Define the ARIMA model
+            model = ARIMA(ts, order=order)
+            model_fit = model.fit()
 
     # Summary of the model
     print(model_fit.summary())
@@ -46,8 +56,10 @@ def run_model_and_forecast(historical_file_path, new_day_file_path):
 
     # Forecast the next 7 days
     steps = 7
-    forecast = model_fit.get_forecast(steps=steps)
-    forecast_values = forecast.predicted_mean
+    with span('forecast') as s:
+        forecast = model_fit.get_forecast(steps=steps)
+        forecast_values = forecast.predicted_mean
+        s.add(rows_out=steps)
 
     # Create date range for forecast
     forecast_index = pd.date_range(start=ts.index[-1] + pd.Timedelta(days=1), periods=steps, freq='D')
@@ -79,8 +91,12 @@ def run_model_and_forecast(historical_file_path, new_day_file_path):
     mape = np.mean(np.abs((actual_values - in_sample_forecast) / actual_values)) * 100
     print(f"Mean Absolute Percentage Error (MAPE): {mape}%")
 
-    # Save the model
-    joblib.dump(model_fit, 'model.pkl')
+    # Save the model (fit_or_update already saved it with its metadata)
+    with span('save_model'):
+        if policy is None:
+            joblib.dump(model_fit, model_path)
+        if forecaster_path is not None:
+            export_forecaster(model_fit, forecaster_path)
 
     # Prepare JSON output
     metrics = {
@@ -91,32 +107,22 @@ def run_model_and_forecast(historical_file_path, new_day_file_path):
         "MAPE": mape
     }
 
-    forecast_data = [
-        {"date": date.strftime("%Y-%m-%d"), "value": value, "type": "forecast"}
-        for date, value in forecast_series.items()
-    ]
-
-    historical_data = [
-        {"date": date.strftime("%Y-%m-%d"), "value": value, "type": "historical"}
-        for date, value in ts.items()
-    ]
-
-    in_sample_forecast_data = [
-        {"date": date.strftime("%Y-%m-%d"), "value": value, "type": "historical_forecast"}
-        for date, value in zip(actual_values.index, in_sample_forecast)
-    ]
-
-    json_output = {
-        "metrics": metrics,
-        "data": historical_data + in_sample_forecast_data + forecast_data
-    }
+    # Columnar output: one array of ISO dates and one of values per series
+    json_output = build_output(metrics, {
+        "historical": (ts.index, ts.to_numpy()),
+        "historical_forecast": (actual_values.index, np.asarray(in_sample_forecast)),
+        "forecast": (forecast_series.index, forecast_series.to_numpy()),
+    })
+    if series_path is not None:
+        write_series(series_path, output_series(json_output), OUTPUT_KEYS, metadata=json_output['metrics'])
 
     return json_output, metrics
 
-# Paths to your parquet files
-historical_file_path = '/opt/airflow/dags/data/gazs_output_parquet/main_data.parquet'
-new_day_file_path = '/opt/airflow/dags/data/gazs_output_parquet/ZAG_PARIS_combined_output.parquet'
+if __name__ == "__main__":
+    # Paths to your parquet files
+    historical_file_path = '/opt/airflow/dags/data/gazs_output_parquet/main_data.parquet'
+    new_day_file_path = '/opt/airflow/dags/data/gazs_output_parquet/ZAG_PARIS_combined_output.parquet'
 
-# Run the model and get the JSON output
-json_result, metrics = run_model_and_forecast(historical_file_path, new_day_file_path)
-print(json.dumps(json_result, indent=4))
+    # Run the model and get the JSON output
+    json_result, metrics = run_model_and_forecast(historical_file_path, new_day_file_path)
+    print(dumps(json_result).decode('utf-8'))
@@ -0,0 +1,122 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.atomic import atomic_path
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Series of the model output: observed values, in-sample forecasts and out-of-sample forecasts
+SERIES_TYPES = ('historical', 'historical_forecast', 'forecast')
+# Key of each series in the memory-mapped copy of an output (src.series_store)
+OUTPUT_KEYS = ['type']
+
+
+# Columnar model output: {"metrics": {...}, "series": {type: {"dates": [...], "values": [...]}}}.
+# Dates are formatted in one vectorized call and missing values become null, so the output is
+# plain JSON (no NaN) and readers get arrays without going through one dict per day.
+def series_columns(index, values):
+    values = np.asarray(values, dtype=float)
+    column = values.astype(object)
+    column[~np.isfinite(values)] = None
+    return {'dates': np.datetime_as_string(pd.DatetimeIndex(index).to_numpy(dtype='datetime64[D]'), unit='D').tolist(),
+            'values': column.tolist()}
+
+
+def build_output(metrics, series):
+    return {'metrics': {name: _finite_or_none(value) for name, value in metrics.items()},
+            'series': {row_type: series_columns(*series[row_type]) for row_type in SERIES_TYPES if row_type in series}}
+
+
+# Compact JSON bytes, with orjson when it is installed
+def dumps(output):
+    if orjson is not None:
+        return orjson.dumps(output, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(output, separators=(',', ':'), default=_to_builtin).encode('utf-8')
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Writes the output as compact JSON (.json) or as a long Parquet table (type, date, value) with
+# the metrics in the schema metadata (.parquet), atomically
+def write_output(output, path):
+    with atomic_path(path) as tmp_path:
+        if path.endswith('.parquet'):
+            pq.write_table(to_table(output), tmp_path, compression='zstd')
+        else:
+            with open(tmp_path, 'wb') as f:
+                f.write(dumps(output))
+
+
+def to_table(output):
+    series = output['series']
+    lengths = [len(series[row_type]['dates']) for row_type in series]
+    table = pa.table({
+        'type': pa.array(np.repeat(list(series), lengths).astype(object), pa.string()).dictionary_encode(),
+        'date': pa.array(np.concatenate([np.array(series[row_type]['dates'], dtype='datetime64[D]') for row_type in series])
+                         if series else np.array([], dtype='datetime64[D]'), pa.date32()),
+        'value': pa.array([value for row_type in series for value in series[row_type]['values']], pa.float64()),
+    })
+    return table.replace_schema_metadata({'metrics': json.dumps(output['metrics'])})
+
+
+# Reads a model output (compact JSON, Parquet, or the former per-row "data" layout) as
+# {"metrics": {...}, "series": {type: (dates datetime64[D], values float64)}}
+def read_output(path):
+    if path.endswith('.parquet'):
+        table = pq.read_table(path)
+        metrics = json.loads(table.schema.metadata[b'metrics'])
+        types = table.column('type').to_numpy().astype(str) if table.num_rows else np.array([], dtype=str)
+        dates = table.column('date').to_numpy().astype('datetime64[D]')
+        values = table.column('value').to_numpy(zero_copy_only=False).astype(float)
+        return {'metrics': metrics, 'series': {row_type: (dates[types == row_type], values[types == row_type])
+                                               for row_type in SERIES_TYPES if (types == row_type).any()}}
+    with open(path, 'rb') as f:
+        return output_arrays(loads(f.read()))
+
+
+# Arrays of a loaded output. Also accepts the run_model_and_forecast (output, metrics) pair as
+# published in metrics.json, and the former layout with one {"date", "value", "type"} dict per day.
+def output_arrays(output):
+    if isinstance(output, list):
+        output = output[0]
+    series = {}
+    if 'series' in output:
+        for row_type, columns in output['series'].items():
+            series[row_type] = (np.array(columns['dates'], dtype='datetime64[D]'),
+                                np.array(columns['values'], dtype=float))
+    else:
+        rows = output.get('data', [])
+        for row_type in SERIES_TYPES:
+            typed = [row for row in rows if row.get('type') == row_type]
+            series[row_type] = (np.array([row['date'] for row in typed], dtype='datetime64[D]'),
+                                np.array([row['value'] for row in typed], dtype=float))
+    return {'metrics': output.get('metrics', {}), 'series': series}
+
+
+# The series of an output as (key, dates, values) triples for src.series_store
+def output_series(output):
+    return [((row_type,), dates, values) for row_type, (dates, values) in output_arrays(output)['series'].items()]
+
+
+def _finite_or_none(value):
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def _to_builtin(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
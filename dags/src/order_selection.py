@@ -0,0 +1,253 @@
+import hashlib
+import itertools
+import json
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.arima.model import ARIMA
+from statsmodels.tsa.stattools import kpss
+
+from src.atomic import atomic_path
+
+CRITERIA = ('aic', 'bic', 'rolling')
+
+
+# Scores one (p, d, q) order on a series; lower is better. 'aic' / 'bic' come from a single fit,
+# 'rolling' is the mean absolute error of horizon-day forecasts from `folds` rolling origins.
+# Runs in a worker process: the series travels as a float array plus its first date.
+def evaluate_order(values, first_date, order, criterion='aic', folds=3, horizon=7):
+    start = time.perf_counter()
+    ts = pd.Series(values, index=pd.date_range(first_date, periods=len(values), freq='D'))
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            if criterion == 'rolling':
+                errors = []
+                for fold in range(folds, 0, -1):
+                    origin = len(ts) - fold * horizon
+                    forecast = ARIMA(ts[:origin], order=order).fit().forecast(steps=horizon).to_numpy()
+                    error = ts.to_numpy()[origin:origin + horizon] - forecast
+                    errors.append(error[np.isfinite(error)])
+                errors = np.concatenate(errors)
+                score = float(np.mean(np.abs(errors))) if errors.size else float('inf')
+            else:
+                score = float(getattr(ARIMA(ts, order=order).fit(), criterion))
+        error = None
+    except Exception as e:
+        score, error = float('inf'), f"{type(e).__name__}: {e}"
+    if not np.isfinite(score):
+        score = float('inf')
+    return {'order': tuple(order), 'score': score, 'error': error, 'seconds': time.perf_counter() - start}
+
+
+# Number of differences for stationarity, by repeated KPSS tests (as in auto.arima)
+def choose_d(ts, max_d=2, alpha=0.05):
+    values = ts.dropna().to_numpy()
+    for d in range(max_d + 1):
+        if len(values) < 10:
+            return d
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            p_value = kpss(values, regression='c', nlags='auto')[1]
+        if p_value >= alpha:
+            return d
+        values = np.diff(values)
+    return max_d
+
+
+# Identifies the data an order was selected on. The history but its last revision_days days is
+# hashed so a later series can be checked against it (same first `stable` values), and the
+# summary stats detect level/scale shifts.
+def fingerprint(ts, revision_days=0):
+    values = np.round(ts.to_numpy(dtype=float), 6)
+    stable = max(len(values) - revision_days, 0)
+    return {
+        'n': len(values),
+        'stable': stable,
+        'first_date': ts.index[0].strftime('%Y-%m-%d'),
+        'sha256': hashlib.sha256(values[:stable].tobytes()).hexdigest(),
+        'mean': float(np.nanmean(values)),
+        'std': float(np.nanstd(values)),
+    }
+
+
+# Order search for ARIMA models. Candidates are scored in a process pool, either over the full
+# (p, q) grid or stepwise from a few starting points towards the best neighbour, as in
+# Hyndman-Khandakar. In both modes an order is pruned when every nested order it extends
+# ((p-1, q) and (p, q-1)) already scored worse than the best by more than prune_margin.
+#
+# Selected orders are cached per series in a JSON file. A cached order is reused until the data
+# has materially changed: history rewritten, more than max_new_days new days, or the series
+# mean/std shifted by more than shift_tolerance standard deviations since the search. The last
+# revision_days days are revised by the next runs (late hours, real-time feed) and do not count
+# as a rewrite.
+class OrderSearch:
+    def __init__(self, max_p=5, max_q=5, d=None, max_d=2, criterion='aic', method='stepwise', workers=None,
+                 prune_margin=10.0, folds=3, horizon=7, cache_path=None, max_new_days=30, shift_tolerance=0.25,
+                 revision_days=3):
+        if criterion not in CRITERIA:
+            raise ValueError(f"Unknown criterion: {criterion}")
+        if method not in ('stepwise', 'grid'):
+            raise ValueError(f"Unknown search method: {method}")
+        self.max_p = max_p
+        self.max_q = max_q
+        self.d = d
+        self.max_d = max_d
+        self.criterion = criterion
+        self.method = method
+        self.workers = workers
+        # In criterion units: AIC/BIC points, or a relative MAE margin for 'rolling'
+        self.prune_margin = prune_margin
+        self.folds = folds
+        self.horizon = horizon
+        self.cache_path = cache_path
+        self.max_new_days = max_new_days
+        self.shift_tolerance = shift_tolerance
+        self.revision_days = revision_days
+
+    # Returns the order for ts, from the cache when the data has not materially changed
+    def select(self, ts, key='default'):
+        cache = self.load_cache()
+        order, reason = self.cached_order(ts, key, cache)
+        if order is not None:
+            return order
+        print(f"Searching an order for {key}: {reason}")
+        result = self.search(ts)
+        cache[key] = self.cache_entry(ts, result)
+        self.save_cache(cache)
+        return result['order']
+
+    # (order, None) when the cached order of key can be reused for ts, else (None, reason)
+    def cached_order(self, ts, key, cache):
+        entry = cache.get(key)
+        reason = self._stale_reason(entry, ts)
+        if reason is not None:
+            return None, reason
+        print(f"Order {tuple(entry['order'])} for {key} taken from the cache")
+        return tuple(entry['order']), None
+
+    # Cache entry of a search result on ts
+    def cache_entry(self, ts, result):
+        return {'order': list(result['order']), 'score': result['score'], 'criterion': self.criterion,
+                'method': self.method, 'evaluated': result['evaluated'], 'pruned': result['pruned'],
+                'seconds': result['seconds'], 'searched_at': time.time(),
+                'fingerprint': fingerprint(ts, self.revision_days)}
+
+    def search(self, ts):
+        start = time.perf_counter()
+        d = self.d if self.d is not None else choose_d(ts, self.max_d)
+        payload = (ts.to_numpy(dtype=float), ts.index[0])
+        scores = {}
+        pruned = set()
+        workers = self.workers or os.cpu_count() or 1
+
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            if self.method == 'grid':
+                # Waves of growing p + q, so that nested orders are scored before the orders extending them
+                grid = sorted(itertools.product(range(self.max_p + 1), range(self.max_q + 1)), key=lambda pq: (sum(pq), pq))
+                for _, wave in itertools.groupby(grid, key=sum):
+                    self._evaluate(executor, payload, d, list(wave), scores, pruned)
+            else:
+                candidates = [(2, 2), (0, 0), (1, 0), (0, 1)]
+                while candidates:
+                    best_before = self._best(scores)
+                    self._evaluate(executor, payload, d, candidates, scores, pruned)
+                    best = self._best(scores)
+                    if best is None or best == best_before:
+                        break
+                    p, q = best
+                    candidates = [(p + dp, q + dq) for dp, dq in ((-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (1, 1))]
+        finally:
+            # Interrupted (time limit): the candidates not started yet are dropped
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        best = self._best(scores)
+        if best is None:
+            raise RuntimeError(f"No ARIMA order could be fitted (d={d})")
+        result = {'order': (best[0], d, best[1]), 'score': scores[best], 'evaluated': len(scores),
+                  'pruned': len(pruned), 'seconds': time.perf_counter() - start}
+        print(f"Selected order {result['order']} ({self.criterion}={result['score']:.3f}) after "
+              f"{result['evaluated']} fits, {result['pruned']} pruned, in {result['seconds']:.1f}s")
+        return result
+
+    # Scores the candidates not yet seen, skipping out-of-range and pruned orders
+    def _evaluate(self, executor, payload, d, candidates, scores, pruned):
+        todo = []
+        for p, q in candidates:
+            if (p, q) in scores or (p, q) in pruned or not (0 <= p <= self.max_p and 0 <= q <= self.max_q):
+                continue
+            if self._is_clearly_worse(p, q, scores):
+                pruned.add((p, q))
+                continue
+            todo.append((p, d, q))
+
+        kwargs = {'criterion': self.criterion, 'folds': self.folds, 'horizon': self.horizon}
+        if executor is None:
+            results = [evaluate_order(*payload, order, **kwargs) for order in todo]
+        else:
+            results = [future.result() for future in [executor.submit(evaluate_order, *payload, order, **kwargs)
+                                                      for order in todo]]
+        for result in results:
+            p, _, q = result['order']
+            scores[(p, q)] = result['score']
+
+    def _is_clearly_worse(self, p, q, scores):
+        best = self._best(scores)
+        if best is None:
+            return False
+        parents = [parent for parent in ((p - 1, q), (p, q - 1)) if parent in scores]
+        if not parents:
+            return False
+        limit = self._limit(scores[best])
+        return all(scores[parent] > limit for parent in parents)
+
+    def _limit(self, best_score):
+        if self.criterion == 'rolling':
+            return best_score * (1 + self.prune_margin / 100)
+        return best_score + self.prune_margin
+
+    @staticmethod
+    def _best(scores):
+        finite = {pq: score for pq, score in scores.items() if np.isfinite(score)}
+        return min(finite, key=finite.get) if finite else None
+
+    # Why the cached entry cannot be reused for ts, or None when it can
+    def _stale_reason(self, entry, ts):
+        if entry is None:
+            return 'no cached order'
+        if entry['criterion'] != self.criterion or entry['method'] != self.method:
+            return 'search settings changed'
+        previous = entry['fingerprint']
+        if ts.index[0].strftime('%Y-%m-%d') != previous['first_date'] or len(ts) < previous['n']:
+            return 'series range changed'
+        # Entries written before the revision window hashed their whole history
+        stable = previous.get('stable', previous['n'])
+        if fingerprint(ts[:stable])['sha256'] != previous['sha256']:
+            return 'history rewritten'
+        new_days = len(ts) - previous['n']
+        if new_days > self.max_new_days:
+            return f"{new_days} new days since the last search"
+        current = fingerprint(ts)
+        scale = previous['std'] or 1.0
+        if abs(current['mean'] - previous['mean']) / scale > self.shift_tolerance \
+                or abs(current['std'] - previous['std']) / scale > self.shift_tolerance:
+            return 'level or scale shift'
+        return None
+
+    def load_cache(self):
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return {}
+        with open(self.cache_path) as f:
+            return json.load(f)
+
+    def save_cache(self, cache):
+        if self.cache_path is None:
+            return
+        with atomic_path(self.cache_path) as tmp_path, open(tmp_path, 'w') as f:
+            json.dump(cache, f, indent=4)
@@ -0,0 +1,399 @@
+import json
+import os
+import shutil
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src.atomic import atomic_path
+
+
+# Append-only Parquet dataset partitioned by month of 'date de fin'
+# (root/year_month=YYYY-MM/data.parquet). A run only rewrites the partitions its
+# rows fall into, deduplicating on (date de fin, polluant, zas) within them.
+#
+# Commit protocol: every affected partition is first written under root/_staging/<txn>/,
+# then each staged file replaces its partition file with an atomic os.replace, and the
+# transaction is finally recorded in root/_commits.jsonl. Readers never see a partial
+# file, but a commit is atomic per partition only: a crash between two replaces leaves
+# some months new and others old, with no _commits.jsonl record. Replaying the append
+# brings the remaining months up to date, and is idempotent because of the key dedup.
+#
+# Each committed partition also gets its daily rollup over every zone (see daily_rollup) under
+# root/_rollups/, stamped with the partition file it was computed from.
+class PartitionedParquetStore:
+    DATE_COLUMN = 'date de fin'
+    KEY_COLUMNS = ['date de fin', 'polluant', 'zas']
+    # When two rows share a key, the one from the most recent file/processing run wins
+    ORDER_COLUMNS = ['file_date', 'processing_date']
+    PARTITION_COLUMN = 'year_month'
+    DATA_FILE = 'data.parquet'
+    # Rows per Parquet row group, in partition files and in streamed staging files
+    ROW_GROUP_SIZE = 64 * 1024
+    ROLLUP_FOLDER = '_rollups'
+    # Rows are unique per (day, zas, polluant): the rollups pool the zones, one row per day and pollutant
+    ROLLUP_KEYS = ['date', 'polluant']
+
+    def __init__(self, root, compression='zstd', row_group_size=ROW_GROUP_SIZE):
+        self.root = root
+        self.compression = compression
+        self.row_group_size = row_group_size
+        os.makedirs(root, exist_ok=True)
+
+    def partition_path(self, partition):
+        return os.path.join(self.root, f'{self.PARTITION_COLUMN}={partition}', self.DATA_FILE)
+
+    # Committed partition values ('YYYY-MM'), sorted
+    def partitions(self):
+        prefix = self.PARTITION_COLUMN + '='
+        return sorted(name[len(prefix):] for name in os.listdir(self.root)
+                      if name.startswith(prefix) and os.path.exists(os.path.join(self.root, name, self.DATA_FILE)))
+
+    def is_empty(self):
+        return not self.partitions()
+
+    # Normalizes the schema of incoming rows: 'date de fin' as a timestamp so that keys
+    # compare equal whatever the source (CSV string, legacy Parquet object or datetime),
+    # and every timestamp column in nanoseconds so that partitions concatenate cleanly.
+    def normalize(self, df):
+        df = df.copy()
+        df[self.DATE_COLUMN] = pd.to_datetime(df[self.DATE_COLUMN])
+        for column in df.columns:
+            if pd.api.types.is_datetime64_any_dtype(df[column].dtype):
+                df[column] = df[column].astype('datetime64[ns]')
+        return df
+
+    # Appends rows and returns the list of partitions rewritten.
+    def append(self, df):
+        if df.empty:
+            return []
+        df = self.normalize(df)
+        txn, staging = self._begin()
+        try:
+            staged = {}
+            for partition, rows in df.groupby(self.months(df), sort=True):
+                staged[partition] = self._stage_partition(partition, rows, staging)
+            return self._commit(txn, staged)
+        finally:
+            self._cleanup(staging)
+
+    # Opens a streaming append: see StoreWriter.
+    def writer(self):
+        return StoreWriter(self)
+
+    # Partition value ('YYYY-MM') of each row; only the distinct months are formatted
+    def months(self, df):
+        dates = df[self.DATE_COLUMN]
+        codes = dates.dt.year * 100 + dates.dt.month
+        return codes.map({code: f'{code // 100:04d}-{code % 100:02d}' for code in codes.unique()})
+
+    def _begin(self):
+        txn = time.strftime('%Y%m%d_%H%M%S') + '_' + uuid.uuid4().hex[:8]
+        staging = os.path.join(self.root, '_staging', txn)
+        os.makedirs(staging)
+        return txn, staging
+
+    def _cleanup(self, staging):
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(staging))
+        except OSError:
+            pass  # another transaction is staging concurrently
+
+    # Merges new rows into a partition and writes the result to the staging folder.
+    # rows may be a DataFrame or the path of a streamed staging file. schema (Arrow), merged with
+    # the partition's own, types the result: every month of a stream then gets the same types.
+    def _stage_partition(self, partition, rows, staging, schema=None):
+        if isinstance(rows, str):
+            rows = self.normalize(pd.read_parquet(rows))
+        path = self.partition_path(partition)
+        if os.path.exists(path):
+            if schema is not None:
+                schema = _merged_schema([pq.read_schema(path).remove_metadata(), schema])
+            rows = pd.concat([self.normalize(pd.read_parquet(path)), rows], ignore_index=True)
+        order = [column for column in self.ORDER_COLUMNS if column in rows.columns]
+        if order:
+            rows = rows.sort_values(order, kind='stable')
+        rows = rows.drop_duplicates(subset=self.KEY_COLUMNS, keep='last')
+        rows = rows.sort_values(self.KEY_COLUMNS, kind='stable').reset_index(drop=True)
+
+        if schema is not None:
+            # Columns added after this month's rows were staged
+            rows = rows.assign(**{name: None for name in schema.names if name not in rows.columns})
+        staged_path = os.path.join(staging, f'{partition}.parquet')
+        rows.to_parquet(staged_path, index=False, compression=self.compression, row_group_size=self.row_group_size,
+                        schema=schema)
+        return staged_path, len(rows)
+
+    # One os.replace per partition, not one for the whole transaction (see the class comment).
+    def _commit(self, txn, staged):
+        stats = []
+        for partition, (staged_path, rows) in staged.items():
+            path = self.partition_path(partition)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(staged_path, path)
+            stats.append({'partition': partition, 'rows': rows, 'bytes': os.path.getsize(path)})
+        with open(os.path.join(self.root, '_commits.jsonl'), 'a') as f:
+            f.write(json.dumps({'txn': txn, 'committed_at': time.time(), 'partitions': stats}) + '\n')
+        for partition in staged:
+            self.rollup(partition)
+        return stats
+
+    # Reads a slice of the store. Partitions outside [start, end] are pruned from their
+    # directory name and the remaining filters are pushed down to the Parquet scan.
+    def read(self, columns=None, start=None, end=None, zas=None, polluant=None):
+        if self.is_empty():
+            return pd.DataFrame(columns=columns or [])
+        df = self.scan(columns=columns, start=start, end=end, zas=zas, polluant=polluant).to_pandas()
+        if columns is None and self.PARTITION_COLUMN in df.columns:
+            df = df.drop(columns=[self.PARTITION_COLUMN])
+        return df
+
+    # Same slice as an Arrow table
+    def scan(self, columns=None, start=None, end=None, zas=None, polluant=None):
+        if self.is_empty():
+            return pa.table({column: pa.array([], pa.null()) for column in columns or []})
+        dataset = self.dataset()
+        partition = ds.field(self.PARTITION_COLUMN)
+        pruning = []
+        if start is not None:
+            pruning.append(partition >= pd.Timestamp(start).strftime('%Y-%m'))
+        if end is not None:
+            pruning.append(partition <= pd.Timestamp(end).strftime('%Y-%m'))
+        expression = filter_expression(dataset.schema, start=start, end=end, zas=zas, polluant=polluant,
+                                       conditions=pruning)
+        return dataset.to_table(columns=columns, filter=expression)
+
+    # Partitions overlapping [start, end]
+    def partitions_between(self, start=None, end=None):
+        first = pd.Timestamp(start).strftime('%Y-%m') if start is not None else None
+        last = pd.Timestamp(end).strftime('%Y-%m') if end is not None else None
+        return [partition for partition in self.partitions()
+                if (first is None or partition >= first) and (last is None or partition <= last)]
+
+    # Daily rollup of a partition: read from root/_rollups/ when it was computed from the current
+    # partition file, otherwise computed from it and saved (readers on a read-only mount skip the save).
+    # filter is applied to the rollup rows (see src.query).
+    def rollup(self, partition, filter=None):
+        return cached_rollup(self.partition_path(partition),
+                             os.path.join(self.root, self.ROLLUP_FOLDER, f'{self.PARTITION_COLUMN}={partition}.parquet'),
+                             keys=self.ROLLUP_KEYS, filter=filter)
+
+    def dataset(self):
+        partitioning = ds.partitioning(pa.schema([(self.PARTITION_COLUMN, pa.string())]), flavor='hive')
+        return ds.dataset(self.root, format='parquet', partitioning=partitioning)
+
+    # One-off import of the former single-file output (ZAG_PARIS_combined_output.parquet)
+    def import_file(self, file_path):
+        return self.append(pd.read_parquet(file_path))
+
+
+# Streaming append to a PartitionedParquetStore. Frames passed to write() are split by month
+# and appended to one ParquetWriter per month under the transaction's staging folder, in row
+# groups of store.row_group_size rows; nothing else is kept in memory. commit() then merges
+# each staged month with its partition, one month at a time, with the same dedup and
+# per-partition atomic replace as PartitionedParquetStore.append.
+#
+# The schema grows with the batches: a column first seen in a later file is added, and a column
+# that was all null so far takes the type of its first values. The open staging files keep
+# their schema, so each month then continues in a new file; commit() reads them back together.
+# Types that cannot be promoted (text then numbers) raise ValueError.
+class StoreWriter:
+    def __init__(self, store):
+        self.store = store
+        self.txn, self.staging = store._begin()
+        self.schema = None
+        self.rows = 0
+        # Bytes of the streamed staging files, known once commit() has closed them
+        self.staged_bytes = 0
+        self._writers = {}
+        self._buffers = {}
+        # Staging files of each month, in write order
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Without an explicit commit() nothing reaches the store
+        self.abort()
+
+    def write(self, df):
+        if df.empty:
+            return
+        df = self.store.normalize(df)
+        self._promote(df)
+        # Same columns and types for every batch: columns absent from a file are written as nulls
+        df = df.reindex(columns=self.schema.names)
+        untyped = [field.name for field in self.schema if pa.types.is_null(field.type)]
+        if untyped:
+            df[untyped] = None
+        for partition, rows in df.groupby(self.store.months(df), sort=False):
+            table = pa.Table.from_pandas(rows, schema=self.schema, preserve_index=False)
+            buffer = self._buffers.setdefault(partition, [])
+            buffer.append(table)
+            if sum(len(t) for t in buffer) >= self.store.row_group_size:
+                self._flush(partition)
+        self.rows += len(df)
+
+    # Widens self.schema to the columns and types of a new batch (all-null columns are typed by a
+    # later batch). On a change the buffered rows are written and the staging files closed.
+    def _promote(self, df):
+        fields = []
+        for field in _arrow_schema(df):
+            index = self.schema.get_field_index(field.name) if self.schema is not None else -1
+            # Only a column not yet written with this type is checked for nulls
+            if (index < 0 or self.schema.field(index).type != field.type) and df[field.name].isna().all():
+                field = pa.field(field.name, pa.null())
+            fields.append(field)
+        schema = pa.schema(fields)
+        if self.schema is None:
+            self.schema = schema
+            return
+        merged = _merged_schema([self.schema, schema])
+        if not merged.equals(self.schema):
+            self._close()
+            self.schema = merged
+
+    def _flush(self, partition):
+        tables = self._buffers.pop(partition, [])
+        if not tables:
+            return
+        if partition not in self._writers:
+            files = self._files.setdefault(partition, [])
+            files.append(os.path.join(self.staging, f'{partition}.delta{len(files)}.parquet'))
+            self._writers[partition] = pq.ParquetWriter(files[-1], self.schema, compression=self.store.compression)
+        self._writers[partition].write_table(pa.concat_tables(tables), row_group_size=self.store.row_group_size)
+
+    def _close(self):
+        for partition in list(self._buffers):
+            self._flush(partition)
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+    # Merges the staged months into the store and returns the partitions rewritten
+    def commit(self):
+        self._close()
+        self.staged_bytes = sum(os.path.getsize(os.path.join(self.staging, name)) for name in os.listdir(self.staging))
+        staged = {}
+        for partition in sorted(self._files):
+            files = self._files[partition]
+            if len(files) == 1:
+                rows = files[0]
+            else:
+                # Files written before a schema change get the columns and types added since
+                rows = pa.concat_tables([pq.read_table(path) for path in files], promote_options='permissive')
+                rows = rows.to_pandas()
+            staged[partition] = self.store._stage_partition(partition, rows, self.staging, self.schema)
+            for path in files:
+                os.remove(path)
+        self._files = {}
+        stats = self.store._commit(self.txn, staged) if staged else []
+        self.store._cleanup(self.staging)
+        return stats
+
+    def abort(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+        self._buffers = {}
+        self._files = {}
+        self.store._cleanup(self.staging)
+
+
+# Filter on the date, zone and pollutant columns of a Parquet dataset, None without conditions.
+# Bounds are inclusive and cast to the type of the date column; string dates (ISO format, as in
+# ZAG_PARIS_combined_output.parquet) compare as strings, the end bound as the next day excluded.
+def filter_expression(schema, start=None, end=None, zas=None, polluant=None, conditions=()):
+    conditions = list(conditions)
+    date_field = ds.field(PartitionedParquetStore.DATE_COLUMN)
+    date_type = schema.field(PartitionedParquetStore.DATE_COLUMN).type
+    as_string = pa.types.is_string(date_type) or pa.types.is_large_string(date_type)
+    if start is not None:
+        start = pd.Timestamp(start)
+        conditions.append(date_field >= (start.strftime('%Y-%m-%d') if as_string
+                                         else pa.scalar(start.to_pydatetime()).cast(date_type)))
+    if end is not None:
+        end = pd.Timestamp(end)
+        conditions.append(date_field < (end + pd.Timedelta(days=1)).strftime('%Y-%m-%d') if as_string
+                          else date_field <= pa.scalar(end.to_pydatetime()).cast(date_type))
+    for column, value in (('zas', zas), ('polluant', polluant)):
+        if value is None:
+            continue
+        values = [value] if isinstance(value, str) else list(value)
+        conditions.append(ds.field(column).isin(values))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+DAILY_KEYS = ['date', 'zas', 'polluant']
+
+
+# Daily rollup of observations: one row per keys (by default per date, zas and polluant) with
+# the count, sum, min and max of valeur (missing values not counted). Means of any group of days,
+# zones or pollutants, and of several sources, follow exactly from count and sum.
+def daily_rollup(table, keys=DAILY_KEYS):
+    dates = table.column(PartitionedParquetStore.DATE_COLUMN)
+    if pa.types.is_string(dates.type) or pa.types.is_large_string(dates.type):
+        dates = pc.strptime(pc.utf8_slice_codeunits(dates, 0, 10), format='%Y-%m-%d', unit='s')
+    columns = {'date': dates.cast(pa.timestamp('s'), safe=False).cast(pa.date32())}
+    for key in keys[1:]:
+        columns[key] = table.column(key).cast(pa.string())
+    columns['valeur'] = table.column('valeur').cast(pa.float64())
+    rollup = pa.table(columns).group_by(keys).aggregate([('valeur', 'count'), ('valeur', 'sum'), ('valeur', 'min'),
+                                                         ('valeur', 'max')])
+    rollup = rollup.select(keys + ['valeur_count', 'valeur_sum', 'valeur_min', 'valeur_max'])
+    rollup = rollup.rename_columns(keys + ['count', 'sum', 'min', 'max'])
+    return rollup.sort_by([(key, 'ascending') for key in keys])
+
+
+# Rollup of a Parquet file cached at rollup_path, valid while the file keeps its size and mtime.
+# filter (an Arrow expression on the rollup columns) is pushed down to the cached file.
+def cached_rollup(path, rollup_path, keys=DAILY_KEYS, filter=None):
+    source = os.stat(path)
+    stamp = f'{source.st_size}:{source.st_mtime_ns}'.encode()
+    try:
+        if (pq.read_schema(rollup_path).metadata or {}).get(b'source') == stamp:
+            return pq.read_table(rollup_path, filters=filter).replace_schema_metadata(None)
+    except (OSError, pa.ArrowInvalid):
+        pass
+    rollup = daily_rollup(pq.read_table(path, columns=[PartitionedParquetStore.DATE_COLUMN] + keys[1:] + ['valeur']),
+                          keys)
+    try:
+        os.makedirs(os.path.dirname(rollup_path), exist_ok=True)
+        with atomic_path(rollup_path) as tmp_path:
+            pq.write_table(rollup.replace_schema_metadata({b'source': stamp}), tmp_path)
+    except OSError:
+        pass
+    return rollup.filter(filter) if filter is not None else rollup
+
+
+# Union of the columns with promoted types (null -> any type, integer -> float); types that
+# cannot be promoted raise ValueError
+def _merged_schema(schemas):
+    try:
+        return pa.unify_schemas(schemas, promote_options='permissive')
+    except (pa.ArrowTypeError, pa.ArrowInvalid) as e:
+        raise ValueError(f"rows do not match the columns already stored: {e}") from e
+
+
+def _arrow_schema(df):
+    fields = []
+    for column in df.columns:
+        dtype = df[column].dtype
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            fields.append(pa.field(column, pa.timestamp('ns')))
+        elif pd.api.types.is_numeric_dtype(dtype):
+            fields.append(pa.field(column, pa.float64()))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    return pa.schema(fields)
@@ -0,0 +1,152 @@
+import os
+import time
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+
+from src.gaz_data_parquet import ALL_ZONES_STORE_FOLDER, PARIS_ZAS, CSVtoParquetProcessor, store_rows
+from src.gaz_data_processor import GazDataProcessor
+from src.ingestion import PROCESSOR_COLUMNS, read_lcsqa_csv
+from src.instrumentation import span
+from src.manifest import Manifest, output_name
+from src.parquet_store import PartitionedParquetStore
+
+
+# Pipeline fusionné : CSV brut LCSQA -> nettoyage/agrégation -> partition Parquet en une seule passe.
+# Chaque fichier est lu une fois (schéma typé), nettoyé par GazDataProcessor.clean_data, normalisé
+# au schéma du store par store_rows, puis écrit en flux par le StoreWriter. Le *_output.csv
+# intermédiaire n'est plus écrit que si debug_csv_folder est fourni.
+# Avec all_zones=True, toutes les zones sont aussi écrites, dans la même passe, dans le store
+# ZAS_dataset utilisé par le moteur de prévision multi-séries (src/forecasting.py).
+class GazPipeline:
+    def __init__(self, input_folder, output_folder_parquet, manifest=None, debug_csv_folder=None,
+                 agg_engine='vectorized', all_zones=False):
+        self.input_folder = input_folder
+        self.debug_csv_folder = debug_csv_folder
+        self.manifest = manifest
+        self.processor = GazDataProcessor(input_folder, debug_csv_folder, manifest=manifest, agg_engine=agg_engine)
+        self.parquet = CSVtoParquetProcessor(debug_csv_folder, output_folder_parquet, manifest=manifest)
+        self.store = self.parquet.store
+        self.all_zones = all_zones
+        self.all_zones_store = None
+        if all_zones:
+            self.all_zones_store = PartitionedParquetStore(os.path.join(output_folder_parquet, ALL_ZONES_STORE_FOLDER))
+
+    # Fichiers bruts à traiter : état 'downloaded' du manifeste, sinon tous les CSV bruts du dossier
+    def pending_files(self):
+        if self.manifest is not None:
+            return self.manifest.names_in_state(Manifest.DOWNLOADED)
+        return sorted(file_name for file_name in os.listdir(self.input_folder)
+                      if file_name.endswith('.csv') and not file_name.endswith('_output.csv'))
+
+    # Lit, nettoie et normalise un fichier brut ; renvoie le statut et les lignes destinées au store
+    # (ZAG PARIS seulement, ou toutes les zones avec all_zones)
+    def process_file(self, file_name):
+        with span('read_csv', file=file_name) as s:
+            data = read_lcsqa_csv(os.path.join(self.input_folder, file_name), columns=PROCESSOR_COLUMNS,
+                                  dtypes={'valeur': 'float64'})
+            s.add(files=1, rows_out=len(data))
+        if data.empty:
+            print(f"Le fichier {file_name} est vide. Skipping this file.")
+            return Manifest.SKIPPED, None
+
+        with span('clean', file=file_name) as s:
+            final_data = self.processor.clean_data(data)
+            s.add(rows_in=len(data), rows_out=0 if final_data is None else len(final_data))
+        if final_data is None:
+            print(f"'Polluant' or 'Zas' column not found in {file_name}. Skipping this file.")
+            return Manifest.SKIPPED, None
+
+        if self.debug_csv_folder is not None:
+            final_data.to_csv(os.path.join(self.debug_csv_folder, output_name(file_name)), index=False)
+        zas = None if self.all_zones else PARIS_ZAS
+        with span('store_rows', file=file_name) as s:
+            rows = store_rows(final_data, file_name, self.parquet.current_timestamp, zas=zas)
+            s.add(rows_in=len(final_data), rows_out=0 if rows is None else len(rows))
+        return Manifest.STORED, rows
+
+    def process_batch(self, file_names):
+        results = []
+        for file_name in file_names:
+            try:
+                status, rows = self.process_file(file_name)
+                results.append((file_name, status, rows, None))
+            except Exception as e:
+                results.append((file_name, 'failed', None, f"{type(e).__name__}: {e}"))
+        return results
+
+    # Exécute le pipeline. Avec workers > 1, la lecture et le nettoyage sont répartis sur un pool
+    # de processus ; le processus parent écrit seul dans le store. Les états du manifeste ne sont
+    # mis à jour qu'après le commit des partitions.
+    def run(self, workers=1, batch_bytes=32 * 1024 * 1024, raise_on_error=True):
+        start = time.perf_counter()
+        self.parquet.import_legacy_output()
+        file_names = self.pending_files()
+        workers = min(workers or os.cpu_count() or 1, max(len(file_names), 1))
+        summary = {'stored': [], 'skipped': [], 'failed': {}, 'rows': 0, 'workers': workers}
+
+        all_zones = self.all_zones_store.writer() if self.all_zones else nullcontext()
+        with self.store.writer() as writer, all_zones as all_zones_writer:
+            if workers == 1:
+                for file_name in file_names:
+                    self._collect(summary, writer, all_zones_writer, self.process_batch([file_name]))
+            else:
+                batches = self.processor.make_batches(file_names, batch_bytes, workers)
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    futures = [executor.submit(_process_batch, self.input_folder, self.parquet.output_folder_parquet,
+                                               self.debug_csv_folder, self.processor.agg_engine, self.all_zones,
+                                               self.parquet.current_timestamp, batch)
+                               for batch in batches]
+                    for future, batch in zip(futures, batches):
+                        try:
+                            results = future.result()
+                        except Exception as e:
+                            results = [(file_name, 'failed', None, f"{type(e).__name__}: {e}") for file_name in batch]
+                        self._collect(summary, writer, all_zones_writer, results)
+            with span('store_commit', store=self.store.root) as s:
+                partitions = writer.commit()
+                s.add(rows_in=writer.rows)
+            summary['bytes'] = writer.staged_bytes + sum(stat['bytes'] for stat in partitions)
+            if all_zones_writer is not None:
+                with span('store_commit', store=self.all_zones_store.root) as s:
+                    all_zones_partitions = all_zones_writer.commit()
+                    s.add(rows_in=all_zones_writer.rows)
+                summary['all_zones_rows'] = all_zones_writer.rows
+                summary['bytes'] += all_zones_writer.staged_bytes + sum(stat['bytes'] for stat in all_zones_partitions)
+
+        if self.manifest is not None:
+            self.manifest.mark(summary['stored'], Manifest.STORED)
+            self.manifest.mark(summary['skipped'], Manifest.SKIPPED)
+
+        summary['partitions'] = [stat['partition'] for stat in partitions]
+        summary['seconds'] = time.perf_counter() - start
+        print(f"{len(summary['stored'])} files stored, {len(summary['skipped'])} skipped, "
+              f"{len(summary['failed'])} failed ({summary['rows']} ZAG PARIS rows, "
+              f"{summary['bytes'] / 2**20:.2f} MB written) in {summary['seconds']:.1f}s with {workers} worker(s).")
+        for file_name, error in summary['failed'].items():
+            print(f"Failed to process {file_name}: {error}")
+        if raise_on_error and summary['failed']:
+            raise RuntimeError(f"{len(summary['failed'])} file(s) failed: {sorted(summary['failed'])}")
+        return summary
+
+    def _collect(self, summary, writer, all_zones_writer, results):
+        for file_name, status, rows, error in results:
+            if status == 'failed':
+                summary['failed'][file_name] = error
+                continue
+            summary[status].append(file_name)
+            if rows is None:
+                continue
+            if all_zones_writer is not None:
+                all_zones_writer.write(rows)
+                rows = rows[rows['zas'] == PARIS_ZAS]
+            writer.write(rows)
+            summary['rows'] += len(rows)
+
+
+# Point d'entrée des workers : lecture et nettoyage seulement, sans manifeste ni écriture dans le store
+def _process_batch(input_folder, output_folder_parquet, debug_csv_folder, agg_engine, all_zones, processing_date,
+                   file_names):
+    pipeline = GazPipeline(input_folder, output_folder_parquet, debug_csv_folder=debug_csv_folder, agg_engine=agg_engine,
+                           all_zones=all_zones)
+    pipeline.parquet.current_timestamp = processing_date
+    return pipeline.process_batch(file_names)
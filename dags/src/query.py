@@ -0,0 +1,114 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from src.parquet_store import DAILY_KEYS, PartitionedParquetStore, cached_rollup, daily_rollup
+
+# Granularities of aggregate(): day, week (starting on Monday) and month
+FREQUENCIES = ('D', 'W', 'M')
+# Folder of the rollups of single Parquet files, next to them (as the store's own _rollups)
+ROLLUP_FOLDER = PartitionedParquetStore.ROLLUP_FOLDER
+
+
+# Read side of the observations, shared by the model, the forecast engine and the API: any mix of
+# partitioned stores (directories or PartitionedParquetStore) and single Parquet files such as
+# main_data.parquet. Daily aggregates come from the rollups materialized with each store
+# partition when they suffice, and otherwise from rows projected on the columns they need with
+# the date, zone and pollutant filters pushed down to the Parquet scan, so a query costs what its
+# slice costs, not the full history.
+class ObservationQuery:
+    def __init__(self, *sources):
+        self.sources = []
+        for source in sources:
+            if isinstance(source, str) and os.path.isdir(source):
+                source = PartitionedParquetStore(source)
+            self.sources.append(source)
+
+    # Daily rollup rows of every source in the slice, with the keys needed by `by`. Without zone
+    # (neither filter nor group on zas), store partitions are read from their rollups over every
+    # zone; otherwise their rows are scanned, projected and filtered, and rolled up on the fly. The
+    # rollups of single files are per zone: they hold many rows per day, zone and pollutant.
+    def rollups(self, start=None, end=None, zas=None, polluant=None, by=('zas', 'polluant')):
+        keys = DAILY_KEYS if zas is not None or 'zas' in by else PartitionedParquetStore.ROLLUP_KEYS
+        columns = keys + ['count', 'sum', 'min', 'max']
+        expression = _rollup_filter(start, end, zas, polluant)
+        tables = []
+        for source in self.sources:
+            if not isinstance(source, PartitionedParquetStore):
+                folder, name = os.path.split(source)
+                tables.append(cached_rollup(source, os.path.join(folder, ROLLUP_FOLDER, name), filter=expression))
+            elif keys != DAILY_KEYS:
+                tables += [source.rollup(partition, filter=expression)
+                           for partition in source.partitions_between(start, end)]
+            elif not source.is_empty():
+                rows = source.scan(columns=[source.DATE_COLUMN, 'zas', 'polluant', 'valeur'], start=start, end=end,
+                                   zas=zas, polluant=polluant)
+                tables.append(daily_rollup(rows))
+        if not tables:
+            return _empty_rollup().select(columns)
+        return pa.concat_tables([table.select(columns) for table in tables])
+
+    # Daily aggregates of valeur grouped by `by` (any of 'zas', 'polluant'): date, *by, count, sum,
+    # min, max and mean, sorted. Rows of the same day from several sources are pooled, as when the
+    # model concatenates them: the mean is the mean of all their values.
+    def daily(self, start=None, end=None, zas=None, polluant=None, by=('zas', 'polluant')):
+        return self.aggregate('D', start=start, end=end, zas=zas, polluant=polluant, by=by)
+
+    # Same aggregates per day, week or month (freq in FREQUENCIES), dated by the first day of the period
+    def aggregate(self, freq='D', start=None, end=None, zas=None, polluant=None, by=('zas', 'polluant')):
+        if freq not in FREQUENCIES:
+            raise ValueError(f"freq must be one of {', '.join(FREQUENCIES)}, not {freq!r}")
+        by = list(by)
+        table = self.rollups(start=start, end=end, zas=zas, polluant=polluant, by=by)
+        if freq != 'D':
+            table = table.set_column(0, 'date', pa.array(_period_start(table.column('date'), freq), pa.date32()))
+        table = table.group_by(['date'] + by).aggregate([('count', 'sum'), ('sum', 'sum'), ('min', 'min'),
+                                                         ('max', 'max')])
+        table = table.select(['date'] + by + ['count_sum', 'sum_sum', 'min_min', 'max_max'])
+        df = table.rename_columns(['date'] + by + ['count', 'sum', 'min', 'max']).to_pandas()
+        df = df.sort_values(['date'] + by, kind='stable').reset_index(drop=True)
+        df['date'] = pd.to_datetime(df['date'])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df['mean'] = np.where(df['count'] > 0, df['sum'] / df['count'], np.nan)
+        return df
+
+    # Daily mean of valeur over the slice as a series with a daily frequency (days without data are NaN)
+    def daily_mean(self, start=None, end=None, zas=None, polluant=None):
+        daily = self.daily(start=start, end=end, zas=zas, polluant=polluant, by=())
+        ts = pd.Series(daily['mean'].to_numpy(), index=pd.DatetimeIndex(daily['date'], name='date de fin'),
+                       name='valeur')
+        return ts.asfreq('D')
+
+
+def _empty_rollup():
+    return pa.table({'date': pa.array([], pa.date32()), 'zas': pa.array([], pa.string()),
+                     'polluant': pa.array([], pa.string()), 'count': pa.array([], pa.int64()),
+                     'sum': pa.array([], pa.float64()), 'min': pa.array([], pa.float64()),
+                     'max': pa.array([], pa.float64())})
+
+
+def _rollup_filter(start, end, zas, polluant):
+    conditions = []
+    if start is not None:
+        conditions.append(pc.field('date') >= pa.scalar(pd.Timestamp(start).date(), pa.date32()))
+    if end is not None:
+        conditions.append(pc.field('date') <= pa.scalar(pd.Timestamp(end).date(), pa.date32()))
+    for column, value in (('zas', zas), ('polluant', polluant)):
+        if value is not None:
+            conditions.append(pc.field(column).isin([value] if isinstance(value, str) else list(value)))
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+# First day of the week (Monday) or month of each date, as datetime64[D]
+def _period_start(dates, freq):
+    days = dates.to_numpy(zero_copy_only=False).astype('datetime64[D]')
+    if freq == 'M':
+        return days.astype('datetime64[M]').astype('datetime64[D]')
+    # 1970-01-01 was a Thursday
+    return days - ((days.astype(np.int64) + 3) % 7).astype('timedelta64[D]')
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime
+
+from src.atomic import atomic_path
+
+MANIFEST_FILE = 'manifest.json'
+
+
+class RegistryError(Exception):
+    pass
+
+
+# File-backed model registry shared by the DAG (publisher) and the API (reader):
+#
+#   root/versions/<version>/     model.pkl, metrics.json, ... and manifest.json (sha256 per file)
+#   root/CURRENT                 name of the version being served
+#
+# A version is staged under root/_staging/, then renamed into versions/ in one step, and only
+# then does CURRENT move to it (written to a temporary file and os.replace'd). A reader that
+# resolves CURRENT therefore always finds a complete, immutable version directory.
+class ModelRegistry:
+    VERSIONS = 'versions'
+    CURRENT = 'CURRENT'
+
+    def __init__(self, root):
+        self.root = root
+
+    def version_path(self, version):
+        return os.path.join(self.root, self.VERSIONS, version)
+
+    def path(self, version, name):
+        return os.path.join(self.version_path(version), name)
+
+    def current_version(self):
+        try:
+            with open(os.path.join(self.root, self.CURRENT)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def versions(self):
+        folder = os.path.join(self.root, self.VERSIONS)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(os.listdir(folder))
+
+    def manifest(self, version):
+        with open(self.path(version, MANIFEST_FILE)) as f:
+            return json.load(f)
+
+    # Publishes a new version. files maps artifact names to a source file path or to bytes;
+    # metadata is stored in the manifest. Returns the version name.
+    def publish(self, files, metadata=None, make_current=True):
+        # Sortable by publication time (microseconds), unique across publishers
+        version = datetime.now().strftime('%Y%m%dT%H%M%S%f') + '-' + uuid.uuid4().hex[:8]
+        staging = os.path.join(self.root, '_staging', version)
+        os.makedirs(staging)
+        try:
+            checksums = {}
+            for name, source in files.items():
+                target = os.path.join(staging, name)
+                if isinstance(source, (bytes, bytearray)):
+                    with open(target, 'wb') as f:
+                        f.write(source)
+                else:
+                    shutil.copyfile(source, target)
+                checksums[name] = _sha256(target)
+            manifest = {'version': version, 'created_at': time.time(), 'files': checksums, 'metadata': metadata or {}}
+            with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+                json.dump(manifest, f, indent=4)
+            _fsync_tree(staging)
+
+            os.makedirs(os.path.join(self.root, self.VERSIONS), exist_ok=True)
+            os.rename(staging, self.version_path(version))
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        if make_current:
+            self.set_current(version)
+        print(f"Published model version {version} to {self.root}")
+        return version
+
+    # Points CURRENT to an existing version (also used to roll back)
+    def set_current(self, version):
+        if not os.path.isdir(self.version_path(version)):
+            raise RegistryError(f"Unknown model version: {version}")
+        with atomic_path(os.path.join(self.root, self.CURRENT)) as tmp_path, open(tmp_path, 'w') as f:
+            f.write(version + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    # Checks that every artifact of a version matches its manifest checksum
+    def verify(self, version):
+        manifest = self.manifest(version)
+        for name, checksum in manifest['files'].items():
+            path = self.path(version, name)
+            if not os.path.exists(path):
+                raise RegistryError(f"{version}: missing artifact {name}")
+            if _sha256(path) != checksum:
+                raise RegistryError(f"{version}: checksum mismatch for {name}")
+        return manifest
+
+    # Removes old versions, keeping the `keep` most recent ones and the current one
+    def prune(self, keep=5):
+        current = self.current_version()
+        versions = self.versions()
+        removed = [version for version in versions[:-keep] if version != current] if keep else []
+        for version in removed:
+            shutil.rmtree(self.version_path(version), ignore_errors=True)
+        return removed
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _fsync_tree(folder):
+    for name in os.listdir(folder):
+        with open(os.path.join(folder, name), 'rb') as f:
+            os.fsync(f.fileno())
@@ -0,0 +1,140 @@
+import json
+import mmap
+import struct
+
+import numpy as np
+
+from src.atomic import atomic_path
+
+# Files written by the DAG for the API: the series of a model version (published in the registry
+# with its model) and the per-series forecasts of forecast_all_series (next to forecasts.parquet)
+MODEL_SERIES_FILE = 'series.bin'
+FORECAST_SERIES_FILE = 'forecasts.bin'
+
+MAGIC = b'GAZSER\x00\x01'
+FORMAT_VERSION = 1
+# The values start on a 64-byte boundary (cache line, and a multiple of the float32 size)
+ALIGNMENT = 64
+_LENGTH = struct.Struct('<Q')
+
+
+# Daily series stored as one block of contiguous float32 values, laid out to be memory-mapped:
+#
+#   magic (8 bytes) | index size (uint64) | JSON index | padding | float32 values (little-endian)
+#
+# Each series covers every day from its first to its last date (days without a value are NaN), so
+# the index only records its key, its first day (days since 1970-01-01), and its offset and length
+# in the values, and a date range is found by arithmetic. API workers that map the same file read
+# the values from the same page-cache pages instead of each holding its own parsed copy.
+class SeriesStore:
+    def __init__(self, keys, index, values, metadata=None):
+        self.keys = tuple(keys)
+        self.metadata = metadata or {}
+        self.values = values
+        self._positions = {tuple(key): (start, offset, length)
+                           for key, start, offset, length in zip(index['key'], index['start'], index['offset'],
+                                                                 index['length'])}
+        end = max((offset + length for _, offset, length in self._positions.values()), default=0)
+        if end > len(values):
+            raise ValueError(f"series store truncated: {len(values)} values, the index needs {end}")
+
+    # Read-only store over the file's pages: nothing is read until a series is accessed
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a series store")
+        (size,) = _LENGTH.unpack_from(buffer, len(MAGIC))
+        start = len(MAGIC) + _LENGTH.size
+        index = json.loads(buffer[start:start + size])
+        if index['format'] != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported series store format {index['format']}")
+        data = _aligned(start + size)
+        values = np.frombuffer(buffer, dtype='<f4', offset=data, count=(len(buffer) - data) // 4)
+        return cls(index['keys'], index['series'], values, index['metadata'])
+
+    # Same store held in memory, from (key, dates, values) triples
+    @classmethod
+    def from_series(cls, series, keys, metadata=None):
+        index, chunks = _layout(series)
+        values = np.concatenate(chunks) if chunks else np.array([], dtype=np.float32)
+        return cls(keys, index, values, metadata)
+
+    def __contains__(self, key):
+        return tuple(key) in self._positions
+
+    def __iter__(self):
+        return iter(self._positions)
+
+    def __len__(self):
+        return len(self._positions)
+
+    # First day (datetime64[D]) and values of a series; the values are a view, not a copy
+    def series(self, key):
+        start, offset, length = self._positions[tuple(key)]
+        return np.datetime64(start, 'D'), self.values[offset:offset + length]
+
+    # Dates (datetime64[D]) and values of a series between start and end (inclusive, None for unbounded)
+    def get(self, key, start=None, end=None):
+        first, offset, length = self._positions[tuple(key)]
+        left = 0 if start is None else min(max(_epoch_day(start) - first, 0), length)
+        right = length if end is None else min(max(_epoch_day(end) - first + 1, left), length)
+        dates = np.arange(first + left, first + right).astype('datetime64[D]')
+        return dates, self.values[offset + left:offset + right]
+
+
+# Writes the (key, dates, values) triples as a series store, atomically. keys names the fields of
+# each key; metadata (JSON) is stored in the index.
+def write_series(path, series, keys, metadata=None):
+    index, chunks = _layout(series)
+    header = json.dumps({'format': FORMAT_VERSION, 'keys': list(keys), 'metadata': metadata or {}, 'series': index},
+                        separators=(',', ':')).encode('utf-8')
+    prefix = MAGIC + _LENGTH.pack(len(header)) + header
+    with atomic_path(path) as tmp_path, open(tmp_path, 'wb') as f:
+        f.write(prefix + b' ' * (_aligned(len(prefix)) - len(prefix)))
+        for chunk in chunks:
+            f.write(chunk.astype('<f4', copy=False).tobytes())
+
+
+# (key, dates, values) triples of a long table: one series per distinct combination of key_columns
+def group_series(df, key_columns, date_column, value_column):
+    dates = df[date_column].to_numpy()
+    values = df[value_column].to_numpy()
+    groups = df.groupby(list(key_columns), sort=True, observed=True).indices
+    return [(key if isinstance(key, tuple) else (key,), dates[rows], values[rows]) for key, rows in groups.items()]
+
+
+# First day and dense float32 values of a series, NaN on the days it has no value
+def daily_values(dates, values):
+    days = np.asarray(dates).astype('datetime64[D]').astype(np.int64)
+    values = np.asarray(values, dtype=np.float32)
+    if not len(days):
+        return 0, values[:0]
+    first = int(days.min())
+    dense = np.full(int(days.max()) - first + 1, np.nan, dtype=np.float32)
+    dense[days - first] = values
+    return first, dense
+
+
+def _layout(series):
+    index = {'key': [], 'start': [], 'offset': [], 'length': []}
+    chunks = []
+    offset = 0
+    for key, dates, values in series:
+        first, dense = daily_values(dates, values)
+        index['key'].append([str(part) for part in key])
+        index['start'].append(first)
+        index['offset'].append(offset)
+        index['length'].append(len(dense))
+        chunks.append(dense)
+        offset += len(dense)
+    return index, chunks
+
+
+def _aligned(size):
+    return size + -size % ALIGNMENT
+
+
+def _epoch_day(value):
+    return int(np.datetime64(value, 'D').astype(np.int64))
@@ -0,0 +1,241 @@
+import hashlib
+import heapq
+import os
+import shutil
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.atomic import atomic_path
+from src.forecasting import (FORECASTS_FILE, METRICS_FILE, SERIES_KEYS, ForecastEngine, _write_atomic, build_series,
+                             forecasts_table, metrics_table, write_forecast_series)
+from src.gaz_data import GazsData
+from src.gaz_data_parquet import ALL_ZONES_STORE_FOLDER, PARIS_ZAS, STORE_FOLDER
+from src.manifest import Manifest
+from src.parquet_store import PartitionedParquetStore, _arrow_schema
+from src.pipeline import GazPipeline
+from src.query import ObservationQuery
+from src.series_store import FORECAST_SERIES_FILE
+
+# Étapes du pipeline découpées en tâches indépendantes pour le mapping dynamique d'Airflow
+# (mode 'mapped' de dags/dag.py) : chaque étape est un plan (liste de shards), une fonction
+# exécutée par shard sur n'importe quel worker Celery, puis un commit unique (reduce).
+# Arguments et valeurs de retour sont sérialisables en JSON : ils transitent par les XComs.
+# Les shards n'écrivent que dans un dossier de staging, sous un nom déterministe : un shard
+# relancé par Airflow réécrit ses propres fichiers, sans toucher à ceux des autres.
+
+SHARDS_FOLDER = '_shards'
+
+
+# Répartit des éléments en n listes non vides, à tour de rôle
+def split(items, n):
+    n = max(1, min(n, len(items)))
+    return [items[i::n] for i in range(n)] if items else []
+
+
+# Identifiant stable d'un shard, dérivé de son contenu
+def shard_id(names):
+    return hashlib.sha1('\n'.join(sorted(names)).encode('utf-8')).hexdigest()[:16]
+
+
+def new_staging(output_folder):
+    return os.path.join(output_folder, SHARDS_FOLDER, time.strftime('%Y%m%d_%H%M%S') + '_' + uuid.uuid4().hex[:8])
+
+
+#################################################### Téléchargement ####################################################
+
+# Lit l'index LCSQA une seule fois et répartit les fichiers. Chaque plan renvoie les arguments
+# positionnels de ses shards (en tête de signature, le reste est fixé par la tâche), ici
+# [[[[url, nom], ...]], ...]
+def plan_downloads(download_folder, n_shards, target_year="2024"):
+    jobs = GazsData(download_folder).list_csv_files(target_year)
+    print(f"{len(jobs)} fichiers listés, répartis sur {min(n_shards, len(jobs))} shard(s)")
+    return [[[list(job) for job in shard]] for shard in split(sorted(jobs, key=lambda job: job[1]), n_shards)]
+
+
+# Un échec de téléchargement fait échouer le shard : Airflow ne relance que ses fichiers,
+# et ceux déjà complets sont ignorés grâce au manifeste.
+def download_shard(jobs, download_folder, manifest_path, max_workers=8):
+    os.makedirs(download_folder, exist_ok=True)
+    with Manifest(manifest_path) as manifest:
+        summary = GazsData(download_folder, manifest=manifest).download_csv_files(
+            max_workers=max_workers, jobs=[tuple(job) for job in jobs])
+    if summary['failed']:
+        raise RuntimeError(f"{len(summary['failed'])} téléchargement(s) en échec : {sorted(summary['failed'])}")
+    return {status: len(summary[status]) for status in ('downloaded', 'resumed', 'skipped')}
+
+
+###################################################### Traitement ######################################################
+
+# Fichiers en attente (état 'downloaded' du manifeste) regroupés en un lot de taille équilibrée par
+# shard (davantage seulement si un lot dépasserait batch_bytes, pour borner la mémoire d'un shard).
+# Tous les shards partagent le même dossier de staging et le même processing_date, comme les
+# processus de GazPipeline.run : [[noms, staging, processing_date], ...]
+def plan_processing(input_folder, output_folder_parquet, manifest_path, n_shards, batch_bytes=32 * 1024 * 1024):
+    os.makedirs(output_folder_parquet, exist_ok=True)
+    with Manifest(manifest_path) as manifest:
+        pipeline = GazPipeline(input_folder, output_folder_parquet, manifest=manifest, all_zones=True)
+        pipeline.parquet.import_legacy_output()
+        file_names = pipeline.pending_files()
+        batches = pipeline.processor.make_batches(file_names, batch_bytes, n_shards, batches_per_worker=1) if file_names else []
+    staging = new_staging(output_folder_parquet)
+    print(f"{len(file_names)} fichiers à traiter en {len(batches)} lot(s)")
+    return [[batch, staging, pipeline.parquet.current_timestamp] for batch in batches]
+
+
+# Lit et nettoie un lot, puis écrit les lignes de toutes les zones par mois sous
+# <staging>/<mois>/<shard>.parquet. Les erreurs propres à un fichier (CSV illisible, ...) sont
+# rapportées au commit, comme dans GazPipeline.run : relancer le shard n'y changerait rien.
+def process_shard(file_names, staging, processing_date, input_folder, output_folder_parquet):
+    pipeline = GazPipeline(input_folder, output_folder_parquet, all_zones=True)
+    pipeline.parquet.current_timestamp = processing_date
+    store = pipeline.all_zones_store
+    name = shard_id(file_names)
+    result = {'staging': staging, 'stored': [], 'skipped': [], 'failed': {}, 'rows': 0, 'months': []}
+
+    frames = []
+    for file_name, status, rows, error in pipeline.process_batch(file_names):
+        if status == 'failed':
+            result['failed'][file_name] = error
+            continue
+        result[status].append(file_name)
+        if rows is not None:
+            frames.append(rows)
+
+    if frames:
+        rows = store.normalize(pd.concat(frames, ignore_index=True))
+        # Mêmes types que les fichiers de staging du StoreWriter (texte, float64, timestamp ns)
+        schema = _arrow_schema(rows)
+        for month, month_rows in rows.groupby(store.months(rows), sort=True):
+            folder = os.path.join(staging, month)
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, f'{name}.parquet')
+            with atomic_path(path) as tmp_path:
+                pq.write_table(pa.Table.from_pandas(month_rows, schema=schema, preserve_index=False), tmp_path,
+                               compression=store.compression, row_group_size=store.row_group_size)
+            result['months'].append(month)
+        result['rows'] = len(rows)
+    print(f"shard {name} : {len(result['stored'])} fichiers, {result['rows']} lignes, "
+          f"{len(result['failed'])} en échec, mois {', '.join(result['months'])}")
+    return result
+
+
+# Une partition par (store, mois) touché par au moins un shard : [[store, mois, staging], ...]
+def plan_partitions(shard_results):
+    partitions = sorted({(month, result['staging']) for result in shard_results or [] for month in result['months']})
+    return [[store_folder, month, staging] for month, staging in partitions
+            for store_folder in (ALL_ZONES_STORE_FOLDER, STORE_FOLDER)]
+
+
+# Fusionne les fichiers des shards d'un mois dans la partition du store (ZAG PARIS seulement pour
+# ZAG_PARIS_dataset). Chaque partition est un commit indépendant du store : deux tâches ne
+# réécrivent jamais la même partition, et un rejeu est idempotent grâce au dédoublonnage par clé.
+def merge_partition(store_folder, month, staging, output_folder_parquet):
+    folder = os.path.join(staging, month)
+    paths = sorted(os.path.join(folder, name) for name in os.listdir(folder) if name.endswith('.parquet'))
+    filters = [('zas', '==', PARIS_ZAS)] if store_folder == STORE_FOLDER else None
+    rows = pd.concat([pd.read_parquet(path, filters=filters) for path in paths], ignore_index=True)
+    store = PartitionedParquetStore(os.path.join(output_folder_parquet, store_folder))
+    stats = store.append(rows)
+    print(f"{store_folder} {month} : {len(rows)} nouvelles lignes, {sum(stat['rows'] for stat in stats)} dans la partition")
+    return {'store': store_folder, 'month': month, 'rows': len(rows), 'bytes': sum(stat['bytes'] for stat in stats)}
+
+
+# Reduce : les fichiers ne passent à 'stored' qu'une fois toutes les partitions écrites,
+# puis le staging du run est supprimé. Lève une erreur si un fichier a échoué.
+def commit_processing(manifest_path, shard_results, partition_results):
+    shard_results, partition_results = list(shard_results or []), list(partition_results or [])
+    stored = [name for result in shard_results for name in result['stored']]
+    skipped = [name for result in shard_results for name in result['skipped']]
+    failed = {name: error for result in shard_results for name, error in result['failed'].items()}
+    if manifest_path is not None:
+        with Manifest(manifest_path) as manifest:
+            manifest.mark(stored, Manifest.STORED)
+            manifest.mark(skipped, Manifest.SKIPPED)
+    for staging in {result['staging'] for result in shard_results}:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    paris_rows = sum(result['rows'] for result in partition_results if result['store'] == STORE_FOLDER)
+    written = sum(result['bytes'] for result in partition_results)
+    print(f"{len(stored)} fichiers stockés, {len(skipped)} ignorés, {len(failed)} en échec "
+          f"({paris_rows} lignes ZAG PARIS, {len(partition_results)} partitions, {written / 2**20:.2f} Mo écrits) "
+          f"par {len(shard_results)} shard(s)")
+    for file_name, error in failed.items():
+        print(f"échec du traitement de {file_name} : {error}")
+    if failed:
+        raise RuntimeError(f"{len(failed)} fichier(s) en échec : {sorted(failed)}")
+    return {'stored': len(stored), 'skipped': len(skipped), 'partitions': len(partition_results)}
+
+
+###################################################### Prévisions ######################################################
+
+# Séries (zas, polluant) du store réparties en n shards de charge équilibrée (nombre
+# d'observations, les plus longues d'abord) : [[[[zas, polluant], ...], staging], ...]
+def plan_series(store_root, output_folder, n_shards, min_obs=30):
+    # Observations par série, lues dans les agrégats journaliers du store
+    daily = ObservationQuery(store_root).daily(by=SERIES_KEYS)
+    if daily.empty:
+        return []
+    counts = daily.groupby(SERIES_KEYS, sort=True)['count'].sum()
+    counts = counts[counts >= min_obs].sort_values(ascending=False, kind='stable')
+    n_shards = max(1, min(n_shards, len(counts)))
+    loads = [(0, shard) for shard in range(n_shards)]
+    shards = [[] for _ in range(n_shards)]
+    for key, n_obs in counts.items():
+        load, shard = heapq.heappop(loads)
+        shards[shard].append(list(key))
+        heapq.heappush(loads, (load + int(n_obs), shard))
+    staging = new_staging(output_folder)
+    print(f"{len(counts)} séries réparties sur {n_shards} shard(s)")
+    return [[keys, staging] for keys in shards if keys]
+
+
+# Ajuste les séries d'un shard dans le processus de la tâche : le parallélisme vient des slots
+# Celery, un pool par tâche surchargerait les workers qui exécutent plusieurs shards.
+def fit_series_shard(keys, staging, store_root, order=(4, 2, 2), steps=7, timeout=120, min_obs=30):
+    wanted = {tuple(key) for key in keys}
+    series = build_series(PartitionedParquetStore(store_root), zas=sorted({key[0] for key in wanted}),
+                          polluant=sorted({key[1] for key in wanted}), min_obs=min_obs)
+    series = {key: ts for key, ts in series.items() if key in wanted}
+    engine = ForecastEngine(order=order, steps=steps, timeout=timeout, workers=1, min_obs=min_obs)
+    results = engine.fit_all(series)
+
+    name = shard_id(' / '.join(key) for key in wanted)
+    paths = {'forecasts': os.path.join(staging, 'forecasts', f'{name}.parquet'),
+             'metrics': os.path.join(staging, 'metrics', f'{name}.parquet')}
+    for path in paths.values():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    _write_atomic(forecasts_table(results, steps), paths['forecasts'])
+    _write_atomic(metrics_table(results), paths['metrics'])
+    statuses = pd.Series([result['status'] for result in results], dtype=object).value_counts().to_dict()
+    print(f"shard {name} : {len(results)} séries ajustées {statuses}")
+    return dict(paths, staging=staging, series=len(results), statuses=statuses)
+
+
+# Reduce : concatène les tables des shards en forecasts.parquet et metrics.parquet (et sa copie
+# forecasts.bin servie par l'API), remplacés atomiquement comme par ForecastEngine.run, puis supprime le staging.
+def commit_forecasts(output_folder, shard_results, steps=7):
+    shard_results = list(shard_results or [])
+    os.makedirs(output_folder, exist_ok=True)
+    if shard_results:
+        forecasts = pa.concat_tables([pq.read_table(result['forecasts']) for result in shard_results])
+        # Colonne 'error' vide (null) dans certains shards : concaténée côté pandas
+        metrics = pa.Table.from_pandas(pd.concat([pd.read_parquet(result['metrics']) for result in shard_results],
+                                                 ignore_index=True), preserve_index=False)
+    else:
+        forecasts, metrics = forecasts_table([], steps), metrics_table([])
+    _write_atomic(forecasts, os.path.join(output_folder, FORECASTS_FILE))
+    _write_atomic(metrics, os.path.join(output_folder, METRICS_FILE))
+    write_forecast_series(forecasts, os.path.join(output_folder, FORECAST_SERIES_FILE))
+    for staging in {result['staging'] for result in shard_results}:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    statuses = {}
+    for result in shard_results:
+        for status, n in result['statuses'].items():
+            statuses[status] = statuses.get(status, 0) + n
+    print(f"{metrics.num_rows} séries ajustées par {len(shard_results)} shard(s) : {statuses}")
+    return {'series': metrics.num_rows, 'statuses': statuses}
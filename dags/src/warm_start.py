@@ -0,0 +1,148 @@
+import json
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.arima.model import ARIMA
+
+from src.atomic import atomic_path
+
+# Holdout used to track the model quality between full refits (same window as run_model_and_forecast)
+HOLDOUT_DAYS = 7
+
+
+# Decides between a warm update (new days appended to the saved results, parameters kept)
+# and a full refit. A full refit happens when there is no usable saved model, when the last
+# one is refit_every_days old, or when the holdout RMSE of the updated model has drifted more
+# than drift_threshold (relative) above the RMSE measured at the last full refit.
+# The last revision_days days of the saved model may differ from the new series without a
+# refit: each day's file rewrites the previous day's last hour and the real-time feed rewrites
+# the current day, so the tail of the history is revised on every run.
+class RefitPolicy:
+    def __init__(self, refit_every_days=7, drift_threshold=0.5, revision_days=3):
+        self.refit_every_days = refit_every_days
+        self.drift_threshold = drift_threshold
+        self.revision_days = revision_days
+
+    # Checks made before touching the model. Returns a reason for a full refit, or None.
+    def refit_reason(self, meta, order, now):
+        if meta is None:
+            return 'no previous model'
+        if tuple(meta['order']) != tuple(order):
+            return f"order changed from {tuple(meta['order'])} to {tuple(order)}"
+        age_days = (now - meta['last_full_fit']) / 86400
+        if age_days >= self.refit_every_days:
+            return f"scheduled refit ({age_days:.1f} days since the last full fit)"
+        return None
+
+    # Check made after the warm update. Returns a reason for a full refit, or None.
+    def drift_reason(self, meta, rmse):
+        baseline = meta.get('baseline_rmse')
+        if baseline is None or not np.isfinite(baseline) or baseline == 0 or not np.isfinite(rmse):
+            return None
+        drift = rmse / baseline - 1
+        if drift > self.drift_threshold:
+            return f"holdout RMSE drifted by {drift:+.0%} ({baseline:.3f} -> {rmse:.3f})"
+        return None
+
+
+def meta_path_for(model_path):
+    return os.path.splitext(model_path)[0] + '_meta.json'
+
+
+def decisions_path_for(model_path):
+    return os.path.splitext(model_path)[0] + '_decisions.jsonl'
+
+
+def load_meta(model_path):
+    meta_path = meta_path_for(model_path)
+    if not (os.path.exists(model_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+# RMSE of the in-sample one-step predictions over the last holdout days
+def holdout_rmse(model_fit, ts, holdout=HOLDOUT_DAYS):
+    predicted = model_fit.predict(start=len(ts) - holdout, end=len(ts) - 1).to_numpy()
+    errors = ts.to_numpy()[-holdout:] - predicted
+    errors = errors[np.isfinite(errors)]
+    return float(np.sqrt(np.mean(errors ** 2))) if errors.size else float('nan')
+
+
+# Returns the fitted results for ts, either by appending the days after the saved model's
+# last date (refit=False keeps its parameters) or by a full refit, and the logged decision.
+def fit_or_update(ts, model_path, order=(4, 2, 2), policy=None, now=None):
+    policy = policy or RefitPolicy()
+    now = now or time.time()
+    start = time.perf_counter()
+    meta = load_meta(model_path)
+    decision = {'at': now, 'last_date': ts.index[-1].strftime('%Y-%m-%d'), 'n_obs': len(ts)}
+
+    reason = policy.refit_reason(meta, order, now)
+    model_fit = None
+    if reason is None:
+        model_fit, reason, appended, revised = _warm_update(ts, model_path, meta, policy.revision_days)
+        decision.update(appended_days=appended, revised_days=revised)
+    if model_fit is not None:
+        rmse = holdout_rmse(model_fit, ts)
+        reason = policy.drift_reason(meta, rmse)
+        if reason is None:
+            decision.update(action='update', reason='parameters kept', holdout_rmse=rmse)
+            meta.update(last_date=decision['last_date'], n_obs=len(ts), updates_since_refit=meta['updates_since_refit'] + 1)
+        else:
+            model_fit = None
+
+    if model_fit is None:
+        model_fit = ARIMA(ts, order=order).fit()
+        rmse = holdout_rmse(model_fit, ts)
+        decision.update(action='refit', reason=reason, holdout_rmse=rmse)
+        meta = {'order': list(order), 'last_full_fit': now, 'last_date': decision['last_date'], 'n_obs': len(ts),
+                'baseline_rmse': rmse, 'updates_since_refit': 0}
+
+    decision['seconds'] = time.perf_counter() - start
+    save(model_fit, model_path, meta, decision)
+    print(f"Model {decision['action']} ({decision['reason']}) in {decision['seconds']:.2f}s, "
+          f"holdout RMSE {decision['holdout_rmse']:.3f}")
+    return model_fit, decision
+
+
+# Appends the new days to the saved results. Returns (results, None, appended days, revised
+# days) or (None, reason for a full refit, 0, 0) when the saved model cannot be extended.
+def _warm_update(ts, model_path, meta, revision_days=0):
+    try:
+        previous = joblib.load(model_path)
+    except Exception as e:
+        return None, f"saved model unreadable ({type(e).__name__})", 0, 0
+
+    last_date = pd.Timestamp(meta['last_date'])
+    known, new = ts[ts.index <= last_date], ts[ts.index > last_date]
+    previous_endog = np.asarray(previous.model.endog).ravel()
+    if len(known) != len(previous_endog):
+        return None, 'history changed since the last fit', 0, 0
+    # Days older than the revision window must be unchanged (late corrections rewrite history)
+    stable = max(len(known) - revision_days, 0)
+    if not np.allclose(known.to_numpy()[:stable], previous_endog[:stable], equal_nan=True):
+        return None, 'history changed since the last fit', 0, 0
+    revised = int((~np.isclose(known.to_numpy()[stable:], previous_endog[stable:], equal_nan=True)).sum())
+    if revised:
+        # Revised tail: the whole series is filtered again with the saved parameters
+        return previous.apply(ts, refit=False), None, len(new), revised
+    if new.empty:
+        return previous, None, 0, 0
+    return previous.append(new, refit=False), None, len(new), 0
+
+
+# Writes the results, their metadata and the decision log; the model file is replaced atomically
+def save(model_fit, model_path, meta, decision):
+    folder = os.path.dirname(model_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with atomic_path(model_path) as tmp_path:
+        joblib.dump(model_fit, tmp_path)
+    with open(meta_path_for(model_path), 'w') as f:
+        json.dump(meta, f, indent=4)
+    with open(decisions_path_for(model_path), 'a') as f:
+        f.write(json.dumps(decision) + '\n')
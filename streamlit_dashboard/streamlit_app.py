@@ -24,6 +24,36 @@ def login_user():
             else:
                 st.error("Invalid username or password")
 
+API_URL = "http://fastapi:8000"
+
+# API responses are cached for 5 minutes: page interactions reuse them instead of refetching
+# Metrics and forecast chart only: the history is fetched from /history/ (fetch_history)
+@st.cache_data(ttl=300)
+def fetch_forecast(option):
+    response = requests.get(f"{API_URL}/forecast/", params={"option": option})
+    response.raise_for_status()
+    return response.json()
+
+# History filtered and downsampled by the API, returned as columns (dates, values) per type
+@st.cache_data(ttl=300)
+def fetch_history(start, points=500):
+    response = requests.get(f"{API_URL}/history/", params={"start": start.isoformat(), "points": points,
+                                                           "types": "historical,historical_forecast"})
+    response.raise_for_status()
+    series = response.json()["series"]
+    return {row_type: pd.DataFrame({"date": pd.to_datetime(columns["dates"]), "value": columns["values"]})
+            for row_type, columns in series.items()}
+
+# Observed concentrations aggregated by the API from the store's daily rollups, one column per field
+@st.cache_data(ttl=300)
+def fetch_observations(start, zas, freq="W"):
+    response = requests.get(f"{API_URL}/observations/", params={"start": start.isoformat(), "zas": zas, "freq": freq,
+                                                                "by": "polluant"})
+    response.raise_for_status()
+    df = pd.DataFrame(response.json()["observations"])
+    df["date"] = pd.to_datetime(df["date"])
+    return df
+
 # Function to display the air quality forecast
 def display_forecast():
     st.title("Air Quality Forecast")
@@ -42,67 +72,78 @@ def display_forecast():
     # Button to get forecast
     if st.button("Get Forecast"):
         # Fetch forecast data from FastAPI
-        response = requests.get(f"http://fastapi:8000/forecast/?option={options[selected_option]}")
-
-        if response.status_code == 200:
-            data = response.json()
+        try:
+            data = fetch_forecast(options[selected_option])
+        except requests.RequestException:
+            st.error("Failed to fetch forecast data")
+            return
 
-            # Display Metrics
-            st.subheader("Metrics")
-            if "metrics" in data:
-                metrics_df = pd.DataFrame([data["metrics"][0]["metrics"]])
-                st.table(metrics_df)  # Display metrics in a table format
-            else:
-                st.error("Metrics not found in the response")
-
-
-            # Check if there is forecast_chart data
-            st.subheader("Forecast Chart")
-            if "forecast_chart" in data:
-                forecast_chart = data["forecast_chart"]
-                fig = go.Figure(data=forecast_chart["data"], layout=forecast_chart["layout"])
-
-                # Assuming additional forecast and historical data are provided in the metrics
-                if "metrics" in data and "data" in data["metrics"][0]:
-                    all_data = data["metrics"][0]["data"]
-
-                    # Convert to DataFrame for easier manipulation
-                    df = pd.DataFrame(all_data)
-                    df['date'] = pd.to_datetime(df['date'])  # Ensure 'date' is datetime type
-
-                    # Filter data to only show from the last month
-                    one_month_ago = datetime.now() - timedelta(days=30)
-                    df = df[df['date'] >= one_month_ago]
-
-                    # Separate historical and forecast data after filtering
-                    historical_df = df[df['type'] == 'historical']
-                    forecast_historical_df = df[df['type'] == 'historical_forecast']
-
-                    # Plot historical data
-                    fig.add_trace(go.Scatter(
-                        x=historical_df['date'],
-                        y=historical_df['value'],
-                        mode='lines+markers',
-                        name='Historical',
-                        marker=dict(color='red')
-                    ))
-                    fig.update_layout(title='Air Quality Forecast with Historical Data')
-                    # Plot historical data
-                    fig.add_trace(go.Scatter(
-                        x=forecast_historical_df['date'],
-                        y=forecast_historical_df['value'],
-                        mode='lines+markers',
-                        name='historical_forecast',
-                        marker=dict(color='green')
-                    ))
-                    fig.update_layout(title='Air Quality Forecast with Historical Data')
-
-                # Display the updated chart
-                st.plotly_chart(fig)
-            else:
-                st.error("Forecast chart not found in the response")
+        # Display Metrics
+        st.subheader("Metrics")
+        if "metrics" in data:
+            metrics_df = pd.DataFrame([data["metrics"][0]["metrics"]])
+            st.table(metrics_df)  # Display metrics in a table format
         else:
-            st.error("Failed to fetch forecast data")
+            st.error("Metrics not found in the response")
+
+        # Check if there is forecast_chart data
+        st.subheader("Forecast Chart")
+        if "forecast_chart" in data:
+            forecast_chart = data["forecast_chart"]
+            fig = go.Figure(data=forecast_chart["data"], layout=forecast_chart["layout"])
+
+            # Last month of history, filtered on the server
+            one_month_ago = (datetime.now() - timedelta(days=30)).date()
+            try:
+                history = fetch_history(one_month_ago)
+            except requests.RequestException:
+                history = None
+                st.warning("Historical data unavailable")
+
+            if history is not None:
+                historical_df = history["historical"]
+                forecast_historical_df = history["historical_forecast"]
+
+                # Plot historical data
+                fig.add_trace(go.Scatter(
+                    x=historical_df['date'],
+                    y=historical_df['value'],
+                    mode='lines+markers',
+                    name='Historical',
+                    marker=dict(color='red')
+                ))
+                # Plot historical data
+                fig.add_trace(go.Scatter(
+                    x=forecast_historical_df['date'],
+                    y=forecast_historical_df['value'],
+                    mode='lines+markers',
+                    name='historical_forecast',
+                    marker=dict(color='green')
+                ))
+                fig.update_layout(title='Air Quality Forecast with Historical Data')
+
+            # Display the updated chart
+            st.plotly_chart(fig)
+        else:
+            st.error("Forecast chart not found in the response")
+
+# Weekly or monthly means per pollutant over the last year
+def display_observations():
+    st.subheader("Observed Concentrations (ZAG PARIS)")
+    frequencies = {"Weekly": "W", "Monthly": "M"}
+    frequency = st.radio("Aggregation:", list(frequencies.keys()), horizontal=True)
+    one_year_ago = (datetime.now() - timedelta(days=365)).date()
+    try:
+        observations = fetch_observations(one_year_ago, "ZAG PARIS", frequencies[frequency])
+    except requests.RequestException:
+        st.warning("Observations unavailable")
+        return
+
+    fig = go.Figure()
+    for polluant, group in observations.groupby("polluant"):
+        fig.add_trace(go.Scatter(x=group["date"], y=group["mean"], mode="lines+markers", name=polluant))
+    fig.update_layout(title=f"{frequency} mean concentration per pollutant")
+    st.plotly_chart(fig)
 
 # Main function to control the app flow
 def main():
@@ -111,6 +152,7 @@ def main():
 
     if st.session_state['logged_in']:
         display_forecast()
+        display_observations()
     else:
         login_user()
 